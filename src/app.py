@@ -15,52 +15,91 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import os
 from flask import Flask
+from jinja2 import FileSystemBytecodeCache
 from models import db, User, create_tables
 from config import Config
+from services import search, metrics, user_cache, covers, versions, jobs, isbn_mirror
 from flask_login import LoginManager, UserMixin, login_required, current_user
 
-app = Flask(__name__)
-app.config.from_object(Config)
-
-# Initialize database
-db.init_app(app)
-
 # Init flask_login
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Log in to access this page.'
 
-# User loader
+# User loader, served from a short-lived cache so most requests skip the users table
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.query(User).get(user_id)
+    return user_cache.users.get(user_id)
+
+
+def create_app(config=Config):
+    """Build the app; `flask` finds this, and wsgi.py serves what it returns"""
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    # SQLite doesn't use a queue pool, so it takes no pool sizes; only pre-ping and recycle apply
+    if (app.config['SQLALCHEMY_DATABASE_URI'] or '').startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            key: value for key, value in app.config['SQLALCHEMY_ENGINE_OPTIONS'].items()
+            if key in ('pool_pre_ping', 'pool_recycle')
+        }
+
+    # Initialize database
+    db.init_app(app)
+    login_manager.init_app(app)
+
+    # Templates compiled by an earlier run load from disk instead of being parsed again
+    if app.config['TEMPLATE_CACHE_DIR']:
+        os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+
+    user_cache.users.maxsize = app.config['USER_CACHE_SIZE']
+    user_cache.users.ttl = app.config['USER_CACHE_TTL']
+    isbn_mirror.mirror.path = app.config['ISBN_MIRROR']
+
+    # Register blueprints
+    from routes.main import main_bp
+    from routes.books import books_bp
+    from routes.authors import authors_bp
+    from routes.tags import tags_bp
+    from routes.locations import locations_bp
+    from routes.users import users_bp
+    from routes.api import api_bp
+    from routes.auth import auth_bp
+
+    app.register_blueprint(main_bp)
+    app.register_blueprint(books_bp, url_prefix='/books')
+    app.register_blueprint(authors_bp, url_prefix='/authors')
+    app.register_blueprint(tags_bp, url_prefix='/tags')
+    app.register_blueprint(locations_bp, url_prefix='/locations')
+    app.register_blueprint(users_bp, url_prefix='/users')
+    app.register_blueprint(api_bp, url_prefix='/api')
+    app.register_blueprint(auth_bp)
+
+    # Per-request timings: Server-Timing header and /metrics
+    metrics.init_app(app)
+
+    # Covers stored on this box instead of hotlinked
+    covers.init_app(app)
 
-@app.context_processor
-def inject_current_user():
-    return dict(current_user=current_user)
+    # Background jobs, such as filling in new works' missing details
+    jobs.init_app(app)
 
+    # Register CLI commands
+    from commands import register_commands
+    register_commands(app)
 
-# Register blueprints
-from routes.main import main_bp
-from routes.books import books_bp
-from routes.authors import authors_bp
-from routes.tags import tags_bp
-from routes.locations import locations_bp
-from routes.users import users_bp
-from routes.api import api_bp
-from routes.auth import auth_bp
+    # Create any tables that don't exist yet
+    with app.app_context():
+        create_tables(db.engine)
+        search.ensure_index(db.engine)
+        versions.ensure(db.engine)
 
-app.register_blueprint(main_bp)
-app.register_blueprint(books_bp, url_prefix='/books')
-app.register_blueprint(authors_bp, url_prefix='/authors')
-app.register_blueprint(tags_bp, url_prefix='/tags')
-app.register_blueprint(locations_bp, url_prefix='/locations')
-app.register_blueprint(users_bp, url_prefix='/users')
-app.register_blueprint(api_bp, url_prefix='/api')
-app.register_blueprint(auth_bp)
+    return app
 
 
+# Development server only; see wsgi.py and gunicorn.conf.py for production
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
@@ -0,0 +1,164 @@
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select, func, text
+from models import db
+from models.models import Work, Copy, Author, AuthorName, Tag, Location, works_authors, works_tags
+from services import search, fuzzy_index, versions, restore
+from services.isbn import check_digit13
+
+# Rows per INSERT round trip
+BATCH_SIZE = 5000
+
+FIRST_NAMES = ['Anna', 'Ben', 'Clara', 'David', 'Elena', 'Felix', 'Greta', 'Hugo', 'Ines', 'Jonas', 'Karin',
+               'Leo', 'Maria', 'Nils', 'Olga', 'Pablo', 'Queenie', 'Rosa', 'Stefan', 'Tove', 'Ulrich', 'Vera',
+               'Walter', 'Xenia', 'Yusuf', 'Zoe']
+LAST_NAMES = ['Andersen', 'Brontë', 'Castellanos', 'Dumas', 'Eliot', 'Fontane', 'García', 'Hesse', 'Ishiguro',
+              'Jansson', 'Kafka', 'Lagerlöf', 'Mann', 'Nabokov', 'Orwell', 'Pamuk', 'Queneau', 'Rilke',
+              'Saramago', 'Tolstoy', 'Undset', 'Verne', 'Woolf', 'Xingjian', 'Yourcenar', 'Zola']
+WORDS = ['river', 'night', 'garden', 'winter', 'house', 'letters', 'shadow', 'island', 'mountain', 'silence',
+         'journey', 'city', 'summer', 'stone', 'light', 'memory', 'forest', 'glass', 'harbor', 'storm',
+         'kingdom', 'salt', 'paper', 'fire', 'orchard', 'tower', 'voices', 'mirror', 'empire', 'bridge']
+GENRES = ['Fiction', 'Poetry', 'History', 'Science', 'Philosophy', 'Travel', 'Biography', 'Mystery',
+          'Fantasy', 'Drama', 'Art', 'Cooking', 'Children', 'Essays', 'Religion', 'Nature']
+LOCATION_TYPES = ['room', 'bookcase', 'shelf', 'box', 'stack', 'pile']
+
+
+class Scale:
+    """How many rows of each kind to generate for a number of copies"""
+
+    def __init__(self, copies, depth=6, fanout=4):
+        self.copies = copies
+        self.works = max(1, copies * 2 // 3)
+        self.authors = max(1, self.works // 4)
+        self.alt_names = self.authors // 5
+        self.tags = min(2000, max(20, copies // 500))
+        self.locations = max(depth, copies // 25)
+        self.depth = depth
+        self.fanout = fanout
+
+    def to_dict(self):
+        return {'copies': self.copies, 'works': self.works, 'authors': self.authors, 'alt_names': self.alt_names,
+                'tags': self.tags, 'locations': self.locations, 'depth': self.depth}
+
+
+def _insert(table, rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(table), rows[i:i + BATCH_SIZE])
+
+
+def _next_id(model):
+    return (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _isbn(number):
+    """A valid ISBN-13 made from a number below a billion"""
+    first12 = f'978{number % 10**9:09d}'
+    return first12 + check_digit13(first12)
+
+
+def _title(rng):
+    words = rng.sample(WORDS, rng.randint(1, 3))
+    title = 'The ' + ' of '.join(word.capitalize() for word in words)
+    return title if rng.random() < 0.7 else f'{title} {rng.randint(1, 9999)}'
+
+
+def _tree(rng, first_id, count, depth, fanout, name):
+    """Rows for a tree of count nodes, at most depth levels deep, filled breadth first"""
+    rows = []
+    level = [None]
+    for d in range(depth):
+        next_level = []
+        for parent_id in level:
+            children = fanout if d < depth - 1 else fanout * 4
+            for _ in range(rng.randint(1, children)):
+                if len(rows) >= count:
+                    return rows
+                id = first_id + len(rows)
+                rows.append(dict(name(d, id), id=id, parent_id=parent_id))
+                next_level.append(id)
+        level = next_level or level
+    # Whatever is left hangs off random nodes
+    while len(rows) < count:
+        id = first_id + len(rows)
+        rows.append(dict(name(depth, id), id=id, parent_id=rng.choice(rows)['id'] if rows else None))
+    return rows
+
+
+def generate(copies=1000, seed=1, depth=6, fanout=4, log=print):
+    """
+    Fill the database with a synthetic library of about `copies` copies.
+
+    The same seed and scale always produce the same rows, so runs on
+    different machines or databases are comparable. Rows are added to
+    whatever is already there. Returns the Scale used.
+    """
+    rng = random.Random(seed)
+    scale = Scale(copies, depth, fanout)
+    start = time.perf_counter()
+
+    location_id = _next_id(Location)
+    locations = _tree(rng, location_id, scale.locations, depth, fanout,
+                      lambda d, id: {'name': f'{LOCATION_TYPES[min(d, len(LOCATION_TYPES) - 1)].capitalize()} {id}',
+                                     'type': LOCATION_TYPES[min(d, len(LOCATION_TYPES) - 1)]})
+    _insert(Location.__table__, locations)
+    log(f'{len(locations)} locations')
+
+    tag_id = _next_id(Tag)
+    tags = _tree(rng, tag_id, scale.tags, 3, len(GENRES),
+                 lambda d, id: {'label': f'{GENRES[id % len(GENRES)]} {id}' if d else GENRES[id % len(GENRES)],
+                                'type': 'genre'})
+    _insert(Tag.__table__, tags)
+    log(f'{len(tags)} tags')
+
+    author_id = _next_id(Author)
+    authors = [{'id': author_id + i, 'primary_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+                                                     f'{"" if rng.random() < 0.5 else "-" + rng.choice(LAST_NAMES)}',
+                'bio': None} for i in range(scale.authors)]
+    _insert(Author.__table__, authors)
+    alt_names = [{'author_id': author['id'], 'alt_name': f'{author["primary_name"][0]}. {author["primary_name"].split()[-1]}'}
+                 for author in rng.sample(authors, scale.alt_names)]
+    _insert(AuthorName.__table__, alt_names)
+    log(f'{len(authors)} authors, {len(alt_names)} alternate names')
+
+    work_id = _next_id(Work)
+    isbn_base = rng.randint(0, 10**6) * 10**3
+    works, work_authors, work_tags = [], [], []
+    for i in range(scale.works):
+        id = work_id + i
+        works.append({'id': id, 'title': _title(rng), 'isbn': _isbn(isbn_base + id), 'publisher': f'{rng.choice(LAST_NAMES)} Press',
+                      'description': ' '.join(rng.choices(WORDS, k=rng.randint(10, 60))), 'cover_url': None})
+        for author in {rng.choice(authors)['id'] for _ in range(rng.choice((1, 1, 1, 2, 3)))}:
+            work_authors.append({'works_id': id, 'authors_id': author})
+        for tag in {rng.choice(tags)['id'] for _ in range(rng.randint(0, 3))}:
+            work_tags.append({'works_id': id, 'tags_id': tag})
+    _insert(Work.__table__, works)
+    _insert(works_authors, work_authors)
+    _insert(works_tags, work_tags)
+    log(f'{len(works)} works')
+
+    acquired = datetime(2000, 1, 1)
+    copies_rows = []
+    for i in range(copies):
+        copies_rows.append({'work_id': work_id + (i if i < scale.works else rng.randrange(scale.works)),
+                            'location_id': rng.choice(locations)['id'], 'owner_id': None,
+                            'condition': rng.choice(('new', 'good', 'worn', None)),
+                            'acquired': acquired + timedelta(minutes=i * 7 + rng.randint(0, 6)), 'lended_to': None})
+    _insert(Copy.__table__, copies_rows)
+    log(f'{len(copies_rows)} copies')
+
+    # Bulk inserts skip the session hooks that keep these up to date
+    versions.bump(db.session.connection(), [table.name for table in db.metadata.sorted_tables])
+    restore.fix_sequences(db.session.connection())
+    db.session.commit()
+
+    count = search.rebuild()
+    log(f'{count} works indexed for search')
+    fuzzy_index.authors.invalidate()
+    fuzzy_index.tags.invalidate()
+
+    with db.engine.begin() as conn:
+        conn.execute(text('ANALYZE'))
+
+    log(f'Generated in {time.perf_counter() - start:.1f}s')
+    return scale
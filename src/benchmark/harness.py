@@ -0,0 +1,164 @@
+import json
+import platform
+import statistics
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event
+from models import db
+from models.models import Work, Copy
+
+# Ratio of median times above which a case counts as a regression
+DEFAULT_THRESHOLD = 1.2
+
+
+def _cases(client):
+    """(name, callable making one request) for every benchmarked hot path"""
+    searches = ['river', 'the night of', 'kafka', 'gard', 'summer 12']
+    authors = ['Ana Andersn', 'Tolstoi', 'K. Mann', 'Virginia Woolf', 'zola']
+    tags = ['Fction', 'history', 'Poetry 3', 'myster']
+
+    def cycle(values):
+        state = {'i': 0}
+
+        def next_value():
+            state['i'] += 1
+            return values[state['i'] % len(values)]
+        return next_value
+
+    search, author, tag = cycle(searches), cycle(authors), cycle(tags)
+    return [
+        ('api_search', lambda: client.get('/api/search', query_string={'q': search()})),
+        ('search_authors', lambda: client.post('/api/authors/search', json={'name': author()})),
+        ('search_tags', lambda: client.post('/api/tags/search', json={'label': tag()})),
+        ('location_list', lambda: client.get('/locations/')),
+        ('books', lambda: client.get('/books/')),
+        ('work_add_form', lambda: client.get('/books/works/add'))
+    ]
+
+
+class _QueryCounter:
+    """
+    Counts the statements this thread runs. A streamed response runs most
+    of its queries after its headers, Server-Timing included, are sent, so
+    they are counted here instead.
+    """
+
+    def __init__(self, engine):
+        self.count = 0
+        self._thread = threading.get_ident()
+        self._engine = engine
+        event.listen(engine, 'before_cursor_execute', self._executed)
+
+    def close(self):
+        event.remove(self._engine, 'before_cursor_execute', self._executed)
+
+    def _executed(self, *args):
+        if threading.get_ident() == self._thread:
+            self.count += 1
+
+
+def _timed(make_request, counter):
+    """Make one request and read its whole body, so streamed responses are timed to the end; (response, ms, queries)"""
+    counter.count = 0
+    start = time.perf_counter()
+    response = make_request()
+    response.get_data()
+    elapsed = (time.perf_counter() - start) * 1000
+    response.close()
+    return response, elapsed, counter.count
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run(app, repeat=20, warmup=3, only=None, log=print):
+    """
+    Time each hot path through the test client and return the results dict.
+
+    Every case runs warmup untimed requests first, so caches and indexes
+    that load lazily don't count against the first sample.
+    """
+    app.config.update(LOGIN_DISABLED=True, WTF_CSRF_ENABLED=False)
+    client = app.test_client()
+    with app.app_context():
+        counter = _QueryCounter(db.engine)
+
+    results = {}
+    for name, make_request in _cases(client):
+        if only and name not in only:
+            continue
+        for _ in range(warmup):
+            _timed(make_request, counter)
+
+        times, queries = [], []
+        for _ in range(repeat):
+            response, elapsed, count = _timed(make_request, counter)
+            times.append(elapsed)
+            queries.append(count)
+            if response.status_code != 200:
+                raise RuntimeError(f'{name} returned {response.status_code}')
+
+        results[name] = {
+            'median_ms': round(statistics.median(times), 2),
+            'p95_ms': round(_percentile(times, 0.95), 2),
+            'min_ms': round(min(times), 2),
+            'max_ms': round(max(times), 2),
+            'queries': max(queries) if queries else None,
+            'samples': repeat
+        }
+        log(f"{name:16} median {results[name]['median_ms']:8.2f} ms   p95 {results[name]['p95_ms']:8.2f} ms   "
+            f"{results[name]['queries']} queries")
+
+    counter.close()
+    with app.app_context():
+        database = db.engine.dialect.name
+        library = {'works': db.session.query(Work).count(), 'copies': db.session.query(Copy).count()}
+
+    return {
+        'created': datetime.utcnow().isoformat(timespec='seconds'),
+        'database': database,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'library': library,
+        'results': results
+    }
+
+
+def save(results, path):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare results to a baseline, returning (lines, regressions).
+
+    A case regresses when its median time grows by more than the threshold
+    ratio or it runs more queries than before.
+    """
+    lines, regressions = [], []
+    for name, current in results['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None:
+            lines.append(f'{name:16} new')
+            continue
+
+        ratio = current['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+        more_queries = (current['queries'] or 0) > (before['queries'] or 0)
+        flag = ' REGRESSION' if ratio > threshold or more_queries else ''
+        lines.append(f"{name:16} {before['median_ms']:8.2f} -> {current['median_ms']:8.2f} ms ({ratio:.2f}x), "
+                     f"{before['queries']} -> {current['queries']} queries{flag}")
+        if flag:
+            regressions.append(name)
+
+    if baseline.get('library') != results.get('library'):
+        lines.append(f"Note: baseline library {baseline.get('library')} differs from {results.get('library')}")
+    return lines, regressions
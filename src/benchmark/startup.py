@@ -0,0 +1,91 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+# Run in a fresh interpreter, since this one has imported everything already
+_CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+client = app.test_client()
+requests = []
+for path in sys.argv[1:]:
+    first = time.perf_counter()
+    status = client.get(path).status_code
+    second = time.perf_counter()
+    client.get(path)
+    done = time.perf_counter()
+    requests.append({'path': path, 'status': status,
+                     'first_ms': (second - first) * 1000, 'second_ms': (done - second) * 1000})
+print(json.dumps({'import_app_ms': (imported - start) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'requests': requests}))
+'''
+
+_IMPORT_TIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)')
+
+# Top-level packages that are this app rather than its dependencies
+APP_PACKAGES = {'app', 'config', 'commands', 'models', 'routes', 'services', 'forms', 'benchmark'}
+
+
+def _imports(stderr):
+    """(module, cumulative ms) of the app's modules and of everything they import directly"""
+    stack = []
+    found = []
+    for line in stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if not match:
+            continue
+        depth = (len(match.group(3)) - 1) // 2
+        found.append((depth, match.group(4), int(match.group(2)) / 1000))
+
+    # importtime lists children before their parent, so walk it backwards
+    # to know each module's parent
+    imports = {}
+    for depth, name, ms in reversed(found):
+        del stack[depth:]
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        # Blueprints are imported inside create_app(), so they show up at the top level
+        importer = parent if parent is not None else name
+        if importer.split('.')[0] in APP_PACKAGES and name != 'app':
+            imports[name] = imports.get(name, 0) + ms
+    return imports
+
+
+def run(paths=('/', '/books/'), template_cache=True, top=15):
+    """Start the app in a new process and return where its startup time went"""
+    env = dict(os.environ)
+    if not template_cache:
+        env['TEMPLATE_CACHE_DIR'] = ''
+    src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _CHILD, *paths],
+        cwd=src, env=env, capture_output=True, text=True, check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    imports = sorted(_imports(result.stderr).items(), key=lambda item: item[1], reverse=True)
+    report['app_imports'] = [(name, ms) for name, ms in imports if name.split('.')[0] in APP_PACKAGES][:top]
+    report['imports'] = [(name, ms) for name, ms in imports if name.split('.')[0] not in APP_PACKAGES][:top]
+    return report
+
+
+def format_report(report):
+    lines = [
+        f"import app          {report['import_app_ms']:8.1f} ms",
+        f"create_app()       {report['create_app_ms']:8.1f} ms",
+        '',
+        'Slowest app modules (cumulative, including what they import first):'
+    ]
+    lines += [f'  {name:40} {ms:8.1f} ms' for name, ms in report['app_imports']]
+    lines += ['', 'Slowest dependencies, as imported by the app (cumulative):']
+    lines += [f'  {name:40} {ms:8.1f} ms' for name, ms in report['imports']]
+    lines += ['', 'Requests (first, then second):']
+    lines += [f"  {request['path']:20} {request['status']}  {request['first_ms']:8.1f} ms  "
+              f"{request['second_ms']:8.1f} ms" for request in report['requests']]
+    return lines
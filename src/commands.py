@@ -0,0 +1,179 @@
+import os
+import click
+import gzip
+import time
+from models import db
+from models.models import User
+from services import importer, search, covers, export, restore, jobs, isbn_mirror
+
+
+def register_commands(app):
+    """Attach the bookshelf maintenance commands to `flask`"""
+
+    @app.cli.command('import-isbns')
+    @click.argument('file', type=click.File('r'))
+    @click.option('--location', help='Location name or id for rows that do not give one.')
+    @click.option('--workers', default=8, show_default=True, help='Concurrent metadata lookups.')
+    @click.option('--batch-size', default=200, show_default=True, help='Rows per database transaction.')
+    def import_isbns(file, location, workers, batch_size):
+        """Bulk import books from a file of ISBNs (isbn[,location[,owner]] per line)."""
+        rows = importer.read_isbn_file(file)
+        click.echo(f'Importing {len(rows)} rows...')
+
+        report = importer.import_rows(
+            rows,
+            default_location=location,
+            workers=workers,
+            batch_size=batch_size,
+            timeout=app.config['ISBN_LOOKUP_TIMEOUT']
+        )
+
+        for failure in report.failures:
+            click.echo(f"  {failure['isbn']}: {failure['error']}", err=True)
+        click.echo(report.summary())
+
+    @app.cli.command('search-rebuild')
+    def search_rebuild():
+        """Rebuild the full-text search index from scratch."""
+        count = search.rebuild()
+        click.echo(f'Indexed {count} works.')
+
+    @app.cli.command('covers-fetch')
+    @click.option('--force', is_flag=True, help='Download covers again even if they are stored.')
+    def covers_fetch(force):
+        """Store every work's cover locally and make its thumbnails."""
+        stored, failed = covers.fetch_missing(force=force, log=click.echo)
+        click.echo(f'Stored {stored} covers, {failed} failed.')
+
+    @app.cli.command('enrich-missing')
+    @click.option('--run', is_flag=True, help='Run the queued jobs here instead of leaving them to the app.')
+    def enrich_missing(run):
+        """Queue a metadata lookup for every work with an ISBN and empty fields."""
+        click.echo(f'Queued {jobs.enqueue_missing()} works.')
+        if run:
+            ran = 0
+            while jobs.run_next():
+                ran += 1
+            click.echo(f'Ran {ran} jobs: {jobs.counts()}')
+
+    @app.cli.command('isbn-mirror')
+    @click.argument('dumps', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+    @click.option('--output', type=click.Path(dir_okay=False), help='Where to write the mirror; ISBN_MIRROR by default.')
+    def build_isbn_mirror(dumps, output):
+        """Build the offline ISBN mirror from Open Library editions, works and authors dumps."""
+        report = isbn_mirror.build(dumps, output or app.config['ISBN_MIRROR'], log=click.echo)
+        click.echo(report.summary())
+
+    @app.cli.command('export')
+    @click.argument('output', type=click.Path(dir_okay=False, writable=True))
+    @click.option('--format', 'format_', type=click.Choice(export.FORMATS), default='ndjson', show_default=True)
+    @click.option('--entity', type=click.Choice(export.ENTITIES), help='Only this entity; required for CSV.')
+    @click.option('--no-gzip', is_flag=True, help='Write uncompressed output.')
+    def export_library(output, format_, entity, no_gzip):
+        """Export the library (works, copies, authors, tags, locations, users) to a file."""
+        try:
+            chunks = export.chunks(format_, entity)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+
+        start = time.perf_counter()
+        opener = open if no_gzip else gzip.open
+        written = 0
+        with opener(output, 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+                written += len(chunk)
+        click.echo(f'Exported {written / 1e6:.1f} MB to {output} in {time.perf_counter() - start:.1f}s.')
+
+    @app.cli.command('restore')
+    @click.argument('file', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'format_', type=click.Choice(export.FORMATS),
+                  help='Format of the file; guessed from its name by default.')
+    @click.option('--entity', type=click.Choice(export.ENTITIES), help='Only restore this entity; required for CSV.')
+    @click.option('--replace', is_flag=True, help='Empty the tables being restored first.')
+    def restore_library(file, format_, entity, replace):
+        """Load an export made by `flask export` into the database."""
+        format_ = format_ or restore.guess_format(file)
+        if format_ is None:
+            raise click.UsageError('Cannot tell the format from the file name; pass --format.')
+
+        with restore.open_dump(file) as dump:
+            try:
+                report = restore.restore(
+                    restore.records(dump, format_, entity),
+                    entities=(entity,) if entity else export.ENTITIES,
+                    replace=replace,
+                    log=click.echo
+                )
+            except ValueError as e:
+                raise click.UsageError(str(e))
+        click.echo(report.summary())
+        if report.users_without_password:
+            click.echo('Users without a password cannot log in until one is set with `flask set-password`.')
+
+    @app.cli.command('set-password')
+    @click.argument('name')
+    @click.password_option()
+    def set_password(name, password):
+        """Set the password of a user."""
+        user = db.session.query(User).filter_by(name=name).first()
+        if user is None:
+            raise click.UsageError(f'No user named {name}.')
+        user.set_password(password)
+        db.session.commit()
+        click.echo(f'Password set for {name}.')
+
+    @app.cli.command('templates-compile')
+    def templates_compile():
+        """Compile every template into the bytecode cache ahead of the first request."""
+        from services import warmup
+        if not app.config['TEMPLATE_CACHE_DIR']:
+            raise click.ClickException('TEMPLATE_CACHE_DIR is empty, so compiled templates would not be kept.')
+        count = warmup.compile_templates(app)
+        click.echo(f"Compiled {count} templates into {app.config['TEMPLATE_CACHE_DIR']}.")
+
+    @app.cli.command('bench-generate')
+    @click.option('--copies', default=10000, show_default=True, help='Copies to generate (1k to 1M).')
+    @click.option('--seed', default=1, show_default=True, help='Random seed; the same seed gives the same library.')
+    @click.option('--depth', default=6, show_default=True, help='Depth of the location tree.')
+    def bench_generate(copies, seed, depth):
+        """Fill the database with a synthetic library for benchmarking."""
+        from benchmark import generator
+        scale = generator.generate(copies=copies, seed=seed, depth=depth, log=click.echo)
+        click.echo(scale.to_dict())
+
+    @app.cli.command('bench-startup')
+    @click.option('--path', 'paths', multiple=True, help='Pages to request after startup (default / and /books/).')
+    @click.option('--no-template-cache', is_flag=True, help='Start without the template bytecode cache.')
+    def bench_startup(paths, no_template_cache):
+        """Report where a fresh process spends its startup: imports, create_app and first requests."""
+        from benchmark import startup
+        report = startup.run(paths or ('/', '/books/'), template_cache=not no_template_cache)
+        for line in startup.format_report(report):
+            click.echo(line)
+
+    @app.cli.command('bench-run')
+    @click.option('--output', default='benchmark/results.json', show_default=True, help='Where to save the results.')
+    @click.option('--baseline', default='benchmark/baseline.json', show_default=True, help='Results to compare to.')
+    @click.option('--save-baseline', is_flag=True, help='Store these results as the new baseline.')
+    @click.option('--repeat', default=20, show_default=True, help='Timed requests per case.')
+    @click.option('--threshold', default=1.2, show_default=True, help='Median slowdown ratio that fails the run.')
+    @click.option('--case', 'cases', multiple=True, help='Only run these cases.')
+    def bench_run(output, baseline, save_baseline, repeat, threshold, cases):
+        """Benchmark the hot paths and compare them to the baseline."""
+        from benchmark import harness
+        results = harness.run(app, repeat=repeat, only=cases, log=click.echo)
+        harness.save(results, output)
+        click.echo(f'Saved results to {output}')
+
+        if save_baseline:
+            harness.save(results, baseline)
+            click.echo(f'Saved baseline to {baseline}')
+        elif os.path.exists(baseline):
+            lines, regressions = harness.compare(results, harness.load(baseline), threshold)
+            for line in lines:
+                click.echo(line)
+            if regressions:
+                raise click.ClickException(f'{len(regressions)} case(s) regressed: {", ".join(regressions)}')
+        else:
+            click.echo(f'No baseline at {baseline}; run with --save-baseline to store one')
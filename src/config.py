@@ -6,4 +6,57 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
-    SQLALCHEMY_TRACK_MODIFICATIONS = True
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = True
+
+    # Connection pool, per process: connections kept open, extra ones allowed under load,
+    # seconds to wait for a free one, and seconds before one is replaced. Pre-ping tests
+    # a connection before handing it out, so a restarted database doesn't fail requests
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+    }
+
+    # Pages requested once at startup, before a worker takes traffic
+    WARMUP_PATHS = [path for path in os.environ.get('WARMUP_PATHS', '/,/books/').split(',') if path]
+
+    # Compiled templates kept on disk between restarts; set to an empty string to turn off
+    TEMPLATE_CACHE_DIR = os.environ.get(
+        'TEMPLATE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'templates')
+    )
+
+    # ISBN lookup cache, in seconds
+    ISBN_CACHE_TTL = int(os.environ.get('ISBN_CACHE_TTL', 60 * 60 * 24 * 30))
+    ISBN_CACHE_NEGATIVE_TTL = int(os.environ.get('ISBN_CACHE_NEGATIVE_TTL', 60 * 60 * 24))
+
+    # ISBN providers, in seconds
+    ISBN_LOOKUP_TIMEOUT = float(os.environ.get('ISBN_LOOKUP_TIMEOUT', 5))
+    ISBN_MERGE_BUDGET = float(os.environ.get('ISBN_MERGE_BUDGET', 0.15))
+
+    # Offline copy of Open Library, built from its dumps with `flask isbn-mirror`; ISBNs in it
+    # are answered without the network. Nothing is used if the file doesn't exist
+    ISBN_MIRROR = os.environ.get('ISBN_MIRROR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'openlibrary.sqlite3'))
+
+    # Local cover store: directory, download threads, thumbnail processes, timeout in seconds
+    COVER_DIR = os.environ.get('COVER_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'covers'))
+    COVER_FETCH_WORKERS = int(os.environ.get('COVER_FETCH_WORKERS', 4))
+    COVER_THUMBNAIL_WORKERS = int(os.environ.get('COVER_THUMBNAIL_WORKERS', 2))
+    COVER_FETCH_TIMEOUT = float(os.environ.get('COVER_FETCH_TIMEOUT', 10))
+
+    # Background jobs: worker threads per process (0 runs none), tries before a job fails,
+    # first retry delay (doubling after each failure), seconds a running job is held
+    # before another worker may take it over, and seconds idle workers wait between checks
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    JOB_RETRY_SECONDS = float(os.environ.get('JOB_RETRY_SECONDS', 60))
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+    JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 30))
+
+    # Logged in users kept in memory, and for how many seconds
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 256))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+
+    # Raise on lazy loads that a page didn't plan for; for development and tests
+    STRICT_LOADING = os.environ.get('STRICT_LOADING', '').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,54 @@
+from flask import url_for
+from wtforms import SelectField, SelectMultipleField
+from services import typeahead
+
+
+def coerce_id(value):
+    """Primary key from a submitted value or a model instance; blank and 0 become None"""
+    if value in (None, '', 0, '0'):
+        return None
+    return int(getattr(value, 'id', value))
+
+
+class TypeaheadMixin:
+    """
+    Choices limited to the selected rows, looked up in one query when the
+    field is rendered or validated. The widget carries the URL of the
+    typeahead endpoint the page's script searches the rest with.
+    """
+
+    def __init__(self, label=None, validators=None, source=None, blank_text=None, **kwargs):
+        super().__init__(label, validators, coerce=coerce_id, choices=[], **kwargs)
+        self.source = source
+        self.blank_text = blank_text
+        self._loaded_for = None
+
+    def _selected_ids(self):
+        """The field's data as a list: no id, one id, or the ids of a multiple select"""
+        if self.data is None:
+            return []
+        if isinstance(self.data, (list, tuple)):
+            return list(self.data)
+        return [self.data]
+
+    def iter_choices(self):
+        ids = tuple(self._selected_ids())
+        if ids != self._loaded_for:
+            found = typeahead.labels(self.source, ids)
+            self.choices = [(id, found[id]) for id in ids if id in found]
+            if self.blank_text is not None:
+                self.choices.insert(0, ('', self.blank_text))
+            self._loaded_for = ids
+        return super().iter_choices()
+
+    def __call__(self, **kwargs):
+        kwargs.setdefault('data-typeahead', url_for('api.typeahead_suggest', source=self.source))
+        return super().__call__(**kwargs)
+
+
+class TypeaheadSelectField(TypeaheadMixin, SelectField):
+    """Single id of a typeahead source; give blank_text to allow choosing none"""
+
+
+class TypeaheadSelectMultipleField(TypeaheadMixin, SelectMultipleField):
+    """Any number of ids of a typeahead source"""
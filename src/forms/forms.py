@@ -1,30 +1,40 @@
 from flask_wtf import FlaskForm
 from wtforms import FieldList, StringField, TextAreaField, SelectMultipleField, SubmitField, SelectField, BooleanField, PasswordField
 from wtforms.validators import DataRequired, Length, Optional, EqualTo, Email, ValidationError
-from forms.fromai import LocationTreeWidget
+from forms.fromai import LocationTreeWidget, LocationTreeSelectField
+from forms.fields import TypeaheadSelectField, TypeaheadSelectMultipleField
 from models.models import User
+from services.isbn import canonical as canonical_isbn
+
+def valid_isbn(form, field):
+    """Accept an ISBN-10 or ISBN-13 whose check digit is right, and store it as its ISBN-13"""
+    if field.data:
+        isbn = canonical_isbn(field.data)
+        if isbn is None:
+            raise ValidationError('Not a valid ISBN; check for a mistyped digit.')
+        field.data = isbn
 
 class BookForm(FlaskForm):
     title = StringField('Title')
-    isbn = StringField('ISBN', validators=[Length(min=10, max=20)])
+    isbn = StringField('ISBN', validators=[Length(min=10, max=20), valid_isbn])
     submit = SubmitField('Submit')
 
 class WorkForm(FlaskForm):
     title = StringField('Title', validators=[DataRequired()])
-    isbn = StringField('ISBN', validators=[DataRequired(), Length(min=10, max=20)])
-    authors = SelectMultipleField('Authors', coerce=int)
+    isbn = StringField('ISBN', validators=[DataRequired(), Length(min=10, max=20), valid_isbn])
+    authors = TypeaheadSelectMultipleField('Authors', source='authors')
     publisher = StringField('Publisher')
     description = TextAreaField('Description')
-    tags = SelectMultipleField('Tags', coerce=int)
+    tags = TypeaheadSelectMultipleField('Tags', source='tags')
     cover_url = StringField('Cover URL')
     submit = SubmitField('Submit')
 
 class CopyForm(FlaskForm):
-    work = SelectField('Work', coerce=int, validators=[DataRequired()])
-    location = SelectField('Location', coerce=int, validators=[DataRequired()])
-    owner = SelectField('Owner', coerce=int)
+    work = TypeaheadSelectField('Work', source='works', validators=[DataRequired()])
+    location = TypeaheadSelectField('Location', source='locations', validators=[DataRequired()])
+    owner = TypeaheadSelectField('Owner', source='users', blank_text='-none-')
     condition = StringField('Condition', validators=[Length(max=50)])
-    lended_to = SelectField('Lended To', coerce=int)
+    lended_to = TypeaheadSelectField('Lended To', source='users', blank_text='-none-')
     submit = SubmitField('Submit')
 
 class AuthorForm(FlaskForm):
@@ -36,14 +46,15 @@ class AuthorForm(FlaskForm):
 class TagForm(FlaskForm):
     label = StringField('Label', validators=[DataRequired()])
     description = TextAreaField('Description')
-    parent = SelectField('Parent', coerce=int, validators=[Optional()])
+    parent = LocationTreeSelectField('Parent', coerce=int, validators=[Optional()],
+                                     widget=LocationTreeWidget(static=True, placeholder='Search tags...'))
     type = StringField('Type', validators=[Length(max=50)])
     submit = SubmitField('Submit')
 
 class LocationForm(FlaskForm):
     name = StringField('Name', validators=[DataRequired()])
     description = TextAreaField('Description')
-    parent = SelectField('Parent', coerce=int, validators=[Optional()], widget=LocationTreeWidget())
+    parent = LocationTreeSelectField('Parent', coerce=int, validators=[Optional()])
     type = StringField('Type', validators=[Length(max=50)])
     submit = SubmitField('Submit')
 
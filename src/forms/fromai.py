@@ -1,16 +1,40 @@
+import threading
+from collections import OrderedDict
+from flask import url_for
 from wtforms import SelectField
+from wtforms.validators import ValidationError
 from wtforms.widgets import Select
-from markupsafe import Markup
+from markupsafe import Markup, escape
+
+# Rendered trees kept by the static widget mode, most recently used last
+TREE_CACHE_SIZE = 64
+_tree_cache = OrderedDict()
+_tree_cache_lock = threading.Lock()
+
 
 class LocationTreeWidget:
-    """Custom widget that renders a searchable tree select for locations"""
-    
+    """
+    Custom widget that renders a searchable tree select for locations.
+
+    With static=True the CSS and JS come from static files instead of being
+    inlined, and the tree itself is rendered without a selection so it can be
+    cached by the version of the field's choices (see hierarchy.tree_choices);
+    the script marks the selected node from the hidden input.
+    """
+
+    def __init__(self, static=False, placeholder='Search locations...'):
+        self.static = static
+        self.placeholder = placeholder
+
     def __call__(self, field, **kwargs):
         kwargs.setdefault('id', field.id)
         kwargs.setdefault('name', field.name)
         
         # Get the selected value
         selected_value = kwargs.pop('value', field.data or '')
+
+        if self.static:
+            return self._render_static(field, kwargs, selected_value)
         
         # Build the HTML
         html = [f'<div class="location-tree-select-container">']
@@ -52,6 +76,71 @@ class LocationTreeWidget:
         
         return Markup(''.join(html))
     
+    def _render_static(self, field, kwargs, selected_value):
+        html = [
+            f'<link rel="stylesheet" href="{url_for("static", filename="css/tree_select.css")}">',
+            '<div class="location-tree-select-container" data-tree-select>',
+            f'<input type="text" class="form-control mb-2 tree-select-search" id="{field.id}_search" '
+            f'placeholder="{escape(self.placeholder)}">',
+            f'<input type="hidden" id="{escape(kwargs["id"])}" name="{escape(kwargs["name"])}" '
+            f'value="{escape(selected_value)}">',
+            f'<div class="location-tree-select" id="{field.id}_tree">',
+            '<ul class="location-tree-list">',
+            self._cached_tree(field),
+            '</ul>',
+            '</div>',
+            '</div>',
+            f'<script src="{url_for("static", filename="js/tree_select.js")}" defer></script>'
+        ]
+        return Markup(''.join(html))
+
+    def _cached_tree(self, field):
+        version = getattr(field.choices, 'version', None)
+        if version is None:
+            return self._render_static_tree(field.choices, field.id)
+
+        key = (field.id, version)
+        with _tree_cache_lock:
+            if key in _tree_cache:
+                _tree_cache.move_to_end(key)
+                return _tree_cache[key]
+
+        html = self._render_static_tree(field.choices, field.id)
+        with _tree_cache_lock:
+            _tree_cache[key] = html
+            while len(_tree_cache) > TREE_CACHE_SIZE:
+                _tree_cache.popitem(last=False)
+        return html
+
+    def _render_static_tree(self, choices, field_id):
+        """Render the tree without selection or inline handlers, iteratively so depth doesn't matter"""
+        html = []
+        stack = [iter(choices)]
+        while stack:
+            choice = next(stack[-1], None)
+            if choice is None:
+                stack.pop()
+                if stack:
+                    html.append('</ul></li>')
+                continue
+
+            value, label, children = choice
+            value, label = escape(value), escape(label)
+            html.append(f'<li class="location-tree-item" data-location-name="{label}">'
+                        '<div class="location-tree-node">')
+            if children:
+                html.append('<button type="button" class="location-toggle">▼</button>')
+            else:
+                html.append('<span class="location-toggle-spacer"></span>')
+            html.append(f'<input type="radio" name="{field_id}_radio" value="{value}" id="{field_id}_option_{value}">'
+                        f'<label for="{field_id}_option_{value}" class="location-label">{label}</label></div>')
+            if children:
+                html.append('<ul class="location-children">')
+                stack.append(iter(children))
+            else:
+                html.append('</li>')
+        return ''.join(html)
+
     def _render_tree(self, choices, selected_value, field_id, level=0):
         """Recursively render the location tree"""
         html = []
@@ -234,11 +323,31 @@ class LocationTreeWidget:
 
 
 class LocationTreeSelectField(SelectField):
-    widget = LocationTreeWidget()
+    """SelectField for nested (value, label, children) choices"""
+    widget = LocationTreeWidget(static=True)
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+    def iter_choices(self):
+        """Every choice in the tree, flattened, so validation sees the nested ones too"""
+        stack = [iter(self.choices or [])]
+        while stack:
+            choice = next(stack[-1], None)
+            if choice is None:
+                stack.pop()
+                continue
+            value, label, children = choice
+            yield (value, label, self.coerce(value) == self.data, {})
+            if children:
+                stack.append(iter(children))
+
+    def pre_validate(self, form):
+        if self.choices is None:
+            raise TypeError(self.gettext('Choices cannot be None.'))
+        if not any(selected for _, _, selected, _ in self.iter_choices()):
+            raise ValidationError(self.gettext('Not a valid choice.'))
+
 
 def build_location_tree_choices(locations):
     """
@@ -256,23 +365,13 @@ def build_location_tree_choices(locations):
         form.location_id.choices = build_location_tree_choices(locations)
     """
     
+    by_parent = {}
+    for loc in locations:
+        by_parent.setdefault(loc.parent_id, []).append(loc)
+
     def build_tree(parent_id=None):
         """Recursively build tree structure"""
-        result = []
-        for loc in locations:
-            if loc.parent_id == parent_id:
-                children = build_tree(loc.id)
-                
-                # Build the label with parent path
-                label = loc.name
-                if parent_id is not None:
-                    parent = next((l for l in locations if l.id == loc.parent_id), None)
-                    if parent:
-                        # You can customize this to show the full path
-                        label = f"{loc.name}"
-                
-                result.append((loc.id, label, children))
-        return result
+        return [(loc.id, loc.name, build_tree(loc.id)) for loc in by_parent.get(parent_id, [])]
     
     # Start with root locations (those without a parent)
     tree = build_tree(None)
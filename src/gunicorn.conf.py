@@ -0,0 +1,32 @@
+# gunicorn.conf.py: run from src/ with `gunicorn -c gunicorn.conf.py`
+# Every setting can be overridden with an environment variable; see README.md for sizing.
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+# One process per core runs Python in parallel; threads in each one overlap the
+# time requests spend waiting on the database, ISBN providers and slow clients
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+# Load the app once in the master, so tables are checked once and workers share its memory
+preload_app = True
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Replace workers now and then so any slow leak stays bounded
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('ACCESS_LOG', '-')
+
+
+def post_worker_init(worker):
+    """Warm each worker up before it accepts its first request"""
+    from services import warmup
+    warmup.warm_up(worker.wsgi, log=worker.log.info)
@@ -1,13 +1,18 @@
+import logging
 from . import db
 from sqlalchemy.sql import func
-from sqlalchemy import Column, Integer, Text, String, BigInteger, DateTime, ForeignKey, Table
+from sqlalchemy import Column, Integer, Text, String, BigInteger, Boolean, DateTime, ForeignKey, Table, Index, MetaData, inspect, text, select, bindparam
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, column_property
 from sqlalchemy.sql import func
 from enum import Enum
+from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 
+logger = logging.getLogger(__name__)
+
 # --------------------------------- #
 # ~ ~ ~ ~ ~ ~ B O O K S ~ ~ ~ ~ ~ ~ #
 # --------------------------------- #
@@ -28,33 +33,49 @@ works_tags = db.Table(
     Column('tags_id', Integer, ForeignKey('tags.id'), primary_key=True)
 )
 
+# The primary keys cover lookups by work; these cover filtering works by author or tag
+Index('ix_works_authors_authors_id', works_authors.c.authors_id)
+Index('ix_works_tags_tags_id', works_tags.c.tags_id)
+
 # Models
 class Work(db.Model):
     __tablename__ = 'works'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    title = Column(Text, nullable=False)
+    title = Column(Text, nullable=False, index=True)
     publisher = Column(Text)
-    isbn = Column(BigInteger, unique=True)
+    # The 13 digits of the ISBN-13 (see services.isbn); unique, so exact and prefix lookups use its index
+    isbn = Column(String(13), unique=True)
     description = Column(Text)
     cover_url = Column(Text)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # The start of the description, enough for a card; list pages load this instead of description
+    summary = column_property(func.substr(description, 1, 300), deferred=True)
     
     # Relationships
     authors = relationship("Author", secondary=works_authors, back_populates="works")
     tags = relationship("Tag", secondary=works_tags, back_populates="works")
     copies = relationship("Copy", back_populates="work")
+    # Deleted with the work by the ORM too, since SQLite doesn't enforce the foreign key's ON DELETE CASCADE
+    jobs = relationship("Job", back_populates="work", cascade="all, delete")
+    cover = relationship("Cover", primaryjoin="foreign(Work.cover_url) == Cover.url", viewonly=True)
 
 
 class Copy(db.Model):
     __tablename__ = 'copies'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    work_id = Column(Integer, ForeignKey('works.id'), nullable=False)
-    location_id = Column(Integer, ForeignKey('locations.id'), nullable=False)
-    owner_id = Column(Integer, ForeignKey('users.id'))
+    work_id = Column(Integer, ForeignKey('works.id'), nullable=False, index=True)
+    location_id = Column(Integer, ForeignKey('locations.id'), nullable=False, index=True)
+    owner_id = Column(Integer, ForeignKey('users.id'), index=True)
     condition = Column(String(50))
     acquired = Column(DateTime(timezone=True), default=func.now())
-    lended_to = Column(Integer, ForeignKey('users.id'))
+    lended_to = Column(Integer, ForeignKey('users.id'), index=True)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Keyset pagination sorts on (acquired, id)
+    __table_args__ = (Index('ix_copies_acquired_id', 'acquired', 'id'),)
     
     # Relationships
     work = relationship("Work", back_populates="copies")
@@ -72,6 +93,7 @@ class Author(db.Model):
     id = Column(Integer, primary_key=True, autoincrement=True)
     primary_name = Column(Text, nullable=False)
     bio = Column(Text)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     alt_names = relationship("AuthorName", back_populates="author")
@@ -84,7 +106,7 @@ class AuthorName(db.Model):
     __tablename__ = 'author_names'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    author_id = Column(Integer, ForeignKey('authors.id'), nullable=False)
+    author_id = Column(Integer, ForeignKey('authors.id'), nullable=False, index=True)
     alt_name = Column(Text)
     
     # Relationships
@@ -99,10 +121,11 @@ class Tag(db.Model):
     __tablename__ = 'tags'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    parent_id = Column(Integer, ForeignKey('tags.id'))
+    parent_id = Column(Integer, ForeignKey('tags.id'), index=True)
     type = Column(String(50), nullable=False)
     label = Column(Text, nullable=False)
     description = Column(Text)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     parent = relationship("Tag", remote_side=[id], back_populates="children")
@@ -114,10 +137,11 @@ class Location(db.Model):
     __tablename__ = 'locations'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    parent_id = Column(Integer, ForeignKey('locations.id'))
-    name = Column(Text, nullable=False)
+    parent_id = Column(Integer, ForeignKey('locations.id'), index=True)
+    name = Column(Text, nullable=False, index=True)
     description = Column(Text)
     type = Column(String(50), nullable=False)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     parent = relationship("Location", remote_side=[id], back_populates="children")
@@ -144,6 +168,7 @@ class User(UserMixin, db.Model):
     info = Column(Text)
     join_date = Column(DateTime, nullable=False)
     permissions = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relationships
     owned_copies = relationship("Copy", foreign_keys="Copy.owner_id", back_populates="owner")
@@ -185,16 +210,212 @@ class User(UserMixin, db.Model):
         self.password_hash = generate_password_hash(password)
     
     def check_password(self, password):
+        # Users restored from an export have no password until one is set
+        if self.password_hash is None:
+            return False
         return check_password_hash(self.password_hash, password)
 
 
+# Case-insensitive prefix lookups for the typeahead endpoints
+Index('ix_works_title_lower', func.lower(Work.title))
+Index('ix_authors_primary_name_lower', func.lower(Author.primary_name))
+Index('ix_author_names_alt_name_lower', func.lower(AuthorName.alt_name))
+Index('ix_tags_label_lower', func.lower(Tag.label))
+Index('ix_locations_name_lower', func.lower(Location.name))
+Index('ix_users_name_lower', func.lower(User.name))
+
+
+
+# --------------------------------- #
+# ~ ~ ~ ~ ~ ~ C A C H E ~ ~ ~ ~ ~ ~ #
+# --------------------------------- #
+
+class IsbnCache(db.Model):
+    __tablename__ = 'isbn_cache'
+
+    isbn = Column(String(20), primary_key=True)
+    found = Column(Boolean, nullable=False)
+    provider = Column(String(50))
+    data = Column(Text)
+    fetched_at = Column(DateTime, nullable=False)
+
+
+class Cover(db.Model):
+    """A cover image fetched from its URL and stored on disk under its SHA-256"""
+    __tablename__ = 'covers'
+
+    url = Column(Text, primary_key=True)
+    digest = Column(String(64))
+    content_type = Column(String(50))
+    error = Column(Text)
+    fetched_at = Column(DateTime, nullable=False)
+
+
+class Generation(db.Model):
+    """How many times a table has been written to, and when it last was"""
+    __tablename__ = 'generations'
+
+    table_name = Column(String(64), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+    changed_at = Column(DateTime, nullable=False)
+
+
+# --------------------------------- #
+# ~ ~ ~ ~ ~ ~ ~ J O B S ~ ~ ~ ~ ~ ~ #
+# --------------------------------- #
+
+class Job(db.Model):
+    """
+    Background work queued in the database, such as filling in a work's
+    missing metadata or importing an uploaded ISBN file (its rows are the
+    payload). While a job runs, run_after is when its claim lapses.
+    """
+    __tablename__ = 'jobs'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(50), nullable=False)
+    work_id = Column(Integer, ForeignKey('works.id', ondelete='CASCADE'), index=True)
+    status = Column(String(20), nullable=False, default='queued')
+    attempts = Column(Integer, nullable=False, default=0)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    payload = Column(Text)
+    result = Column(Text)
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+
+    work = relationship('Work', back_populates='jobs')
+
+    __table_args__ = (Index('ix_jobs_status_run_after', 'status', 'run_after'),)
+
 
 # --------------------------------- #
 # ~ ~ ~ ~ F U N C T I O N S ~ ~ ~ ~ #
 # --------------------------------- #
 
+def _index_names(engine):
+    """Names of the indexes in the database"""
+    # SQLAlchemy doesn't reflect SQLite's expression indexes, so ask SQLite directly
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            return set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+    inspector = inspect(engine)
+    return {index['name'] for table in inspector.get_table_names() for index in inspector.get_indexes(table)}
+
+
+def _add_missing_columns(engine):
+    """
+    Add columns declared since a table was created. They are added nullable
+    and filled with their default, since SQLite can't add a NOT NULL column
+    without a constant default.
+    """
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                if column.default is not None:
+                    value = column.default.arg(None) if column.default.is_callable else column.default.arg
+                    conn.execute(table.update().values({column.name: value}))
+
+
+def _convert_isbn_column(engine):
+    """
+    Turn works.isbn from the number it used to be into ISBN-13 text. SQLite
+    can't change a column's type, so there the table is copied.
+    """
+    from services import isbn
+
+    column = next((c for c in inspect(engine).get_columns('works') if c['name'] == 'isbn'), None)
+    if column is None or isinstance(column['type'], String):
+        return
+
+    works = Work.__table__
+    with engine.begin() as conn:
+        if engine.dialect.name == 'sqlite':
+            names = ', '.join(column.name for column in works.columns)
+            conn.execute(CreateTable(works.to_metadata(MetaData(), name='works_new')))
+            conn.execute(text(f'INSERT INTO works_new ({names}) SELECT {names} FROM works'))
+            conn.execute(text('DROP TABLE works'))
+            conn.execute(text('ALTER TABLE works_new RENAME TO works'))
+        else:
+            conn.execute(text('ALTER TABLE works ALTER COLUMN isbn TYPE VARCHAR(13) USING isbn::text'))
+
+        # ISBN-10s lost their leading zeros as numbers; store every ISBN as its ISBN-13.
+        # If a book was in twice, as its ISBN-10 and its ISBN-13, the second keeps its old digits
+        values = dict(conn.execute(select(works.c.id, works.c.isbn).where(works.c.isbn.isnot(None))).all())
+        taken = {value for value in values.values() if isbn.canonical(value) == value}
+        changes = []
+        for id, value in values.items():
+            canonical = isbn.stored(value)
+            if isbn.canonical(canonical) is None:
+                logger.warning('Work %s: ISBN %s is not a valid ISBN, stored as %s', id, value, canonical)
+            elif canonical != value and canonical in taken:
+                logger.warning('Work %s: ISBN %s is already another work\'s ISBN-13 %s, kept as it is',
+                               id, value, canonical)
+                continue
+            if canonical != value:
+                taken.add(canonical)
+                changes.append({'work_id': id, 'canonical': canonical})
+        if changes:
+            conn.execute(
+                works.update().where(works.c.id == bindparam('work_id')).values(isbn=bindparam('canonical')),
+                changes
+            )
+
+
+def _convert_isbn_cache(engine):
+    """
+    Key cached lookups by ISBN-13, like works. Rows keyed by an ISBN-10 are
+    moved to its ISBN-13 unless that is cached already, and rows whose key
+    isn't an ISBN at all are dropped, since nothing can look them up.
+    """
+    from services import isbn
+
+    cache = IsbnCache.__table__
+    with engine.begin() as conn:
+        keys = conn.execute(select(cache.c.isbn).where(func.length(cache.c.isbn) != 13)).scalars().all()
+        if not keys:
+            return
+        taken = set(conn.execute(select(cache.c.isbn).where(func.length(cache.c.isbn) == 13)).scalars())
+        moves, dropped = [], []
+        for key in keys:
+            canonical = isbn.canonical(isbn.stored(key))
+            if canonical is None or canonical in taken:
+                dropped.append(key)
+            else:
+                taken.add(canonical)
+                moves.append({'old': key, 'canonical': canonical})
+        if moves:
+            conn.execute(cache.update().where(cache.c.isbn == bindparam('old')).values(isbn=bindparam('canonical')), moves)
+        for i in range(0, len(dropped), 500):
+            conn.execute(cache.delete().where(cache.c.isbn.in_(dropped[i:i + 500])))
+        logger.info('ISBN cache: %d entries moved to their ISBN-13, %d dropped', len(moves), len(dropped))
+
+
 def create_tables(engine):
     db.create_all()
+    _add_missing_columns(engine)
+    _convert_isbn_column(engine)
+    _convert_isbn_cache(engine)
+
+    # create_all skips tables that already exist, so add any indexes declared since
+    existing = _index_names(engine)
+    created = False
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+                created = True
+
+    # Refresh planner statistics so the new indexes get used, on SQLite especially
+    if created:
+        with engine.begin() as conn:
+            conn.execute(text('ANALYZE'))
 
 
 def get_works_by_author(session, author_name):
@@ -1,110 +1,105 @@
-from flask import Blueprint, request, jsonify
+import io
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
+from flask_login import login_required
 from models import db
-from models.models import Work, Copy, Author, Tag, Location
-from sqlalchemy import or_, cast, String
-from fuzzywuzzy import fuzz
-import requests
+from models.models import Work, Author, AuthorName, Tag, Location, Job
+from sqlalchemy import func
+from services import isbn_cache, isbn_providers, importer, search, fuzzy_index, typeahead, versions, serialize, export, jobs, projections
+from services.isbn import canonical as canonical_isbn
+from routes.users import admin_required
 
 api_bp = Blueprint('api', __name__)
 
+# Most results a streamed (NDJSON) search returns, and works projected per query
+SEARCH_STREAM_LIMIT = 10000
+SEARCH_BATCH = 500
+
 @api_bp.route('/search')
+@versions.conditional('works', 'authors', 'author_names', 'tags', 'copies', 'locations', 'covers', negotiated=True)
 def api_search():
     query = request.args.get('q', '').strip()
+    streaming = serialize.wants_ndjson()
+    limit = min(request.args.get('limit', 50, type=int), SEARCH_STREAM_LIMIT if streaming else 200)
     
     if not query:
         return jsonify({'books': []})
     
     try:
-        print(f"Search query: '{query}'")
-        
-        search_conditions = []
-        
-        # Direct field searches with proper casting
-        search_conditions.extend([
-            Book.title.ilike(f'%{query}%'),
-            cast(Book.isbn, String).ilike(f'%{query}%'),
-            Book.description.ilike(f'%{query}%')
-        ])
-        
-        # Relationship searches
-        search_conditions.extend([
-            Book.authors.any(Author.name.ilike(f'%{query}%')),
-            Book.tags.any(Tag.label.ilike(f'%{query}%')),
-            Book.location.has(Location.name.ilike(f'%{query}%'))
-        ])
-        
-        # Combine with OR
-        search_filter = or_(*search_conditions)
-        
-        books = Book.query.filter(search_filter).all()
-        print(f"Found {len(books)} books")
-        
-        book_list = []
-        for book in books:
-            try:
-                book_data = {
-                    'id': book.id,
-                    'title': book.title or '',
-                    'isbn': book.isbn or '',
-                    'description': book.description or '',
-                    'cover_url': book.cover_url or '',
-                    'authors': [{'id': a.id, 'name': a.name} for a in (book.authors or [])],
-                    'tags': [{'id': t.id, 'label': t.label} for t in (book.tags or [])],
-                    'location': {'id': book.location.id, 'name': book.location.name} if book.location else None
-                }
-                book_list.append(book_data)
-            except Exception as e:
-                print(f"Error processing book {book.id}: {e}")
-                continue
-        
-        print(f"Returning {len(book_list)} processed books")
-        return jsonify({'books': book_list})
+        work_ids = search.search(query, limit=limit)
+
+        # A scanned ISBN goes straight to its work, and a partly typed one lists its matches first
+        isbn_ids = search.isbn_matches(query, limit=limit)
+        if isbn_ids:
+            seen = set(isbn_ids)
+            work_ids = (isbn_ids + [id for id in work_ids if id not in seen])[:limit]
         
     except Exception as e:
-        print(f"Search error: {e}")
         return jsonify({'error': str(e), 'books': []}), 500
 
+    return serialize.stream(_search_results(work_ids), 'books')
+
+
+def _search_results(work_ids):
+    """Result dicts for ranked work ids, projected a batch at a time so memory stays flat"""
+    for start in range(0, len(work_ids), SEARCH_BATCH):
+        yield from projections.work_results(db.session.connection(), work_ids[start:start + SEARCH_BATCH])
+
+
+@api_bp.route('/typeahead/<source>')
+@login_required
+@versions.conditional('works', 'authors', 'author_names', 'tags', 'locations', 'users')
+def typeahead_suggest(source):
+    """Works, authors, tags, locations or users whose name starts with q"""
+    if source not in typeahead.SOURCES:
+        return jsonify({'success': False, 'error': f'Unknown source: {source}'}), 404
+
+    try:
+        results = typeahead.suggest(source, request.args.get('q', ''), request.args.get('limit', type=int))
+        return jsonify({
+            'success': True,
+            'results': [{'id': id, 'label': label} for id, label in results]
+        })
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 
 @api_bp.route('/isbn-lookup/<isbn>')
 def isbn_lookup(isbn):
     """Look up book information by ISBN"""
+    # A mistyped or misread ISBN never costs a lookup
+    isbn = canonical_isbn(isbn)
+    if isbn is None:
+        return jsonify({'success': False, 'error': 'Not a valid ISBN'}), 400
+
     try:
-        # Try Google Books API first
-        google_url = f"https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}"
-        response = requests.get(google_url, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('items'):
-                book = data['items'][0]['volumeInfo']
-                return jsonify({
-                    'success': True,
-                    'title': book.get('title', ''),
-                    'authors': book.get('authors', []),
-                    'description': book.get('description', ''),
-                    'cover_url': book.get('imageLinks', {}).get('thumbnail', '').replace('http:', 'https:'),
-                    'categories': book.get('categories', [])
-                })
-        
-        # Fallback to Open Library
-        openlibrary_url = f"https://openlibrary.org/api/books?bibkeys=ISBN:{isbn}&format=json&jscmd=data"
-        response = requests.get(openlibrary_url, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            book_key = f"ISBN:{isbn}"
-            if data.get(book_key):
-                book = data[book_key]
-                return jsonify({
-                    'success': True,
-                    'title': book.get('title', ''),
-                    'authors': [a['name'] for a in book.get('authors', [])],
-                    'description': book.get('notes', '') or book.get('subtitle', ''),
-                    'cover_url': book.get('cover', {}).get('medium', ''),
-                    'categories': [s['name'] for s in book.get('subjects', [])]
-                })
-        
-        return jsonify({'success': False, 'error': 'Book not found'})
+        cached = isbn_cache.get_cached(isbn)
+        if cached is not None:
+            return jsonify(cached)
+
+        # The offline mirror answers if it has the ISBN; otherwise Google Books
+        # and Open Library are queried together. "Not found" is only cached
+        # when every provider actually answered.
+        lookup = isbn_providers.lookup(
+            isbn,
+            timeout=current_app.config['ISBN_LOOKUP_TIMEOUT'],
+            merge_budget=current_app.config['ISBN_MERGE_BUDGET']
+        )
+
+        if lookup.data:
+            if not lookup.local:
+                isbn_cache.store(isbn, lookup.data, lookup.provider)
+            response = jsonify(dict(lookup.data, success=True, provider=lookup.provider,
+                                    cached=False, timings=lookup.timings))
+        else:
+            if lookup.conclusive:
+                isbn_cache.store(isbn, None)
+            response = jsonify({'success': False, 'error': 'Book not found', 'timings': lookup.timings})
+
+        response.headers['Server-Timing'] = ', '.join(
+            f'{name};dur={duration}' for name, duration in lookup.timings.items() if duration is not None
+        )
+        return response
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
@@ -119,44 +114,16 @@ def search_authors():
         if not search_name:
             return jsonify({'success': False, 'error': 'Name is required'})
         
-        # Get all authors with their alternate names
-        authors = db.session.query(Author).all()
-        matches = []
-        print(authors)
-        for author in authors:
-            print(author)
-            # Check primary name with multiple methods
-            primary_ratio = fuzz.ratio(search_name.lower(), author.primary_name.lower())
-            primary_partial = fuzz.partial_ratio(search_name.lower(), author.primary_name.lower())
-            primary_token_sort = fuzz.token_sort_ratio(search_name.lower(), author.primary_name.lower())
-            
-            # Use the best score from all methods
-            primary_score = max(primary_ratio, primary_partial, primary_token_sort)
-            
-            # Check alternate names
-            alt_scores = []
-            for alt_name in author.alt_names:
-                alt_ratio = fuzz.ratio(search_name.lower(), alt_name.alt_name.lower())
-                alt_partial = fuzz.partial_ratio(search_name.lower(), alt_name.alt_name.lower())
-                alt_token_sort = fuzz.token_sort_ratio(search_name.lower(), alt_name.alt_name.lower())
-                alt_scores.append(max(alt_ratio, alt_partial, alt_token_sort))
-            
-            # Use the best score across all names
-            best_score = max([primary_score] + alt_scores) if alt_scores else primary_score
-
-            if best_score >= 70:  # Threshold for similarity
-                matches.append({
-                    'id': author.id,
-                    'name': author.primary_name,
-                    'score': best_score
-                })
-        
-        # Sort by score and return top 2
-        matches.sort(key=lambda x: x['score'], reverse=True)
+        # Score against the in-memory index of primary and alternate names
+        scores = fuzzy_index.authors.search(search_name, score_cutoff=70, limit=2)
+        names = dict(db.session.query(Author.id, Author.primary_name).filter(
+            Author.id.in_([id for id, _ in scores])
+        ).all())
+        matches = [{'id': id, 'name': names[id], 'score': score} for id, score in scores if id in names]
         
         return jsonify({
             'success': True,
-            'matches': matches[:2]
+            'matches': matches
         })
         
     except Exception as e:
@@ -198,6 +165,91 @@ def create_author():
         return jsonify({'success': False, 'error': str(e)})
 
 
+def _batch_items(data, key, field):
+    """Read a batch payload, where each item is either a string or a dict with the given field"""
+    items = []
+    seen = set()
+    for item in (data or {}).get(key, []):
+        if isinstance(item, str):
+            item = {field: item}
+        value = (item.get(field) or '').strip()
+        if value and value.lower() not in seen:
+            seen.add(value.lower())
+            items.append(dict(item, **{field: value}))
+    return items
+
+
+@api_bp.route('/authors/batch', methods=['POST'])
+def batch_authors():
+    """
+    Match many author names at once, exactly or fuzzily, creating the ones
+    that match nothing. A name close to an existing author isn't created;
+    its result lists the matches for the user to pick from instead.
+    """
+    try:
+        data = request.get_json()
+        items = _batch_items(data, 'authors', 'name')
+        create = data.get('create', True)
+
+        if not items:
+            return jsonify({'success': False, 'error': 'Authors are required'})
+
+        # Exact matches on primary or alternate names, case-insensitively
+        lowered = [item['name'].lower() for item in items]
+        existing = {}
+        for id, name in db.session.query(AuthorName.author_id, AuthorName.alt_name).filter(
+            func.lower(AuthorName.alt_name).in_(lowered)
+        ):
+            existing[name.lower()] = id
+        for id, name in db.session.query(Author.id, Author.primary_name).filter(
+            func.lower(Author.primary_name).in_(lowered)
+        ):
+            existing[name.lower()] = id
+
+        # Close matches for the rest, against the in-memory index
+        matches = {
+            item['name'].lower(): fuzzy_index.authors.search(item['name'], score_cutoff=70, limit=2)
+            for item in items if item['name'].lower() not in existing
+        }
+
+        created = {}
+        if create:
+            for item in items:
+                name = item['name'].lower()
+                if name in matches and not matches[name]:
+                    author = Author(primary_name=item['name'], bio=item.get('bio') or None)
+                    db.session.add(author)
+                    created[name] = author
+        if created:
+            # Ids are read before the commit expires the new authors
+            db.session.flush()
+            created = {name: author.id for name, author in created.items()}
+            existing.update(created)
+            db.session.commit()
+
+        match_ids = {id for scores in matches.values() for id, _ in scores}
+        names = dict(db.session.query(Author.id, Author.primary_name).filter(
+            Author.id.in_(set(existing.values()) | match_ids)
+        ))
+
+        results = []
+        for item in items:
+            id = existing.get(item['name'].lower())
+            result = {'input': item['name'], 'id': id, 'name': names.get(id), 'created': item['name'].lower() in created}
+            if id is None:
+                result['matches'] = [
+                    {'id': match_id, 'name': names.get(match_id), 'score': score}
+                    for match_id, score in matches[item['name'].lower()]
+                ]
+            results.append(result)
+
+        return jsonify({'success': True, 'authors': results})
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+
 @api_bp.route('/tags/search', methods=['POST'])
 def search_tags():
     """Find similar tags using fuzzy matching"""
@@ -208,33 +260,14 @@ def search_tags():
         if not search_label:
             return jsonify({'success': False, 'error': 'Label is required'})
         
-        # Get all tags
-        tags = db.session.query(Tag).all()
-        matches = []
-        
-        for tag in tags:
-            # Use multiple fuzzy matching methods
-            ratio_score = fuzz.ratio(search_label.lower(), tag.label.lower())
-            partial_score = fuzz.partial_ratio(search_label.lower(), tag.label.lower())
-            token_sort_score = fuzz.token_sort_ratio(search_label.lower(), tag.label.lower())
-            
-            # Use the best score from all methods
-            best_score = max(ratio_score, partial_score, token_sort_score)
-            
-            if best_score >= 70:  # Threshold for similarity
-                matches.append({
-                    'id': tag.id,
-                    'label': tag.label,
-                    'type': tag.type,
-                    'score': best_score
-                })
-        
-        # Sort by score and return top 2
-        matches.sort(key=lambda x: x['score'], reverse=True)
+        scores = fuzzy_index.tags.search(search_label, score_cutoff=70, limit=2)
+        tags = {tag.id: tag for tag in db.session.query(Tag).filter(Tag.id.in_([id for id, _ in scores]))}
+        matches = [{'id': id, 'label': tags[id].label, 'type': tags[id].type, 'score': score}
+                   for id, score in scores if id in tags]
         
         return jsonify({
             'success': True,
-            'matches': matches[:2]
+            'matches': matches
         })
         
     except Exception as e:
@@ -275,4 +308,144 @@ def create_tag():
         
     except Exception as e:
         db.session.rollback()
-        return jsonify({'success': False, 'error': str(e)})
\ No newline at end of file
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@api_bp.route('/tags/batch', methods=['POST'])
+def batch_tags():
+    """
+    Match many tag labels at once, exactly or fuzzily, creating the ones
+    that match nothing. A label close to an existing tag isn't created;
+    its result lists the matches for the user to pick from instead.
+    """
+    try:
+        data = request.get_json()
+        items = _batch_items(data, 'tags', 'label')
+        create = data.get('create', True)
+
+        if not items:
+            return jsonify({'success': False, 'error': 'Tags are required'})
+
+        lowered = [item['label'].lower() for item in items]
+        existing = {
+            label.lower(): (id, label, type)
+            for id, label, type in db.session.query(Tag.id, Tag.label, Tag.type).filter(func.lower(Tag.label).in_(lowered))
+        }
+        matches = {
+            item['label'].lower(): fuzzy_index.tags.search(item['label'], score_cutoff=70, limit=2)
+            for item in items if item['label'].lower() not in existing
+        }
+
+        created = {}
+        if create:
+            for item in items:
+                label = item['label'].lower()
+                if label in matches and not matches[label]:
+                    tag = Tag(
+                        label=item['label'],
+                        type=(item.get('type') or 'genre').strip(),
+                        description=item.get('description') or None
+                    )
+                    db.session.add(tag)
+                    created[label] = tag
+        if created:
+            # Ids are read before the commit expires the new tags
+            db.session.flush()
+            created = {label: (tag.id, tag.label, tag.type) for label, tag in created.items()}
+            existing.update(created)
+            db.session.commit()
+
+        match_ids = {id for scores in matches.values() for id, _ in scores}
+        matched = {}
+        if match_ids:
+            matched = {id: (label, type) for id, label, type in
+                       db.session.query(Tag.id, Tag.label, Tag.type).filter(Tag.id.in_(match_ids))}
+
+        results = []
+        for item in items:
+            id, label, type = existing.get(item['label'].lower(), (None, None, None))
+            result = {
+                'input': item['label'],
+                'id': id,
+                'label': label,
+                'type': type,
+                'created': item['label'].lower() in created
+            }
+            if id is None:
+                result['matches'] = [
+                    {'id': match_id, 'label': matched[match_id][0], 'type': matched[match_id][1], 'score': score}
+                    for match_id, score in matches[item['label'].lower()] if match_id in matched
+                ]
+            results.append(result)
+
+        return jsonify({'success': True, 'tags': results})
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@api_bp.route('/import', methods=['POST'])
+@login_required
+def bulk_import():
+    """
+    Queue a bulk import of an uploaded file of ISBNs. It runs as a background
+    job, since a big file takes longer than a request may; its report is the
+    job's result at /api/jobs/<id>.
+    """
+    try:
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({'success': False, 'error': 'File is required'})
+
+        rows = importer.read_isbn_file(io.TextIOWrapper(upload.stream, encoding='utf-8-sig'))
+        job = jobs.enqueue_import(rows, default_location=request.form.get('location'))
+
+        return jsonify({'success': True, 'rows': len(rows), 'job': jobs.describe(job)}), 202
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@api_bp.route('/export')
+@login_required
+@admin_required
+def export_library():
+    """Download the whole library, gzipped, as it's read from the database"""
+    format = request.args.get('format', 'ndjson')
+    entity = request.args.get('entity') or None
+    try:
+        chunks = export.chunks(format, entity)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    return Response(
+        stream_with_context(serialize.gzipped(chunks)),
+        mimetype='application/gzip',
+        headers={'Content-Disposition': f'attachment; filename={export.filename(format, entity)}'}
+    )
+
+
+@api_bp.route('/jobs')
+@login_required
+def job_counts():
+    """How many background jobs are queued, running, done and failed"""
+    return jsonify({'success': True, 'jobs': jobs.counts()})
+
+
+@api_bp.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    """One background job, such as a queued import, and its result once done"""
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': jobs.describe(job)})
+
+
+@api_bp.route('/works/<int:work_id>/enrichment')
+def work_enrichment(work_id):
+    """Progress of filling in a work's missing details, for the work page to poll"""
+    job = jobs.latest(work_id)
+    return jsonify({'success': True, 'job': jobs.describe(job) if job else None})
@@ -3,19 +3,22 @@ from flask_login import login_required
 from models import db
 from models.models import Author, AuthorName
 from forms.forms import AuthorForm
+from services import loaders, versions
 
 authors_bp = Blueprint('authors', __name__)
 
 # Author main page - lists all authors
 @authors_bp.route('/')
+@versions.conditional('authors', 'works')
 def author_list():
-    authors = db.session.query(Author).all()
+    authors = db.session.query(Author).options(*loaders.AUTHOR_LIST).all()
     return render_template('author_list.html', authors=authors)
 
 # Author detail page
 @authors_bp.route('/<int:id>')
+@versions.conditional('works', 'tags', row=Author)
 def author_detail(id):
-    author = db.session.query(Author).get(id)
+    author = db.session.query(Author).options(*loaders.AUTHOR_DETAIL).get(id)
     return render_template('author_detail.html', author=author)
 
 # Add author
@@ -51,7 +54,7 @@ def author_add():
 @authors_bp.route('/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def author_edit(id):
-    author = db.session.query(Author).get(id)
+    author = db.session.query(Author).options(*loaders.AUTHOR_EDIT).get(id)
     form = AuthorForm()
     
     if request.method == 'GET':
@@ -59,7 +62,6 @@ def author_edit(id):
         form.bio.data = author.bio
         # Pre-fill alt_names
         for alt_name in author.alt_names:
-            print(f'Adding alt {alt_name.alt_name}')
             form.alt_names.append_entry(alt_name.alt_name)
 
     if form.validate_on_submit():
@@ -70,7 +72,7 @@ def author_edit(id):
         # TODO: Handle alternative names
 
         flash('Author updated successfully!', 'success')
-        return redirect(url_for('authors.author_detail', id=author.id))
+        return redirect(url_for('authors.author_detail', id=id))
     
     return render_template('author_form.html', form=form, title='Edit Author')
 
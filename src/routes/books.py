@@ -1,47 +1,150 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort
 from flask_login import login_required, current_user
+from sqlalchemy import select, nulls_last
+from sqlalchemy.orm import contains_eager, selectinload, defer, undefer
 from models import db
-from models.models import Work, Copy, Author, AuthorName, Tag, Location, User
+from models.models import Work, Copy, Author, AuthorName, Tag, Location, User, works_authors, works_tags
 from forms.forms import WorkForm, CopyForm, BookForm
+from services import hierarchy, loaders, versions, jobs
+from services.pagination import paginate, estimate_count
 
 books_bp = Blueprint('books', __name__)
 
+# Sort name: (keys ending in a unique one, descending)
+WORK_SORTS = {
+    'title': ((Work.title, Work.id), False),
+    'added': ((Work.id,), True)
+}
+
+# Sorting on a joined column also orders by the joined row's id, so the
+# database can walk the name index and then each row's copies in id order
+COPY_SORTS = {
+    'acquired': ((Copy.acquired, Copy.id), True),
+    'title': ((Work.title, Work.id, Copy.id), False),
+    'location': ((Location.name, Location.id, Copy.id), False),
+    'owner': ((nulls_last(User.name), Copy.id), False)
+}
+
+def filtered_works():
+    """Works query narrowed by the request's author and tag filters, and the filters applied"""
+    query = db.session.query(Work)
+    filters = []
+
+    author = db.session.get(Author, request.args.get('author', type=int) or 0)
+    if author:
+        query = query.filter(Work.id.in_(select(works_authors.c.works_id).where(works_authors.c.authors_id == author.id)))
+        filters.append(('author', f'Author: {author.primary_name}'))
+
+    tag = db.session.get(Tag, request.args.get('tag', type=int) or 0)
+    if tag:
+        query = query.filter(Work.id.in_(select(works_tags.c.works_id).where(works_tags.c.tags_id == tag.id)))
+        filters.append(('tag', f'Tag: {tag.label}'))
+
+    return query, filters
+
+def filtered_copies():
+    """Copies query narrowed by the request's location, owner, work and lent filters, and the filters applied"""
+    query = db.session.query(Copy).join(Copy.work).join(Copy.location)
+    filters = []
+
+    # Sorting by owner lists the copies without one last
+    if request.args.get('sort') == 'owner':
+        query = query.outerjoin(User, Copy.owner_id == User.id)
+
+    location = db.session.get(Location, request.args.get('location', type=int) or 0)
+    if location:
+        query = query.filter(Copy.location_id.in_(hierarchy.descendant_ids(Location, location.id)))
+        filters.append(('location', f'Location: {location.name}'))
+
+    owner = db.session.get(User, request.args.get('owner', type=int) or 0)
+    if owner:
+        query = query.filter(Copy.owner_id == owner.id)
+        filters.append(('owner', f'Owner: {owner.name}'))
+
+    work = db.session.get(Work, request.args.get('work', type=int) or 0)
+    if work:
+        query = query.filter(Copy.work_id == work.id)
+        filters.append(('work', f'Work: {work.title}'))
+
+    if request.args.get('lent'):
+        query = query.filter(Copy.lended_to.isnot(None))
+        filters.append(('lent', 'Lent out'))
+
+    return query, filters
+
+def page_of(query, sorts, sort, *load):
+    """Paginate a query by a named sort, reading the cursor from the request"""
+    keys, descending = sorts[sort]
+    return paginate(
+        query.options(*load), keys, descending,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        per_page=request.args.get('per_page', type=int)
+    )
+
+def requested_sort(sorts, default):
+    sort = request.args.get('sort', default)
+    return sort if sort in sorts else default
+
 # Main books page
 @books_bp.route('/')
+@versions.conditional('works', 'authors', 'copies', 'covers')
 def books():
-    works = db.session.query(Work).all()
-    copies = db.session.query(Copy).all()
-    return render_template('books.html', works=works, copies=copies)
+    works = page_of(db.session.query(Work), WORK_SORTS, 'added', *loaders.WORK_CARDS)
+    return render_template(
+        'books.html',
+        works=works,
+        works_total=estimate_count(Work),
+        copies_total=estimate_count(Copy)
+    )
 
 # Works
 @books_bp.route('/works')
+@versions.conditional('works', 'authors', 'tags', 'copies', 'covers')
 def work_list():
-    works = db.session.query(Work).all()
-    return render_template('work_list.html', works=works)
+    sort = requested_sort(WORK_SORTS, 'title')
+    query, filters = filtered_works()
+    page = page_of(query, WORK_SORTS, sort, *loaders.WORK_CARDS)
+    page.total = estimate_count(Work, query if filters else None)
+    return render_template('work_list.html', works=page, page=page, sort=sort, sorts=WORK_SORTS, filters=filters)
 
 # Work detail
 @books_bp.route('/<int:id>')
+@versions.conditional('authors', 'tags', 'covers', 'jobs', row=Work)
 def work_detail(id):
-    work = db.session.query(Work).get(id)
-    return render_template('work_detail.html', work=work)
+    work = db.session.query(Work).options(*loaders.WORK_DETAIL).get(id)
+    return render_template('work_detail.html', work=work, job=jobs.latest(id))
 
 # Copies list
 @books_bp.route('/copies')
+@versions.conditional('copies', 'works', 'authors', 'locations', 'users', 'covers')
 def copies_list():
-    copies = db.session.query(Copy).all()
-    return render_template('copies.html', copies=copies)
+    sort = requested_sort(COPY_SORTS, 'acquired')
+    query, filters = filtered_copies()
+    page = page_of(query, COPY_SORTS, sort,
+                   contains_eager(Copy.work).defer(Work.description),
+                   contains_eager(Copy.work).undefer(Work.summary),
+                   contains_eager(Copy.work).selectinload(Work.authors).defer(Author.bio),
+                   contains_eager(Copy.work).selectinload(Work.cover),
+                   contains_eager(Copy.location))
+    page.total = estimate_count(Copy, query if filters else None)
+    return render_template('copies.html', copies=page, page=page, sort=sort, sorts=COPY_SORTS, filters=filters)
 
 # Copies
 @books_bp.route('/<int:work_id>/copies')
+@versions.conditional('copies', 'authors', 'locations', 'covers', row=Work, key='work_id')
 def work_copies(work_id):
-    work = db.session.query(Work).get(work_id)
-    copies = db.session.query(Copy).filter_by(work_id=work_id).all()
+    work = db.session.query(Work).options(
+        defer(Work.description), undefer(Work.summary), selectinload(Work.authors).defer(Author.bio)
+    ).get(work_id)
+    copies = db.session.query(Copy).filter_by(work_id=work_id).options(*loaders.COPY_CARDS).all()
     return render_template('copies_list.html', work=work, copies=copies)
 
 # Copy detail
 @books_bp.route('/copies/<int:id>')
+@versions.conditional('works', 'authors', 'tags', 'locations', 'users', 'covers', row=Copy)
 def copy_detail(id):
-    copy = db.session.query(Copy).get(id)
+    copy = db.session.query(Copy).options(*loaders.COPY_DETAIL).get(id)
     return render_template('copy_detail.html', copy=copy)
 
 # Add a new book
@@ -68,8 +171,6 @@ def book_add():
 @login_required
 def work_add(isbn=None):
     form = WorkForm()
-    form.authors.choices = [(a.id, a.primary_name) for a in db.session.query(Author).all()]
-    form.tags.choices = [(t.id, t.label) for t in db.session.query(Tag).all()]
 
     # If coming from book_add with ISBN, prefill
     isbn = request.args.get('isbn')
@@ -102,24 +203,19 @@ def work_add(isbn=None):
 @books_bp.route('/copies/add/<int:work_id>', methods=['GET', 'POST'])
 @login_required
 def copy_add(work_id=None):
-    work = db.session.query(Work).get(work_id)
     form = CopyForm()
-    form.work.choices = [(w.id, w.title) for w in db.session.query(Work).all()]
-    form.location.choices = [(0, '-none-')] + [(l.id, l.name) for l in db.session.query(Location).all()]
-    form.owner.choices = [(0, '-none-')] + [(o.id, o.name) for o in db.session.query(User).all()]
-    form.lended_to.choices = [(0, '-none-')] + [(o.id, o.name) for o in db.session.query(User).all()]
 
     # Pre-select the work if work_id is provided
-    if work_id and work:
+    if work_id and not form.is_submitted():
         form.work.data = work_id
 
     if form.validate_on_submit():
         copy = Copy(
             work_id=form.work.data,
             location_id=form.location.data,
-            owner_id=form.owner.data if form.owner.data != 0 else None,
+            owner_id=form.owner.data,
             condition=form.condition.data,
-            lended_to=form.lended_to.data if form.lended_to.data != 0 else None
+            lended_to=form.lended_to.data
         )
         db.session.add(copy)
         db.session.commit()
@@ -132,14 +228,10 @@ def copy_add(work_id=None):
 @books_bp.route('/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def work_edit(id):
-    work = db.session.query(Work).get(id)
+    work = db.session.query(Work).options(*loaders.WORK_DETAIL).get(id)
     form = WorkForm(obj=work)
-    form.authors.choices = [(a.id, a.primary_name) for a in db.session.query(Author).all()]
-    form.tags.choices = [(t.id, t.label) for t in db.session.query(Tag).all()]
 
     if request.method == 'GET':
-        form.authors.data = [author.id for author in work.authors]
-        form.tags.data = [tag.id for tag in work.tags]
         form.publisher.data = work.publisher
 
     if form.validate_on_submit():
@@ -157,7 +249,7 @@ def work_edit(id):
         
         db.session.commit()
         flash('Book updated successfully!', 'success')
-        return redirect(url_for('books.work_detail', id=work.id))
+        return redirect(url_for('books.work_detail', id=id))
 
     return render_template('work_form.html', form=form, title='Edit Work')
 
@@ -165,12 +257,10 @@ def work_edit(id):
 @books_bp.route('/<int:work_id>/copies/<int:copy_id>/edit', methods=['GET', 'POST'])
 @login_required
 def copy_edit(work_id, copy_id):
-    work = Work.query.get_or_404(work_id)
-    copy = Copy.query.get_or_404(copy_id)
+    copy = db.session.query(Copy).options(*loaders.COPY_DETAIL).get(copy_id)
+    if copy is None:
+        abort(404)
     form = CopyForm(obj=copy)
-    form.work.choices = [(w.id, w.title) for w in Work.query.all()]
-    form.location.choices = [(l.id, l.name) for l in Location.query.all()]
-    form.owner.choices = [(o.id, o.name) for o in User.query.all()]
 
     if form.validate_on_submit():
         copy.work_id = form.work.data
@@ -181,7 +271,7 @@ def copy_edit(work_id, copy_id):
         
         db.session.commit()
         flash('Copy updated successfully!', 'success')
-        return redirect(url_for('books.copy_detail', work_id=work.id, copy_id=copy.id))
+        return redirect(url_for('books.copy_detail', id=copy_id))
 
     return render_template('copy_form.html', form=form, title='Edit Copy')
 
@@ -1,36 +1,42 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required
 from models import db
-from models.models import Location
+from models.models import Location, Copy
 from forms.forms import LocationForm
+from services import hierarchy, loaders, versions
+from services.pagination import paginate, estimate_count
 
 locations_bp = Blueprint('locations', __name__)
 
-def get_total_books(location):
-    """Recursively count all books in a location and its children"""
-    total = len(location.copies)
-    for child in location.children:
-        total += get_total_books(child)
-    return total
-
-def get_all_copies(location):
-    """Recursively get all copies from a location and its children"""
-    copies = list(location.copies)
-    for child in location.children:
-        copies.extend(get_all_copies(child))
-    return copies
+def get_all_copies(location_id):
+    """Get a page of the copies in a location and its children, newest first"""
+    query = db.session.query(Copy).filter(Copy.location_id.in_(hierarchy.descendant_ids(Location, location_id)))
+    page = paginate(
+        query.options(*loaders.COPY_CARDS), (Copy.acquired, Copy.id), descending=True,
+        after=request.args.get('after'), before=request.args.get('before')
+    )
+    page.total = estimate_count(Copy, query)
+    return page
 
 # Locations main route - shows all locations
 @locations_bp.route('/')
+@versions.conditional('locations', 'copies')
 def location_list():
-    locations = db.session.query(Location).all()
-    return render_template('location_list.html', locations=locations, get_total_books=get_total_books)
+    locations = hierarchy.build_tree(Location, Location.name, Copy.location_id)
+    return render_template('location_list.html', locations=locations)
 
 # Location detail
 @locations_bp.route('/<int:id>')
+@versions.conditional('locations', 'copies', 'works', 'authors', 'covers', row=Location)
 def location_detail(id):
     location = db.session.query(Location).get(id)
-    return render_template('location_detail.html', location=location, all_copies=get_all_copies(location))
+    return render_template(
+        'location_detail.html',
+        location=location,
+        path=hierarchy.ancestors(Location, Location.name, id),
+        children=hierarchy.build_tree(Location, Location.name, Copy.location_id, root_id=id),
+        all_copies=get_all_copies(id)
+    )
 
 # Add Location
 @locations_bp.route('/add', methods=['GET', 'POST'])
@@ -38,7 +44,7 @@ def location_detail(id):
 def location_add():
     parent_id = request.args.get('parent_id', type=int)
     form = LocationForm()
-    form.parent.choices = [(0, '-none-')] + [(loc.id, (loc.parent.name + " → " if loc.parent else "") + loc.name) for loc in db.session.query(Location).all()]
+    form.parent.choices = hierarchy.tree_choices(Location, Location.name)
 
     if parent_id and request.method == 'GET':
         form.parent.data = parent_id
@@ -63,19 +69,24 @@ def location_add():
 @locations_bp.route('/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def location_edit(id):
-    location = db.session.query(Location).get(id)
+    location = db.session.query(Location).options(*loaders.LOCATION_EDIT).get(id)
     form = LocationForm(obj=location)
-    form.parent.choices = [(0, '-none-')] + [(loc.id, loc.name) for loc in db.session.query(Location).filter(Location.id != id).all()]
+    form.parent.choices = hierarchy.tree_choices(Location, Location.name, exclude_id=id)
 
     if request.method == 'GET':
         form.name.data = location.name
         form.description.data = location.description
-        form.parent.data = location.parent.id if location.parent else 0
+        form.parent.data = location.parent_id or 0
         form.type.data = location.type
 
     if form.validate_on_submit():
         if form.parent.data == 0:
             form.parent.data = None
+
+        if hierarchy.would_create_cycle(Location, location.id, form.parent.data):
+            flash('A location cannot be moved inside itself.', 'danger')
+            return render_template('location_form.html', form=form, title='Edit Location')
+
         location.name = form.name.data
         location.description = form.description.data
         location.parent_id = form.parent.data
@@ -95,4 +106,4 @@ def location_delete(id):
     db.session.delete(location)
     db.session.commit()
     flash('Location deleted successfully!', 'success')
-    return redirect(url_for('locations.location_list'))
\ No newline at end of file
+    return redirect(url_for('locations.location_list'))
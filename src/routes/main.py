@@ -1,13 +1,15 @@
 from flask import Blueprint, render_template
 from models.models import Copy
 from models import db
+from services import loaders, versions
 
 main_bp = Blueprint('main', __name__)
 
 # Index page
 @main_bp.route('/')
+@versions.conditional('copies', 'works', 'authors', 'locations', 'covers')
 def index():
-    books = db.session.query(Copy).order_by(Copy.acquired.desc()).limit(10).all()
+    books = db.session.query(Copy).options(*loaders.COPY_CARDS).order_by(Copy.acquired.desc()).limit(10).all()
     return render_template('index.html', books=books)
 
 # Search page
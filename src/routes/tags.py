@@ -1,20 +1,23 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required
 from models import db
-from models.models import Tag
+from models.models import Tag, works_tags
 from forms.forms import TagForm
+from services import hierarchy, loaders, versions
 
 tags_bp = Blueprint('tags', __name__)
 
 @tags_bp.route('/')
+@versions.conditional('tags', 'works')
 def tag_list():
-    tags = db.session.query(Tag).all()
+    tags = hierarchy.build_tree(Tag, Tag.label, works_tags.c.tags_id)
     return render_template('tag_list.html', tags=tags)
 
 # Tag detail view
 @tags_bp.route('/<int:id>')
+@versions.conditional('tags', 'works', 'authors', row=Tag)
 def tag_detail(id):
-    tag = db.session.query(Tag).get(id)
+    tag = db.session.query(Tag).options(*loaders.TAG_DETAIL).get(id)
     return render_template('tag_detail.html', tag=tag)
 
 # Add Tag
@@ -22,7 +25,7 @@ def tag_detail(id):
 @login_required
 def tag_add():
     form = TagForm()
-    form.parent.choices = [(0, '-none-')] + [(tag.id, tag.label) for tag in db.session.query(Tag).all()]
+    form.parent.choices = hierarchy.tree_choices(Tag, Tag.label)
     
     if form.validate_on_submit():
         if form.parent.data == 0:
@@ -44,17 +47,24 @@ def tag_add():
 @tags_bp.route('/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def tag_edit(id):
-    tag = db.session.query(Tag).get(id)
+    tag = db.session.query(Tag).options(*loaders.TAG_EDIT).get(id)
     form = TagForm(obj=tag)
-    form.parent.choices = [(0, '-none-')] + [(tag.id, tag.label) for tag in db.session.query(Tag).all()]
+    form.parent.choices = hierarchy.tree_choices(Tag, Tag.label, exclude_id=id)
 
     if request.method == 'GET':
         form.label.data = tag.label
         form.description.data = tag.description
-        form.parent.data = tag.parent.id if tag.parent else None
+        form.parent.data = tag.parent_id or 0
         form.type.data = tag.type
         
     if form.validate_on_submit():
+        if form.parent.data == 0:
+            form.parent.data = None
+
+        if hierarchy.would_create_cycle(Tag, tag.id, form.parent.data):
+            flash('A tag cannot be moved inside itself.', 'danger')
+            return render_template('tag_form.html', form=form, title='Edit Tag')
+
         tag.label = form.label.data
         tag.description = form.description.data
         tag.parent_id = form.parent.data
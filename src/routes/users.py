@@ -4,6 +4,7 @@ from datetime import datetime
 from models import db
 from models.models import User, UserRole
 from forms.forms import UserForm
+from services import loaders, versions
 
 users_bp = Blueprint('users', __name__)
 
@@ -21,8 +22,9 @@ def admin_required(f):
 @users_bp.route('/')
 @login_required
 @admin_required
+@versions.conditional('users', 'copies')
 def user_list():
-    users = db.session.query(User).all()
+    users = db.session.query(User).options(*loaders.USER_LIST).all()
     return render_template('user_list.html', users=users)
 
 # User detail
@@ -0,0 +1,296 @@
+import hashlib
+import ipaddress
+import os
+import re
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urljoin, urlsplit
+from flask import current_app, has_app_context, url_for, send_file, abort
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import db
+from models.models import Work, Cover
+from services import thumbnails
+
+# Name: box the image is shrunk to fit, None for the original
+SIZES = {
+    'thumb': (240, 360),
+    'full': None
+}
+
+# Covers are served forever; a different image gets a different digest
+MAX_AGE = 60 * 60 * 24 * 365
+
+# Largest image downloaded, in bytes
+MAX_BYTES = 10 * 1024 * 1024
+
+# Redirects followed to a cover, each checked like the first address
+MAX_REDIRECTS = 5
+
+# How long a failed download waits before it's tried again
+RETRY_AFTER = timedelta(days=1)
+
+_DIGEST = re.compile(r'[0-9a-f]{64}')
+
+_lock = threading.Lock()
+_pending = set()
+_fetchers = None
+_thumbnailers = None
+_session = None
+
+
+def _pools():
+    """The download threads and the thumbnail processes, started on first use"""
+    global _fetchers, _thumbnailers
+    with _lock:
+        if _fetchers is None:
+            _fetchers = ThreadPoolExecutor(current_app.config['COVER_FETCH_WORKERS'], thread_name_prefix='covers')
+        if _thumbnailers is None and thumbnails.available():
+            # The workers only run Pillow; they never touch the app's threads or connections
+            _thumbnailers = ProcessPoolExecutor(current_app.config['COVER_THUMBNAIL_WORKERS'])
+    return _fetchers, _thumbnailers
+
+
+def _http():
+    """The download session, built on first use so starting the app doesn't import requests"""
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+            _session = requests.Session()
+            _session.headers['User-Agent'] = 'bookshelf (self-hosted home library)'
+    return _session
+
+
+def path(digest, size):
+    """Where a stored cover of a size lives on disk"""
+    directory = os.path.join(current_app.config['COVER_DIR'], digest[:2])
+    return os.path.join(directory, f'{digest}-{size}')
+
+
+def schedule(url):
+    """Fetch a cover in the background, unless it's already stored or on its way"""
+    if not url or not url.startswith(('http://', 'https://')):
+        return
+    with _lock:
+        if url in _pending:
+            return
+        _pending.add(url)
+    fetchers, _ = _pools()
+    fetchers.submit(_fetch_in_context, current_app._get_current_object(), url)
+
+
+def _fetch_in_context(app, url):
+    try:
+        with app.app_context():
+            fetch(url)
+    except Exception:
+        app.logger.exception('Fetching cover %s failed', url)
+    finally:
+        with _lock:
+            _pending.discard(url)
+
+
+def fetch(url, force=False):
+    """Download, store and thumbnail one cover, recording the outcome; returns the Cover"""
+    cover = db.session.get(Cover, url)
+    if cover is not None and not force:
+        if cover.digest and os.path.exists(path(cover.digest, 'full')):
+            return cover
+        if cover.error and cover.fetched_at > datetime.utcnow() - RETRY_AFTER:
+            return cover
+
+    digest, content_type, error = None, None, None
+    try:
+        digest, content_type = _download(url)
+        _make_sizes(digest)
+    except Exception as e:
+        error = str(e)
+
+    if cover is None:
+        cover = Cover(url=url)
+        db.session.add(cover)
+    cover.digest = digest
+    cover.content_type = content_type
+    cover.error = error
+    cover.fetched_at = datetime.utcnow()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another process stored it first
+        db.session.rollback()
+        cover = db.session.get(Cover, url)
+    return cover
+
+
+def check_url(url):
+    """
+    Refuse a cover address that isn't http(s) or whose host resolves to
+    this box or a private network. Cover URLs come from users and lookups,
+    and the server fetches them, so they mustn't reach what only it can.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError(f'Not a web address: {url}')
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, parts.port or parts.scheme, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f'Unknown host: {parts.hostname}') from e
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f'Not a public address: {parts.hostname}')
+
+
+def _get(url):
+    """GET an image, following redirects only to addresses that pass check_url"""
+    timeout = current_app.config['COVER_FETCH_TIMEOUT']
+    for _ in range(MAX_REDIRECTS + 1):
+        check_url(url)
+        response = _http().get(url, timeout=timeout, stream=True, allow_redirects=False)
+        if not response.is_redirect:
+            return response
+        response.close()
+        url = urljoin(url, response.headers['Location'])
+    raise ValueError('Too many redirects')
+
+
+def _download(url):
+    """Save the image at url under its digest and return (digest, content type)"""
+    with _get(url) as response:
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+        if not content_type.startswith('image/'):
+            raise ValueError(f'Not an image: {content_type or "no content type"}')
+
+        data = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            data += chunk
+            if len(data) > MAX_BYTES:
+                raise ValueError('Image too large')
+
+    digest = hashlib.sha256(data).hexdigest()
+    target = path(digest, 'full')
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        partial = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(partial, 'wb') as file:
+            file.write(data)
+        os.replace(partial, target)
+    return digest, content_type
+
+
+def _make_sizes(digest):
+    """Write the thumbnails of a stored original, in the process pool"""
+    _, thumbnailers = _pools()
+    if thumbnailers is None:
+        return
+    source = path(digest, 'full')
+    jobs = [
+        thumbnailers.submit(thumbnails.make_thumbnail, source, path(digest, size), box)
+        for size, box in SIZES.items()
+        if box is not None and not os.path.exists(path(digest, size))
+    ]
+    for job in jobs:
+        job.result()
+
+
+def fetch_missing(force=False, log=print):
+    """Fetch every work's cover that isn't stored yet, or all of them with force; returns (stored, failed)"""
+    query = db.session.query(Work.cover_url).filter(Work.cover_url.isnot(None)).distinct()
+    if not force:
+        query = query.filter(~db.session.query(Cover.url).filter(
+            Cover.url == Work.cover_url, Cover.digest.isnot(None)
+        ).exists())
+    urls = [url for (url,) in query if url.startswith(('http://', 'https://'))]
+    log(f'Fetching {len(urls)} covers...')
+
+    app = current_app._get_current_object()
+
+    def fetch_one(url):
+        with app.app_context():
+            return fetch(url, force=force).digest is not None
+
+    stored = failed = 0
+    with ThreadPoolExecutor(app.config['COVER_FETCH_WORKERS']) as pool:
+        for done, ok in enumerate(pool.map(fetch_one, urls), 1):
+            stored, failed = stored + ok, failed + (not ok)
+            if done % 100 == 0:
+                log(f'  {done}/{len(urls)}')
+    return stored, failed
+
+
+def cover_src(work, size='thumb'):
+    """
+    URL to show a work's cover at: the local copy once it's stored, the
+    original URL until then. Asking for an unstored cover queues its fetch.
+    """
+    if not work.cover_url:
+        return None
+    cover = work.cover
+    return src(work.cover_url, cover is not None, cover.digest if cover is not None else None, size)
+
+
+def src(url, known, digest, size='thumb'):
+    """cover_src() from columns: the cover URL, whether it has a covers row, and that row's digest"""
+    if not url:
+        return None
+    if digest:
+        return url_for('cover', digest=digest, size=size)
+    if not known:
+        schedule(url)
+    return url
+
+
+def serve(digest, size):
+    """A stored cover, cached by the browser for a year"""
+    if not _DIGEST.fullmatch(digest) or size not in SIZES:
+        abort(404)
+
+    file = path(digest, size)
+    if not os.path.exists(file):
+        # Without Pillow, or before the thumbnail is made, fall back to the original
+        file = path(digest, 'full')
+        if not os.path.exists(file):
+            abort(404)
+
+    mimetype = 'image/jpeg' if file.endswith('-thumb') else _content_type(digest)
+    response = send_file(file, mimetype=mimetype, etag=f'{digest}-{size}', max_age=MAX_AGE, conditional=True)
+    response.cache_control.immutable = True
+    return response
+
+
+def _content_type(digest):
+    content_type = db.session.query(Cover.content_type).filter(Cover.digest == digest).limit(1).scalar()
+    return content_type or 'image/jpeg'
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_cover_urls(session, flush_context):
+    """Queue the cover URLs of works added or changed in this flush"""
+    urls = session.info.setdefault('covers_pending', set())
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Work) and obj.cover_url and inspect(obj).attrs.cover_url.history.has_changes():
+            urls.add(obj.cover_url)
+
+
+@event.listens_for(Session, 'after_commit')
+def _fetch_cover_urls(session):
+    urls = session.info.pop('covers_pending', None)
+    if urls and has_app_context():
+        for url in urls:
+            schedule(url)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_cover_urls(session):
+    session.info.pop('covers_pending', None)
+
+
+def init_app(app):
+    """Serve stored covers at /covers/<digest>/<size> and give templates cover_src()"""
+    app.add_url_rule('/covers/<digest>/<size>', 'cover', serve)
+    app.jinja_env.globals['cover_src'] = cover_src
@@ -0,0 +1,180 @@
+"""
+Full-library export. Every entity is read with plain selects on a
+server-side cursor and written out record by record, so memory stays flat
+however big the library is.
+"""
+import csv
+import io
+from datetime import datetime
+from sqlalchemy import select
+from models import db
+from models.models import Work, Copy, Author, AuthorName, Tag, Location, User, works_authors, works_tags
+from services import hierarchy
+from services.projections import json_list, as_list
+from services.serialize import dumps
+
+FORMATS = ('ndjson', 'json', 'csv')
+
+# Rows fetched from the cursor at a time
+YIELD_PER = 2000
+
+# Records per chunk handed to the writer
+CHUNK_RECORDS = 500
+
+# Entity name: fields, in restore order (every row's references come before it)
+FIELDS = {
+    'users': ('id', 'name', 'email', 'info', 'join_date', 'permissions'),
+    'locations': ('id', 'parent_id', 'name', 'type', 'description', 'path'),
+    'tags': ('id', 'parent_id', 'label', 'type', 'description', 'path'),
+    'authors': ('id', 'primary_name', 'bio', 'alt_names'),
+    'works': ('id', 'title', 'isbn', 'publisher', 'description', 'cover_url', 'author_ids', 'tag_ids'),
+    'copies': ('id', 'work_id', 'location_id', 'owner_id', 'lended_to', 'condition', 'acquired')
+}
+ENTITIES = tuple(FIELDS)
+
+
+def _tree_select(model, name_column):
+    """Rows of a hierarchy with their paths, parents before children"""
+    table = model.__table__
+    tree = hierarchy.paths_cte(model, name_column)
+    return (
+        select(table, tree.c.path)
+        .join(tree, tree.c.id == table.c.id)
+        .order_by(tree.c.depth, table.c.id)
+    )
+
+
+def _queries(conn):
+    """{entity: (select, row -> record)}"""
+    authors = Author.__table__
+    works = Work.__table__
+    alt_names = json_list(conn, AuthorName.alt_name, AuthorName.author_id == authors.c.id, AuthorName.id)
+    author_ids = json_list(conn, works_authors.c.authors_id, works_authors.c.works_id == works.c.id,
+                            works_authors.c.authors_id)
+    tag_ids = json_list(conn, works_tags.c.tags_id, works_tags.c.works_id == works.c.id, works_tags.c.tags_id)
+
+    return {
+        'users': (
+            select(*(User.__table__.c[name] for name in FIELDS['users'])).order_by(User.id),
+            lambda row: dict(row._mapping)
+        ),
+        'locations': (_tree_select(Location, Location.name), lambda row: dict(row._mapping)),
+        'tags': (_tree_select(Tag, Tag.label), lambda row: dict(row._mapping)),
+        'authors': (
+            select(authors.c.id, authors.c.primary_name, authors.c.bio, alt_names.label('alt_names'))
+            .order_by(authors.c.id),
+            lambda row: dict(row._mapping, alt_names=as_list(row.alt_names))
+        ),
+        'works': (
+            select(works.c.id, works.c.title, works.c.isbn, works.c.publisher, works.c.description,
+                   works.c.cover_url, author_ids.label('author_ids'), tag_ids.label('tag_ids'))
+            .order_by(works.c.id),
+            lambda row: dict(row._mapping, author_ids=as_list(row.author_ids), tag_ids=as_list(row.tag_ids))
+        ),
+        'copies': (
+            select(*(Copy.__table__.c[name] for name in FIELDS['copies'])).order_by(Copy.id),
+            lambda row: dict(row._mapping)
+        )
+    }
+
+
+def _plain(record, fields):
+    """Only the exported fields, with datetimes as ISO strings"""
+    out = {}
+    for field in fields:
+        value = record.get(field)
+        out[field] = value.isoformat() if isinstance(value, datetime) else value
+    return out
+
+
+def records(entities=ENTITIES):
+    """Yield (entity, record) for the whole library, from one consistent snapshot"""
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            conn = conn.execution_options(isolation_level='REPEATABLE READ')
+        conn = conn.execution_options(stream_results=True, yield_per=YIELD_PER)
+        queries = _queries(conn)
+        with conn.begin():
+            for entity in entities:
+                query, to_record = queries[entity]
+                for row in conn.execute(query):
+                    yield entity, _plain(to_record(row), FIELDS[entity])
+
+
+def _chunked(pieces):
+    """Join small byte strings into chunks worth writing"""
+    buffer = []
+    for piece in pieces:
+        buffer.append(piece)
+        if len(buffer) == CHUNK_RECORDS:
+            yield b''.join(buffer)
+            buffer = []
+    if buffer:
+        yield b''.join(buffer)
+
+
+def ndjson_chunks(entities=ENTITIES):
+    """One {"entity": name, ...} object per line"""
+    def lines():
+        for entity, record in records(entities):
+            yield dumps({'entity': entity, **record}) + b'\n'
+    return _chunked(lines())
+
+
+def json_chunks(entities=ENTITIES):
+    """One object with an array per entity, empty ones included"""
+    def pieces():
+        opened = -1
+
+        def open_through(index):
+            nonlocal opened
+            while opened < index:
+                opened += 1
+                yield (b'],' if opened else b'{') + dumps(entities[opened]) + b':['
+
+        for entity, record in records(entities):
+            index = entities.index(entity)
+            if index != opened:
+                yield from open_through(index)
+                yield dumps(record)
+            else:
+                yield b',' + dumps(record)
+        yield from open_through(len(entities) - 1)
+        yield b']}'
+    return _chunked(pieces())
+
+
+def csv_chunks(entity):
+    """One entity as CSV with a header row; lists are joined with '; '"""
+    def rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(FIELDS[entity])
+        for _, record in records((entity,)):
+            writer.writerow(['; '.join(map(str, value)) if isinstance(value, list) else value
+                             for value in record.values()])
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    return _chunked(rows())
+
+
+def chunks(format, entity=None):
+    """Uncompressed export in a format; CSV holds one entity, the others all of them"""
+    if format == 'csv':
+        if entity not in FIELDS:
+            raise ValueError(f'CSV exports one entity: {", ".join(ENTITIES)}')
+        return csv_chunks(entity)
+    if entity is not None and entity not in FIELDS:
+        raise ValueError(f'Unknown entity: {entity}')
+    entities = (entity,) if entity else ENTITIES
+    if format == 'json':
+        return json_chunks(entities)
+    if format == 'ndjson':
+        return ndjson_chunks(entities)
+    raise ValueError(f'Unknown format: {format}')
+
+
+def filename(format, entity=None):
+    stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    return f"bookshelf-{entity + '-' if entity else ''}{stamp}.{format}.gz"
@@ -0,0 +1,260 @@
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from models import db
+from models.models import Author, AuthorName, Tag
+
+# Words are keyed by this many leading and trailing characters
+KEY_LENGTH = 3
+
+# Posting list size above which a word key counts as common
+COMMON_WORD = 500
+
+
+def normalize(name):
+    # rapidfuzz is imported when the first index loads, not with the app
+    from rapidfuzz.utils import default_process
+    return default_process(name or '')
+
+
+def _sorted_tokens(name):
+    return ' '.join(sorted(name.split()))
+
+
+def _keys(name):
+    """Keys shared by words that start or end alike, so a typo in one end still matches"""
+    keys = set()
+    for token in name.split():
+        if len(token) <= KEY_LENGTH:
+            keys.add(token)
+        else:
+            keys.add(token[:KEY_LENGTH] + '^')
+            keys.add('$' + token[-KEY_LENGTH:])
+    return keys
+
+
+def _query_keys(query):
+    """
+    Keys to find a query's candidates by, or None to score every name. A
+    query word as long as a key may be the start or end of a longer word,
+    so "tol" finds "tolkien"; a query of only shorter words can't be
+    narrowed down at all.
+    """
+    tokens = query.split()
+    if not any(len(token) >= KEY_LENGTH for token in tokens):
+        return None
+    keys = _keys(query)
+    for token in tokens:
+        if len(token) == KEY_LENGTH:
+            keys.update((token + '^', '$' + token))
+    return keys
+
+
+class _Names:
+    """One load of an index's names, their owners and word keys"""
+
+    def __init__(self):
+        self.names = []
+        self.sorted = []
+        self.owners = []
+        self.slots = {}
+        self.by_key = defaultdict(set)
+        self.holes = 0
+
+    def add(self, key, owner_id, name):
+        name = normalize(name)
+        if not name:
+            return
+        slot = len(self.names)
+        self.names.append(name)
+        self.sorted.append(_sorted_tokens(name))
+        self.owners.append(owner_id)
+        self.slots[key] = slot
+        for word_key in _keys(name):
+            self.by_key[word_key].add(slot)
+
+    def remove(self, key):
+        slot = self.slots.pop(key, None)
+        if slot is not None:
+            # rapidfuzz skips None choices, so removal just leaves a hole
+            self.names[slot] = self.sorted[slot] = None
+            self.holes += 1
+
+    def apply(self, changes):
+        for key, owner_id, name in changes:
+            if key is None:
+                for owned in [k for k, slot in self.slots.items() if self.owners[slot] == owner_id]:
+                    self.remove(owned)
+                continue
+            self.remove(key)
+            if name is not None:
+                self.add(key, owner_id, name)
+
+
+class NameIndex:
+    """
+    In-memory fuzzy index of names, each belonging to an owner id.
+
+    A match scores the best of ratio, partial ratio and token sort ratio, like
+    the old per-row loop did. Rather than scoring every name, a search only
+    scores names with a word that starts or ends like one of the query's
+    words, in one batch call per scorer. The index reloads itself after
+    max_age seconds so changes made by other processes are picked up; the
+    reload reads the names without holding the lock, and searches keep
+    using the old names until the new ones are swapped in.
+    """
+
+    def __init__(self, load, max_age=300):
+        self._load = load
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._data = None
+        self._loaded_at = None
+        # Changes committed while a reload reads the names, replayed onto the new ones
+        self._pending = None
+
+    def _stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self._max_age
+
+    def _ensure_loaded(self):
+        if not self._stale():
+            return
+        # Only the first load makes searches wait; later ones are done by whichever thread gets here first
+        if not self._reload_lock.acquire(blocking=self._data is None):
+            return
+        try:
+            if not self._stale():
+                return
+            with self._lock:
+                self._pending = []
+            data = _Names()
+            for key, owner_id, name in self._load():
+                data.add(key, owner_id, name)
+            with self._lock:
+                data.apply(self._pending)
+                self._data = data
+                self._loaded_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._pending = None
+            self._reload_lock.release()
+
+    def load(self):
+        """Load the names now rather than on the first search"""
+        self._ensure_loaded()
+
+    def invalidate(self):
+        """Drop everything; the next search reloads from the database"""
+        with self._lock:
+            self._data = None
+            self._loaded_at = None
+
+    def apply(self, changes):
+        """
+        Apply (key, owner_id, name) upserts. A name of None removes the key,
+        and a key of None removes every name of the owner.
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(changes)
+            data = self._data
+            if data is None:
+                return
+            data.apply(changes)
+            if data.holes > len(data.names) // 2:
+                self._loaded_at = None
+
+    def search(self, query, score_cutoff=70, limit=2):
+        """Return up to limit (owner_id, score) pairs, best first"""
+        query = normalize(query)
+        if not query:
+            return []
+
+        self._ensure_loaded()
+        keys = _query_keys(query)
+        with self._lock:
+            data = self._data
+            if data is None:
+                return []
+            if keys is None:
+                slots = range(len(data.names))
+            else:
+                postings = sorted((data.by_key.get(key, set()) for key in keys), key=len)
+                # Words as common as a popular first name barely narrow the search;
+                # skip them when the query has a rarer word to go on
+                common = max(COMMON_WORD, len(data.names) // 20)
+                slots = set(postings[0]) if postings else set()
+                for posting in postings[1:]:
+                    if len(posting) <= common:
+                        slots |= posting
+            slots = [slot for slot in slots if data.names[slot] is not None]
+            names = [data.names[slot] for slot in slots]
+            sorted_names = [data.sorted[slot] for slot in slots]
+            owners = [data.owners[slot] for slot in slots]
+
+        from rapidfuzz import process, fuzz
+        best = {}
+        for choices, scorer, target in ((names, fuzz.ratio, query),
+                                        (names, fuzz.partial_ratio, query),
+                                        (sorted_names, fuzz.ratio, _sorted_tokens(query))):
+            for _, score, i in process.extract(target, choices, scorer=scorer, processor=None,
+                                               score_cutoff=score_cutoff, limit=None):
+                if score > best.get(owners[i], 0):
+                    best[owners[i]] = score
+
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        return [(owner_id, round(score)) for owner_id, score in ranked[:limit]]
+
+
+def _load_authors():
+    for id, name in db.session.execute(select(Author.id, Author.primary_name)):
+        yield ('author', id), id, name
+    for id, author_id, name in db.session.execute(select(AuthorName.id, AuthorName.author_id, AuthorName.alt_name)):
+        yield ('alt', id), author_id, name
+
+
+def _load_tags():
+    for id, label in db.session.execute(select(Tag.id, Tag.label)):
+        yield ('tag', id), id, label
+
+
+authors = NameIndex(_load_authors)
+tags = NameIndex(_load_tags)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changes(session, flush_context):
+    """Queue index updates for names changed in this flush"""
+    pending = session.info.setdefault('name_index_pending', {'authors': [], 'tags': []})
+
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Author):
+            pending['authors'].append((('author', obj.id), obj.id, obj.primary_name))
+        elif isinstance(obj, AuthorName):
+            pending['authors'].append((('alt', obj.id), obj.author_id, obj.alt_name))
+        elif isinstance(obj, Tag):
+            pending['tags'].append((('tag', obj.id), obj.id, obj.label))
+
+    for obj in session.deleted:
+        if isinstance(obj, Author):
+            pending['authors'].append((None, obj.id, None))
+        elif isinstance(obj, AuthorName):
+            pending['authors'].append((('alt', obj.id), obj.author_id, None))
+        elif isinstance(obj, Tag):
+            pending['tags'].append((('tag', obj.id), obj.id, None))
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_changes(session):
+    pending = session.info.pop('name_index_pending', None)
+    if pending:
+        authors.apply(pending['authors'])
+        tags.apply(pending['tags'])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('name_index_pending', None)
@@ -0,0 +1,177 @@
+import hashlib
+from sqlalchemy import select, func, literal
+from models import db
+
+PATH_SEPARATOR = ' → '
+
+
+class TreeNode:
+    """One node of a hierarchy loaded in bulk, with its own and subtree counts"""
+
+    def __init__(self, id, parent_id, name, count=0):
+        self.id = id
+        self.parent_id = parent_id
+        self.name = name
+        self.count = count
+        self.total = count
+        self.children = []
+
+
+def _descendants(model, id):
+    """
+    CTE of the ids of a node and everything below it. UNION rather than
+    UNION ALL keeps it finite even if the stored parents somehow form a cycle.
+    """
+    table = model.__table__
+    tree = select(table.c.id).where(table.c.id == id).cte('descendants', recursive=True)
+    child = table.alias('child')
+    return tree.union(select(child.c.id).where(child.c.parent_id == tree.c.id))
+
+
+def descendant_ids(model, id):
+    """Select of the ids of a node and everything below it"""
+    tree = _descendants(model, id)
+    return select(tree.c.id)
+
+
+def paths_cte(model, name_column):
+    """CTE of (id, path, depth) for every node reachable from a root"""
+    table = model.__table__
+    name = table.c[name_column.key]
+    tree = select(
+        table.c.id, name.label('path'), literal(0).label('depth')
+    ).where(table.c.parent_id.is_(None)).cte('paths', recursive=True)
+    child = table.alias('child')
+    return tree.union_all(
+        select(child.c.id, tree.c.path + literal(PATH_SEPARATOR) + child.c[name_column.key], tree.c.depth + 1)
+        .where(child.c.parent_id == tree.c.id)
+    )
+
+
+def paths(model, name_column):
+    """Return {node id: 'Root → Child → Node'} for every node, in one query"""
+    tree = paths_cte(model, name_column)
+    return dict(db.session.execute(select(tree.c.id, tree.c.path)).all())
+
+
+def ancestors(model, name_column, id, max_depth=64):
+    """Return [(id, name), ...] from the root down to the node itself, in one query"""
+    table = model.__table__
+    up = select(
+        table.c.id, table.c.parent_id, table.c[name_column.key].label('name'), literal(0).label('depth')
+    ).where(table.c.id == id).cte('ancestors', recursive=True)
+    parent = table.alias('parent')
+    up = up.union_all(
+        select(parent.c.id, parent.c.parent_id, parent.c[name_column.key], up.c.depth + 1)
+        .where(parent.c.id == up.c.parent_id, up.c.depth < max_depth)
+    )
+    rows = db.session.execute(select(up.c.id, up.c.name).order_by(up.c.depth.desc()))
+    return [tuple(row) for row in rows]
+
+
+def build_tree(model, name_column, foreign_key=None, root_id=None):
+    """
+    Load a hierarchy into TreeNodes and return the top level nodes.
+
+    Takes one query for the nodes and, with foreign_key, one grouped query for
+    own counts that are then summed up the tree. With root_id, only that
+    node's descendants are loaded and its children are returned.
+    """
+    table = model.__table__
+    query = select(table.c.id, table.c.parent_id, table.c[name_column.key]).order_by(table.c[name_column.key])
+    if root_id is not None:
+        query = query.where(table.c.id.in_(descendant_ids(model, root_id)))
+    nodes = {id: TreeNode(id, parent_id, name) for id, parent_id, name in db.session.execute(query)}
+
+    if foreign_key is not None and nodes:
+        counts = select(foreign_key, func.count()).group_by(foreign_key)
+        if root_id is not None:
+            counts = counts.where(foreign_key.in_(descendant_ids(model, root_id)))
+        for id, count in db.session.execute(counts):
+            if id in nodes:
+                nodes[id].count = nodes[id].total = count
+
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node.parent_id)
+        if parent is not None and node.id != root_id:
+            parent.children.append(node)
+        elif root_id is None:
+            roots.append(node)
+
+    # Sum counts from the leaves up; the seen set guards against bad data
+    seen = set()
+
+    def total(node):
+        seen.add(node.id)
+        node.total = node.count + sum(total(child) for child in node.children if child.id not in seen)
+        return node.total
+
+    if root_id is not None:
+        if root_id not in nodes:
+            return []
+        total(nodes[root_id])
+        return nodes[root_id].children
+
+    for node in roots:
+        total(node)
+    return roots
+
+
+class TreeChoices(list):
+    """Nested (value, label, children) choices with a version that changes whenever they do"""
+
+    def __init__(self, choices, version):
+        super().__init__(choices)
+        self.version = version
+
+
+def tree_choices(model, name_column, exclude_id=None, empty_label='-none-'):
+    """
+    Load a hierarchy as nested (id, name, children) choices in one query,
+    headed by an (0, empty_label, []) choice. With exclude_id, that node and
+    everything below it are left out so it can't be made its own ancestor.
+    """
+    table = model.__table__
+    rows = db.session.execute(
+        select(table.c.id, table.c.parent_id, table.c[name_column.key]).order_by(table.c[name_column.key])
+    ).all()
+
+    children = {}
+    for id, parent_id, name in rows:
+        children.setdefault(parent_id, []).append((id, name, []))
+    nodes = {node[0]: node for siblings in children.values() for node in siblings}
+
+    excluded = set()
+    if exclude_id is not None:
+        stack = [exclude_id]
+        while stack:
+            id = stack.pop()
+            if id not in excluded:
+                excluded.add(id)
+                stack.extend(child[0] for child in children.get(id, []))
+
+    # Nodes whose parent is missing are shown at the top level rather than lost
+    roots = []
+    for id, parent_id, name in rows:
+        if id in excluded:
+            continue
+        parent = nodes.get(parent_id)
+        if parent is None:
+            roots.append(nodes[id])
+        elif parent_id not in excluded:
+            parent[2].append(nodes[id])
+
+    # A digest of what the choices show: the same in every process, and practically never shared by two trees
+    shown = (empty_label, [tuple(row) for row in rows if row[0] not in excluded])
+    version = hashlib.blake2b(repr(shown).encode(), digest_size=16).hexdigest()
+    return TreeChoices([(0, empty_label, [])] + roots, version)
+
+
+def would_create_cycle(model, id, new_parent_id):
+    """Whether making new_parent_id the parent of id would put a node under itself"""
+    if new_parent_id is None:
+        return False
+    return db.session.execute(
+        select(literal(True)).where(literal(new_parent_id).in_(descendant_ids(model, id)))
+    ).first() is not None
@@ -0,0 +1,261 @@
+import csv
+import time
+from concurrent.futures import ThreadPoolExecutor
+from models import db
+from models.models import Work, Copy, Author, AuthorName, Tag, Location, User
+from services import isbn_cache, isbn_providers, metrics
+from services.isbn import canonical as canonical_isbn
+
+# Open Library accepts many bibkeys per request; keep URLs a sensible length
+BIBKEY_CHUNK = 50
+
+
+class ImportReport:
+    """Counts and failures from one bulk import"""
+
+    def __init__(self):
+        self.rows = 0
+        self.works_created = 0
+        self.copies_created = 0
+        self.authors_created = 0
+        self.tags_created = 0
+        self.failures = []
+        self.lookup_seconds = 0.0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def fail(self, isbn, reason):
+        self.failures.append({'isbn': isbn, 'error': reason})
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'works_created': self.works_created,
+            'copies_created': self.copies_created,
+            'authors_created': self.authors_created,
+            'tags_created': self.tags_created,
+            'failures': self.failures,
+            'lookup_seconds': round(self.lookup_seconds, 2),
+            'elapsed_seconds': round(self.elapsed, 2),
+            'rows_per_second': round(self.rate, 1)
+        }
+
+    def summary(self):
+        return (f'{self.rows} rows in {self.elapsed:.1f}s ({self.rate:.1f} rows/s, '
+                f'{self.lookup_seconds:.1f}s fetching metadata): '
+                f'{self.works_created} works, {self.copies_created} copies, '
+                f'{self.authors_created} authors, {self.tags_created} tags created, '
+                f'{len(self.failures)} failed')
+
+
+def read_isbn_file(lines):
+    """
+    Parse an ISBN file into row dicts with 'isbn', 'location' and 'owner' keys.
+
+    Each line is an ISBN optionally followed by a location (name or id) and an
+    owner name, comma separated. A header row naming an 'isbn' column is allowed.
+    """
+    rows = []
+    reader = csv.reader(lines)
+    for record in reader:
+        record = [value.strip() for value in record]
+        if not record or not record[0] or record[0].startswith('#'):
+            continue
+        if record[0].lower() == 'isbn':
+            continue
+
+        # Valid ISBNs are read as their ISBN-13; others are kept to be reported
+        isbn = canonical_isbn(record[0]) or isbn_cache.cache_key(record[0])
+        rows.append({
+            'isbn': isbn,
+            'location': record[1] if len(record) > 1 and record[1] else None,
+            'owner': record[2] if len(record) > 2 and record[2] else None
+        })
+    return rows
+
+
+def fetch_metadata(isbns, workers=8, timeout=5):
+    """
+    Fetch metadata for many ISBNs, returning ({isbn: result}, {isbn: error})
+    where the errors are the lookups that raised instead of answering.
+
+    The offline mirror and cached answers are used first. The rest go to Open
+    Library in multi-bibkey batches, and whatever Open Library doesn't know is
+    looked up one by one through every provider. Network calls run on a
+    bounded worker pool.
+    """
+    isbns = list(dict.fromkeys(isbns))
+    results = {}
+    for isbn in isbns:
+        data = isbn_providers.mirror.lookup(isbn, timeout)
+        if data:
+            results[isbn] = data
+    cached = isbn_cache.get_many([isbn for isbn in isbns if isbn not in results])
+    results.update((isbn, r) for isbn, r in cached.items() if r.get('success'))
+    wanted = [isbn for isbn in isbns if isbn not in results and isbn not in cached]
+    to_cache = []
+    errors = {}
+
+    def bulk(chunk):
+        try:
+            return isbn_providers.open_library.lookup_many(chunk, timeout)
+        except Exception:
+            return {}
+
+    def single(isbn):
+        # One ISBN going wrong fails its own row, not the whole import
+        try:
+            return isbn_providers.lookup(isbn, timeout=timeout), None
+        except Exception as e:
+            return None, e
+
+    with metrics.track('upstream'), ThreadPoolExecutor(max_workers=workers) as executor:
+        chunks = [wanted[i:i + BIBKEY_CHUNK] for i in range(0, len(wanted), BIBKEY_CHUNK)]
+        for found in executor.map(bulk, chunks):
+            for isbn, data in found.items():
+                results[isbn] = data
+                to_cache.append((isbn, data, isbn_providers.open_library.name))
+
+        remaining = [isbn for isbn in wanted if isbn not in results]
+        for isbn, (lookup, error) in zip(remaining, executor.map(single, remaining)):
+            if error is not None:
+                errors[isbn] = str(error) or type(error).__name__
+            elif lookup.data:
+                results[isbn] = lookup.data
+                to_cache.append((isbn, lookup.data, lookup.provider))
+            elif lookup.conclusive:
+                to_cache.append((isbn, None, None))
+
+    if to_cache:
+        isbn_cache.store_many(to_cache)
+
+    return results, errors
+
+
+class _Resolver:
+    """Find-or-create lookups for authors, tags, locations and owners, loaded once"""
+
+    def __init__(self, report):
+        self.report = report
+        self.authors = {}
+        for author in db.session.query(Author):
+            self.authors.setdefault(author.primary_name.lower(), author)
+        alt_names = db.session.query(AuthorName.alt_name, Author).join(Author, AuthorName.author_id == Author.id)
+        for alt_name, author in alt_names.filter(AuthorName.alt_name.isnot(None)):
+            self.authors.setdefault(alt_name.lower(), author)
+        self.tags = {tag.label.lower(): tag for tag in db.session.query(Tag)}
+        self.works = {work.isbn: work for work in db.session.query(Work).filter(Work.isbn.isnot(None))}
+        self.locations = {}
+        for location in db.session.query(Location):
+            self.locations[str(location.id)] = location
+            self.locations.setdefault(location.name.lower(), location)
+        self.users = {user.name.lower(): user for user in db.session.query(User)}
+
+    def author(self, name):
+        key = name.strip().lower()
+        if key not in self.authors:
+            self.authors[key] = Author(primary_name=name.strip())
+            db.session.add(self.authors[key])
+            self.report.authors_created += 1
+        return self.authors[key]
+
+    def tag(self, label):
+        key = label.strip().lower()
+        if key not in self.tags:
+            self.tags[key] = Tag(label=label.strip(), type='genre')
+            db.session.add(self.tags[key])
+            self.report.tags_created += 1
+        return self.tags[key]
+
+    def location(self, value):
+        return self.locations.get(value.lower()) if value else None
+
+    def owner(self, name):
+        return self.users.get(name.lower()) if name else None
+
+
+def import_rows(rows, default_location=None, workers=8, batch_size=200, timeout=5, progress=None):
+    """
+    Import parsed ISBN rows, creating works, copies, authors and tags as
+    needed. progress, if given, is called with the rows done after each batch.
+    """
+    report = ImportReport()
+    report.rows = len(rows)
+    start = time.perf_counter()
+
+    metadata, errors = fetch_metadata([row['isbn'] for row in rows if canonical_isbn(row['isbn'])],
+                                      workers=workers, timeout=timeout)
+    report.lookup_seconds = time.perf_counter() - start
+
+    resolver = _Resolver(report)
+    fallback_location = resolver.location(default_location)
+
+    counters = ('works_created', 'copies_created', 'authors_created', 'tags_created')
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        before = {name: getattr(report, name) for name in counters}
+        failures_before = len(report.failures)
+        try:
+            for row in batch:
+                _import_row(row, metadata, errors, resolver, fallback_location, report)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            # Nothing from this batch was saved, so undo its counts and reload the lookups
+            for name, value in before.items():
+                setattr(report, name, value)
+            del report.failures[failures_before:]
+            resolver = _Resolver(report)
+            fallback_location = resolver.location(default_location)
+            for row in batch:
+                report.fail(row['isbn'], f'Batch failed: {e}')
+        if progress is not None:
+            progress(i + len(batch))
+
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def _import_row(row, metadata, errors, resolver, fallback_location, report):
+    isbn = row['isbn']
+    if canonical_isbn(isbn) is None:
+        report.fail(isbn, 'Not a valid ISBN')
+        return
+
+    location = resolver.location(row['location']) if row['location'] else fallback_location
+    if location is None:
+        report.fail(isbn, f"Unknown location '{row['location']}'" if row['location'] else 'No location given')
+        return
+
+    owner = resolver.owner(row['owner'])
+    if row['owner'] and owner is None:
+        report.fail(isbn, f"Unknown owner '{row['owner']}'")
+        return
+
+    work = resolver.works.get(isbn)
+    if work is None:
+        data = metadata.get(isbn)
+        if data is None:
+            report.fail(isbn, f'Lookup failed: {errors[isbn]}' if isbn in errors else 'Book not found')
+            return
+
+        work = Work(
+            title=data.get('title') or isbn,
+            isbn=isbn,
+            publisher=data.get('publisher') or None,
+            description=data.get('description') or None,
+            cover_url=data.get('cover_url') or None
+        )
+        authors = [resolver.author(name) for name in data.get('authors', []) if name.strip()]
+        tags = [resolver.tag(label) for label in data.get('categories', []) if label.strip()]
+        work.authors = list({id(a): a for a in authors}.values())
+        work.tags = list({id(t): t for t in tags}.values())
+        db.session.add(work)
+        resolver.works[isbn] = work
+        report.works_created += 1
+
+    db.session.add(Copy(work=work, location=location, owner=owner))
+    report.copies_created += 1
@@ -0,0 +1,73 @@
+"""
+ISBN checking and conversion. A work stores its ISBN as the 13 digits of
+its ISBN-13, so an ISBN-10 and its ISBN-13 are the same book and the
+column sorts and prefix-matches as text.
+"""
+
+# Prefixes of an ISBN-13 (the "Bookland" EAN ranges)
+PREFIXES = ('978', '979')
+
+
+def clean(value):
+    """An ISBN without the hyphens and spaces a scanner or user might leave in it"""
+    return ''.join(str(value).split()).replace('-', '').upper()
+
+
+def check_digit13(first12):
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(first12))
+    return str(-total % 10)
+
+
+def check_digit10(first9):
+    total = sum(int(digit) * (10 - i) for i, digit in enumerate(first9))
+    digit = -total % 11
+    return 'X' if digit == 10 else str(digit)
+
+
+def canonical(value):
+    """The ISBN-13 of a valid ISBN-10 or ISBN-13, or None if it isn't one or its check digit is wrong"""
+    value = clean(value)
+    if len(value) == 13 and value.isdigit() and value.startswith(PREFIXES):
+        return value if value[12] == check_digit13(value[:12]) else None
+    if len(value) == 10 and value[:9].isdigit() and value[9] == check_digit10(value[:9]):
+        first12 = '978' + value[:9]
+        return first12 + check_digit13(first12)
+    return None
+
+
+def stored(value):
+    """
+    The ISBN to store for a value from before ISBNs were text. Those were
+    numbers, so an ISBN-10 lost its leading zeros; they are put back. A
+    value that still isn't a valid ISBN is kept as its digits.
+    """
+    if value is None or value == '':
+        return None
+    digits = clean(value)
+    if digits.isdigit() and len(digits) < 10:
+        digits = digits.zfill(10)
+    return canonical(digits) or digits
+
+
+def search_prefix(value):
+    """
+    The start of the ISBN-13s a partly typed ISBN could be, or None if it
+    can't be one. Digits not starting 978 or 979 are taken as the start of
+    an ISBN-10, so "0306" finds 9780306...
+    """
+    value = clean(value)
+    if not value.isdigit() or len(value) > 13:
+        return None
+    if value.startswith(PREFIXES) or any(prefix.startswith(value) for prefix in PREFIXES):
+        return value
+    if len(value) <= 9:
+        return '978' + value
+    return None
+
+
+def prefix_bounds(prefix):
+    """(low, high) such that the ISBNs starting with prefix are low <= isbn < high; high None if unbounded"""
+    stripped = prefix.rstrip('9')
+    if not stripped:
+        return prefix, None
+    return prefix, stripped[:-1] + str(int(stripped[-1]) + 1)
@@ -0,0 +1,81 @@
+import json
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from models import db
+from models.models import IsbnCache
+from services.isbn import canonical, clean
+
+
+def cache_key(isbn):
+    """An ISBN's ISBN-13, so both forms share an entry; anything else without its hyphens and spaces"""
+    return canonical(isbn) or clean(isbn)
+
+
+def _fresh_result(entry):
+    """Turn a cache row into a lookup result, or None if it has expired"""
+    if entry.found:
+        ttl = current_app.config['ISBN_CACHE_TTL']
+    else:
+        ttl = current_app.config['ISBN_CACHE_NEGATIVE_TTL']
+
+    if entry.fetched_at + timedelta(seconds=ttl) < datetime.utcnow():
+        return None
+
+    if not entry.found:
+        return {'success': False, 'error': 'Book not found', 'cached': True}
+
+    result = json.loads(entry.data)
+    result.update(success=True, provider=entry.provider, cached=True)
+    return result
+
+
+def get_cached(isbn):
+    """Return the cached lookup result for an ISBN, or None if missing or expired"""
+    entry = db.session.get(IsbnCache, cache_key(isbn))
+    if entry is None:
+        return None
+    return _fresh_result(entry)
+
+
+def get_many(isbns):
+    """Return {isbn: result} for every ISBN with a fresh cache entry"""
+    keys = {cache_key(isbn): isbn for isbn in isbns}
+    results = {}
+    key_list = list(keys)
+    for i in range(0, len(key_list), 500):
+        for entry in db.session.query(IsbnCache).filter(IsbnCache.isbn.in_(key_list[i:i + 500])):
+            result = _fresh_result(entry)
+            if result is not None:
+                results[keys[entry.isbn]] = result
+    return results
+
+
+def _entry(isbn, result, provider):
+    return IsbnCache(
+        isbn=cache_key(isbn),
+        found=result is not None,
+        provider=provider,
+        data=json.dumps(result) if result is not None else None,
+        fetched_at=datetime.utcnow()
+    )
+
+
+def store(isbn, result, provider=None):
+    """Save a lookup result; a result of None records that no provider knew the ISBN"""
+    try:
+        db.session.merge(_entry(isbn, result, provider))
+        db.session.commit()
+    except IntegrityError:
+        # Another request cached the same ISBN first
+        db.session.rollback()
+
+
+def store_many(results):
+    """Save several (isbn, result, provider) tuples in one transaction"""
+    try:
+        for isbn, result, provider in results:
+            db.session.merge(_entry(isbn, result, provider))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
@@ -0,0 +1,288 @@
+"""
+A local copy of Open Library's book data, built from its dumps
+(https://openlibrary.org/developers/dumps), so ISBN lookups work offline.
+
+The mirror is an SQLite file keyed by ISBN-13 as an integer, so a lookup
+is a rowid probe into a memory-mapped file. Editions point at their work
+and authors by Open Library's numeric ids; those are resolved when read.
+"""
+import os
+import sqlite3
+import threading
+import time
+from services import serialize
+from services.isbn import canonical
+from services.restore import open_dump
+
+# Rows written per executemany
+BATCH_ROWS = 10000
+
+# Bytes of the mirror SQLite may map into memory
+MMAP_SIZE = 1 << 32
+
+# Cover image for an Open Library cover id
+COVER_URL = 'https://covers.openlibrary.org/b/id/{}-M.jpg'
+
+SCHEMA = (
+    'CREATE TABLE editions (isbn INTEGER PRIMARY KEY, title TEXT, publisher TEXT, description TEXT, '
+    'cover INTEGER, subjects TEXT, work INTEGER, authors TEXT)',
+    'CREATE TABLE works (id INTEGER PRIMARY KEY, description TEXT, subjects TEXT, authors TEXT)',
+    'CREATE TABLE authors (id INTEGER PRIMARY KEY, name TEXT)'
+)
+
+
+class BuildReport:
+    """Rows kept per table and how long the build took"""
+
+    def __init__(self):
+        self.lines = 0
+        self.editions = 0
+        self.works = 0
+        self.authors = 0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.lines / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (f'{self.lines} dump lines in {self.elapsed:.1f}s ({self.rate:.0f} lines/s): '
+                f'{self.editions} ISBNs, {self.works} works, {self.authors} authors kept')
+
+
+def _key_id(key):
+    """Open Library's number in a key like /works/OL45883W"""
+    try:
+        return int(key.rsplit('/', 1)[-1][2:-1])
+    except (ValueError, IndexError):
+        return None
+
+
+def _text(value):
+    """Descriptions and notes are either a string or {"type": "/type/text", "value": ...}"""
+    if isinstance(value, dict):
+        value = value.get('value')
+    return value.strip() if isinstance(value, str) and value.strip() else None
+
+
+def _list(values):
+    return serialize.dumps(values).decode() if values else None
+
+
+def _author_ids(refs, nested=False):
+    """Author ids of an edition's [{"key": ...}] or a work's [{"author": {"key": ...}}]"""
+    ids = []
+    for ref in refs or ():
+        if nested:
+            ref = ref.get('author') if isinstance(ref, dict) else None
+        key = ref.get('key') if isinstance(ref, dict) else None
+        author_id = _key_id(key) if key else None
+        if author_id is not None and author_id not in ids:
+            ids.append(author_id)
+    return ids
+
+
+def _edition_rows(record):
+    """One editions row per ISBN an edition lists"""
+    isbns = set()
+    for value in (record.get('isbn_13') or []) + (record.get('isbn_10') or []):
+        isbn = canonical(value) if isinstance(value, str) else None
+        if isbn is not None:
+            isbns.add(int(isbn))
+    if not isbns:
+        return ()
+
+    title = record.get('title') or ''
+    if record.get('subtitle'):
+        title = f"{title}: {record['subtitle']}"
+    covers = [cover for cover in record.get('covers') or () if isinstance(cover, int) and cover > 0]
+    works = record.get('works') or ()
+    work = _key_id(works[0].get('key', '')) if works and isinstance(works[0], dict) else None
+    row = (
+        title or None,
+        ', '.join(p for p in record.get('publishers') or () if isinstance(p, str)) or None,
+        _text(record.get('description')) or _text(record.get('notes')),
+        covers[0] if covers else None,
+        _list([s for s in record.get('subjects') or () if isinstance(s, str)]),
+        work,
+        _list(_author_ids(record.get('authors')))
+    )
+    return [(isbn,) + row for isbn in isbns]
+
+
+def _work_row(record, key):
+    return (
+        _key_id(key),
+        _text(record.get('description')),
+        _list([s for s in record.get('subjects') or () if isinstance(s, str)]),
+        _list(_author_ids(record.get('authors'), nested=True))
+    )
+
+
+class _Writer:
+    """Buffers rows per table and writes them in batches"""
+
+    STATEMENTS = {
+        'editions': 'INSERT OR REPLACE INTO editions VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        'works': 'INSERT OR REPLACE INTO works VALUES (?, ?, ?, ?)',
+        'authors': 'INSERT OR REPLACE INTO authors VALUES (?, ?)'
+    }
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = {table: [] for table in self.STATEMENTS}
+
+    def add(self, table, rows):
+        buffer = self.rows[table]
+        buffer.extend(rows)
+        if len(buffer) >= BATCH_ROWS:
+            self.flush(table)
+
+    def flush(self, table=None):
+        for name in [table] if table else list(self.rows):
+            if self.rows[name]:
+                self.conn.executemany(self.STATEMENTS[name], self.rows[name])
+                self.rows[name] = []
+
+
+def _ingest(writer, file, report, log):
+    """Read one dump: tab separated type, key, revision, last modified and the record's JSON"""
+    for line in file:
+        report.lines += 1
+        if report.lines % 1000000 == 0:
+            log(f'{report.lines} lines...')
+        fields = line.split('\t', 4)
+        if len(fields) < 5:
+            continue
+        kind, key, _, _, data = fields
+        if kind == '/type/edition':
+            # Most editions have no ISBN; skip those without parsing them
+            if '"isbn_' in data:
+                writer.add('editions', _edition_rows(serialize.loads(data)))
+        elif kind == '/type/work':
+            writer.add('works', [_work_row(serialize.loads(data), key)])
+        elif kind == '/type/author':
+            name = serialize.loads(data).get('name')
+            if name:
+                writer.add('authors', [(_key_id(key), name)])
+
+
+def build(dumps, path, log=print):
+    """
+    Build the mirror at path from Open Library dumps (editions, works and
+    authors, gzipped or not, in any order). The new file replaces the old
+    one only once it's complete, so lookups carry on meanwhile.
+    """
+    report = BuildReport()
+    start = time.perf_counter()
+    building = path + '.building'
+    if os.path.exists(building):
+        os.remove(building)
+
+    conn = sqlite3.connect(building, isolation_level=None)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA cache_size = -262144')
+        for statement in SCHEMA:
+            conn.execute(statement)
+
+        conn.execute('BEGIN')
+        writer = _Writer(conn)
+        for dump in dumps:
+            log(f'Reading {dump}...')
+            with open_dump(dump) as file:
+                _ingest(writer, file, report, log)
+        writer.flush()
+
+        # Only keep the works and authors some edition with an ISBN refers to
+        log('Dropping works and authors without an ISBN...')
+        conn.execute('DELETE FROM works WHERE id NOT IN (SELECT work FROM editions WHERE work IS NOT NULL)')
+        conn.execute(
+            'DELETE FROM authors WHERE id NOT IN ('
+            'SELECT value FROM editions, json_each(editions.authors) '
+            'UNION SELECT value FROM works, json_each(works.authors))'
+        )
+        conn.execute('COMMIT')
+
+        for table in ('editions', 'works', 'authors'):
+            setattr(report, table, conn.execute(f'SELECT count(*) FROM {table}').fetchone()[0])
+        conn.execute('VACUUM')
+    finally:
+        conn.close()
+
+    os.replace(building, path)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+class Mirror:
+    """Read side of the mirror: one read-only connection per thread, reopened when the file is rebuilt"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        if not self.path:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+
+        local = self._local
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if getattr(local, 'version', None) != version:
+            if getattr(local, 'conn', None) is not None:
+                local.conn.close()
+            # immutable: the file never changes in place, so SQLite can skip locking
+            local.conn = sqlite3.connect(f'file:{self.path}?mode=ro&immutable=1', uri=True)
+            local.conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+            local.version = version
+        return local.conn
+
+    @property
+    def available(self):
+        return self._connection() is not None
+
+    def lookup(self, isbn):
+        """Book data for an ISBN in the shape the online providers return, or None"""
+        conn = self._connection()
+        isbn = canonical(isbn)
+        if conn is None or isbn is None:
+            return None
+
+        row = conn.execute(
+            'SELECT title, publisher, description, cover, subjects, work, authors FROM editions WHERE isbn = ?',
+            (int(isbn),)
+        ).fetchone()
+        if row is None:
+            return None
+        title, publisher, description, cover, subjects, work, authors = row
+
+        # An edition without its own description, subjects or authors takes its work's
+        if work is not None and not (description and subjects and authors):
+            work_row = conn.execute('SELECT description, subjects, authors FROM works WHERE id = ?', (work,)).fetchone()
+            if work_row is not None:
+                description = description or work_row[0]
+                subjects = subjects or work_row[1]
+                authors = authors or work_row[2]
+
+        names = []
+        for author_id in serialize.loads(authors) if authors else ():
+            found = conn.execute('SELECT name FROM authors WHERE id = ?', (author_id,)).fetchone()
+            if found is not None:
+                names.append(found[0])
+
+        return {
+            'title': title or '',
+            'authors': names,
+            'publisher': publisher or '',
+            'description': description or '',
+            'cover_url': COVER_URL.format(cover) if cover else '',
+            'categories': serialize.loads(subjects) if subjects else []
+        }
+
+
+mirror = Mirror()
@@ -0,0 +1,219 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from services import metrics, isbn_mirror
+
+logger = logging.getLogger(__name__)
+
+
+def _session():
+    """Build a keep-alive session shared by every lookup against one provider"""
+    # requests is imported on the first lookup rather than with the app
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=16))
+    session.headers['User-Agent'] = 'bookshelf (self-hosted home library)'
+    return session
+
+
+class Provider(ABC):
+    """Base class for an upstream ISBN metadata source"""
+    name = None
+
+    def __init__(self):
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = _session()
+        return self._session
+
+    @abstractmethod
+    def lookup(self, isbn, timeout):
+        """Return a normalized result dict, or None if the provider doesn't know the ISBN"""
+
+
+class GoogleBooks(Provider):
+    name = 'google'
+
+    def lookup(self, isbn, timeout):
+        response = self.session.get(
+            'https://www.googleapis.com/books/v1/volumes',
+            params={'q': f'isbn:{isbn}'},
+            timeout=timeout
+        )
+        response.raise_for_status()
+
+        data = response.json()
+        if not data.get('items'):
+            return None
+
+        book = data['items'][0]['volumeInfo']
+        return {
+            'title': book.get('title', ''),
+            'authors': book.get('authors', []),
+            'publisher': book.get('publisher', ''),
+            'description': book.get('description', ''),
+            'cover_url': book.get('imageLinks', {}).get('thumbnail', '').replace('http:', 'https:'),
+            'categories': book.get('categories', [])
+        }
+
+
+class OpenLibrary(Provider):
+    name = 'openlibrary'
+
+    def lookup(self, isbn, timeout):
+        response = self.session.get(
+            'https://openlibrary.org/api/books',
+            params={'bibkeys': f'ISBN:{isbn}', 'format': 'json', 'jscmd': 'data'},
+            timeout=timeout
+        )
+        response.raise_for_status()
+
+        book = response.json().get(f'ISBN:{isbn}')
+        if not book:
+            return None
+
+        return self.normalize(book)
+
+    def lookup_many(self, isbns, timeout):
+        """Look up several ISBNs in one request, returning {isbn: result} for those found"""
+        response = self.session.get(
+            'https://openlibrary.org/api/books',
+            params={'bibkeys': ','.join(f'ISBN:{isbn}' for isbn in isbns), 'format': 'json', 'jscmd': 'data'},
+            timeout=timeout
+        )
+        response.raise_for_status()
+
+        data = response.json()
+        return {isbn: self.normalize(data[f'ISBN:{isbn}']) for isbn in isbns if data.get(f'ISBN:{isbn}')}
+
+    @staticmethod
+    def normalize(book):
+        return {
+            'title': book.get('title', ''),
+            'authors': [a['name'] for a in book.get('authors', [])],
+            'publisher': ', '.join(p['name'] for p in book.get('publishers', [])),
+            'description': book.get('notes', '') or book.get('subtitle', ''),
+            'cover_url': book.get('cover', {}).get('medium', ''),
+            'categories': [s['name'] for s in book.get('subjects', [])]
+        }
+
+
+class OpenLibraryMirror(Provider):
+    """Open Library's data from a local copy of its dumps; answers without the network"""
+    name = 'mirror'
+
+    def lookup(self, isbn, timeout):
+        return isbn_mirror.mirror.lookup(isbn)
+
+
+google_books = GoogleBooks()
+open_library = OpenLibrary()
+mirror = OpenLibraryMirror()
+
+# Listed in order of preference when merging answers
+PROVIDERS = [google_books, open_library]
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='isbn-lookup')
+
+
+class LookupResult:
+    """Outcome of querying every provider for one ISBN"""
+
+    def __init__(self, data, providers, conclusive, timings):
+        self.data = data
+        self.providers = providers
+        self.conclusive = conclusive
+        self.timings = timings
+
+    @property
+    def provider(self):
+        return '+'.join(self.providers) if self.providers else None
+
+    @property
+    def local(self):
+        """Answered by the offline mirror, which is quicker to ask again than the cache"""
+        return self.providers == [mirror.name]
+
+
+def _timed_lookup(provider, isbn, timeout):
+    """
+    Run one provider, returning (data, error, milliseconds taken). Any error,
+    including an answer in a shape the provider didn't expect, only makes
+    that provider miss.
+    """
+    import requests
+    start = time.perf_counter()
+    try:
+        data, error = provider.lookup(isbn, timeout), None
+    except requests.RequestException as e:
+        logger.warning('ISBN lookup of %s on %s failed: %s', isbn, provider.name, e)
+        data, error = None, e
+    except Exception as e:
+        logger.exception('ISBN lookup of %s on %s failed', isbn, provider.name)
+        data, error = None, e
+    return data, error, (time.perf_counter() - start) * 1000
+
+
+def _merge(answers):
+    """Fill blank fields of the preferred answer from the others"""
+    merged = {}
+    for provider in PROVIDERS:
+        for key, value in answers.get(provider.name, {}).items():
+            if not merged.get(key):
+                merged[key] = value
+    return merged
+
+
+@metrics.track('upstream')
+def lookup(isbn, timeout=5, merge_budget=0.15):
+    """
+    Query every provider at once and return a LookupResult.
+
+    The first good answer wins. Providers that are still running get
+    merge_budget more seconds to contribute fields the winner left blank.
+    An ISBN in the local mirror is answered from it alone.
+    """
+    start = time.perf_counter()
+    data = mirror.lookup(isbn, timeout)
+    if data:
+        return LookupResult(data, [mirror.name], True, {mirror.name: round((time.perf_counter() - start) * 1000, 3)})
+
+    futures = {_executor.submit(_timed_lookup, p, isbn, timeout): p for p in PROVIDERS}
+    pending = set(futures)
+    answers = {}
+    timings = {p.name: None for p in PROVIDERS}
+    failed = False
+    deadline = time.monotonic() + timeout
+
+    while pending:
+        if answers:
+            remaining = min(deadline, first_answer_at + merge_budget) - time.monotonic()
+        else:
+            remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = futures[future].name
+            data, error, duration = future.result()
+            timings[name] = round(duration, 1)
+            if error is not None:
+                failed = True
+            elif data:
+                if not answers:
+                    first_answer_at = time.monotonic()
+                answers[name] = data
+
+    # Providers still pending have their timing left as None
+    conclusive = not pending and not failed
+    providers = [p.name for p in PROVIDERS if p.name in answers]
+    return LookupResult(_merge(answers) if answers else None, providers, conclusive, timings)
@@ -0,0 +1,375 @@
+import json
+import random
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, select, update, insert, func, or_
+from sqlalchemy.orm import Session, selectinload
+from models import db
+from models.models import Job, Work, Tag, works_tags
+from services import isbn_cache, isbn_providers, versions, importer
+
+ENRICH = 'enrich'
+IMPORT = 'import'
+
+# Statuses of a job that hasn't finished
+PENDING = ('queued', 'running')
+
+# Work fields enrichment fills in when they are empty; tags come from the categories
+ENRICHED_FIELDS = ('description', 'publisher', 'cover_url')
+
+# Tries per kind where JOB_MAX_ATTEMPTS doesn't apply. An import commits as it
+# goes, so running it again would add its copies twice
+MAX_ATTEMPTS = {IMPORT: 1}
+
+
+class RetryLater(Exception):
+    """The job couldn't finish now, for example no provider answered in time"""
+
+
+def missing_fields(work):
+    """Names of the fields enrichment could fill on a work"""
+    missing = [field for field in ENRICHED_FIELDS if not getattr(work, field)]
+    if not work.tags:
+        missing.append('tags')
+    return missing
+
+
+def _missing_clause():
+    untagged = ~select(works_tags.c.works_id).where(works_tags.c.works_id == Work.id).exists()
+    empty = [or_(getattr(Work, field).is_(None), getattr(Work, field) == '') for field in ENRICHED_FIELDS]
+    return or_(*empty, untagged)
+
+
+def enqueue_missing():
+    """Queue enrichment of every work with an ISBN, an empty field and no job pending; returns how many"""
+    pending = select(Job.id).where(Job.work_id == Work.id, Job.kind == ENRICH, Job.status.in_(PENDING)).exists()
+    work_ids = db.session.scalars(
+        select(Work.id).where(Work.isbn.isnot(None), _missing_clause(), ~pending).order_by(Work.id)
+    ).all()
+
+    now = datetime.utcnow()
+    for i in range(0, len(work_ids), 1000):
+        db.session.execute(insert(Job), [
+            {'kind': ENRICH, 'work_id': work_id, 'status': 'queued', 'attempts': 0, 'run_after': now, 'created_at': now}
+            for work_id in work_ids[i:i + 1000]
+        ])
+    if work_ids:
+        versions.bump(db.session.connection(), ['jobs'])
+    db.session.commit()
+    worker.wake()
+    return len(work_ids)
+
+
+def enqueue_import(rows, default_location=None):
+    """Queue an import of parsed ISBN rows (importer.read_isbn_file); returns the job"""
+    job = Job(kind=IMPORT, payload=json.dumps({'rows': rows, 'location': default_location}))
+    db.session.add(job)
+    db.session.commit()
+    worker.wake()
+    return job
+
+
+def latest(work_id):
+    """The newest enrichment job of a work, or None"""
+    return db.session.scalars(
+        select(Job).where(Job.work_id == work_id, Job.kind == ENRICH).order_by(Job.id.desc()).limit(1)
+    ).first()
+
+
+def describe(job):
+    """A job as JSON for the status endpoints"""
+    result = json.loads(job.result) if job.result else None
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'work_id': job.work_id,
+        'status': job.status,
+        'attempts': job.attempts,
+        'run_after': job.run_after.isoformat(),
+        'filled': (result or []) if job.kind == ENRICH else [],
+        'result': result,
+        'error': job.error,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def counts():
+    """{status: number of jobs}"""
+    rows = db.session.execute(select(Job.status, func.count()).group_by(Job.status))
+    return {status: count for status, count in rows}
+
+
+def claim():
+    """
+    Take the next due job, or return None. A claim is a conditional UPDATE,
+    so two threads or processes never run the same job; a running job whose
+    lease ran out (its process died) is due again.
+    """
+    lease = timedelta(seconds=current_app.config['JOB_LEASE_SECONDS'])
+    while True:
+        now = datetime.utcnow()
+        # On PostgreSQL, workers skip the rows others are claiming instead of queueing behind them
+        job_id = db.session.scalar(
+            select(Job.id).where(Job.status.in_(PENDING), Job.run_after <= now)
+            .order_by(Job.run_after).limit(1).with_for_update(skip_locked=True)
+        )
+        if job_id is None:
+            db.session.commit()
+            return None
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status.in_(PENDING), Job.run_after <= now)
+            .values(status='running', attempts=Job.attempts + 1, run_after=now + lease)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if claimed:
+            # A running job shows on its work's page, which is conditional on 'jobs'
+            versions.bump(db.session.connection(), ['jobs'])
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+
+
+def heartbeat(job_id):
+    """Extend a running job's claim; long jobs call this as they go so no other worker takes them over"""
+    lease = timedelta(seconds=current_app.config['JOB_LEASE_SECONDS'])
+    db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == 'running')
+        .values(run_after=datetime.utcnow() + lease)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def _max_attempts(kind):
+    return MAX_ATTEMPTS.get(kind, current_app.config['JOB_MAX_ATTEMPTS'])
+
+
+def _retry_delay(attempts):
+    """Exponential backoff from JOB_RETRY_SECONDS, with jitter so failed jobs don't retry together"""
+    base = current_app.config['JOB_RETRY_SECONDS']
+    return timedelta(seconds=base * 2 ** (attempts - 1) * random.uniform(0.75, 1.25))
+
+
+def _finish(job_id, result):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return
+    job.status = 'done'
+    job.result = json.dumps(result)
+    job.error = None
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def _retry_or_fail(job_id, kind, attempts, error):
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return
+    job.error = str(error) or type(error).__name__
+    if attempts >= _max_attempts(kind):
+        job.status = 'failed'
+        job.finished_at = datetime.utcnow()
+    else:
+        job.status = 'queued'
+        job.run_after = datetime.utcnow() + _retry_delay(attempts)
+    db.session.commit()
+
+
+def run_next():
+    """Claim and run one due job; returns False if none was due"""
+    job = claim()
+    if job is None:
+        return False
+    job_id, kind, work_id, payload, attempts = job.id, job.kind, job.work_id, job.payload, job.attempts
+    db.session.commit()
+
+    # A claim that lapsed on the last try: the process running it died, and it mustn't run again
+    if attempts > _max_attempts(kind):
+        _retry_or_fail(job_id, kind, attempts, RuntimeError('Stopped before finishing'))
+        return True
+
+    try:
+        result = HANDLERS[kind](job_id, work_id, payload)
+    except Exception as e:
+        db.session.rollback()
+        if isinstance(e, RetryLater):
+            current_app.logger.info('Job %s (%s) will be retried: %s', job_id, kind, e)
+        else:
+            current_app.logger.exception('Job %s (%s) failed', job_id, kind)
+        _retry_or_fail(job_id, kind, attempts, e)
+    else:
+        _finish(job_id, result)
+    return True
+
+
+def _lookup(isbn, missing):
+    """Metadata for an ISBN, None if no provider knows it; raises RetryLater if they couldn't tell"""
+    cached = isbn_cache.get_cached(isbn)
+    db.session.commit()
+    if cached is not None and not cached['success']:
+        return None
+    wanted = ['categories' if field == 'tags' else field for field in missing]
+    if cached is not None and all(cached.get(key) for key in wanted):
+        return cached
+
+    lookup = isbn_providers.lookup(
+        isbn,
+        timeout=current_app.config['ISBN_LOOKUP_TIMEOUT'],
+        merge_budget=current_app.config['ISBN_MERGE_BUDGET']
+    )
+    if lookup.data:
+        if not lookup.local:
+            isbn_cache.store(isbn, lookup.data, lookup.provider)
+        return lookup.data
+    if lookup.conclusive:
+        isbn_cache.store(isbn, None)
+        return None
+    if cached is not None:
+        return cached
+    raise RetryLater('No ISBN provider answered')
+
+
+def _tags(labels):
+    """Tags with these labels, ignoring case, adding genre tags for new ones"""
+    tags = {}
+    for label in labels:
+        label = label.strip()
+        if not label or label.lower() in tags:
+            continue
+        tag = db.session.scalars(select(Tag).where(func.lower(Tag.label) == label.lower()).limit(1)).first()
+        if tag is None:
+            tag = Tag(label=label, type='genre')
+            db.session.add(tag)
+        tags[label.lower()] = tag
+    return list(tags.values())
+
+
+def enrich(work_id):
+    """Fill a work's empty fields from its ISBN; returns the names of the fields filled"""
+    work = db.session.get(Work, work_id, options=[selectinload(Work.tags)])
+    if work is None or work.isbn is None:
+        return []
+    isbn, missing = work.isbn, missing_fields(work)
+    # No transaction stays open while the providers are asked
+    db.session.commit()
+    if not missing:
+        return []
+
+    data = _lookup(isbn, missing)
+    if data is None:
+        return []
+
+    # Someone may have edited the work meanwhile; only what is still empty gets filled
+    work = db.session.get(Work, work_id, options=[selectinload(Work.tags)], populate_existing=True)
+    if work is None:
+        return []
+    filled = []
+    for field in ENRICHED_FIELDS:
+        if not getattr(work, field) and data.get(field):
+            setattr(work, field, data[field])
+            filled.append(field)
+    if not work.tags and data.get('categories'):
+        work.tags = _tags(data['categories'])
+        filled.append('tags')
+    db.session.commit()
+    return filled
+
+
+def run_import(job_id, work_id, payload):
+    """Import the rows of a queued ISBN file; returns the import report"""
+    data = json.loads(payload)
+    report = importer.import_rows(
+        data['rows'],
+        default_location=data.get('location'),
+        timeout=current_app.config['ISBN_LOOKUP_TIMEOUT'],
+        progress=lambda done: heartbeat(job_id)
+    )
+    return report.to_dict()
+
+
+# Job kind: function run with the job's id, work id and payload, returning what to record as its result
+HANDLERS = {
+    ENRICH: lambda job_id, work_id, payload: enrich(work_id),
+    IMPORT: run_import
+}
+
+
+class Worker:
+    """The threads that run jobs in this process, started on the first request"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._signals = 0
+        self._threads = []
+
+    @property
+    def started(self):
+        return bool(self._threads)
+
+    def start(self, app):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(app.config['JOB_WORKERS']):
+                thread = threading.Thread(target=self._run, args=(app,), name=f'jobs-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def wake(self):
+        """Tell idle threads there is new work"""
+        with self._wakeup:
+            self._signals += 1
+            self._wakeup.notify_all()
+
+    def _run(self, app):
+        while True:
+            with self._lock:
+                signals = self._signals
+            try:
+                with app.app_context():
+                    ran = run_next()
+            except Exception:
+                # Most likely the database is unreachable; wait and try again
+                app.logger.exception('Job worker error')
+                ran = False
+            if not ran:
+                with self._wakeup:
+                    if self._signals == signals:
+                        self._wakeup.wait(app.config['JOB_POLL_SECONDS'])
+
+
+worker = Worker()
+
+
+@event.listens_for(Session, 'before_flush')
+def _enqueue_new_works(session, flush_context, instances):
+    """Queue enrichment of works added with an ISBN but missing some fields"""
+    for obj in list(session.new):
+        if isinstance(obj, Work) and obj.isbn is not None and missing_fields(obj):
+            session.add(Job(kind=ENRICH, work=obj))
+            session.info['jobs_enqueued'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_worker(session):
+    if session.info.pop('jobs_enqueued', None):
+        worker.wake()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_enqueued(session):
+    session.info.pop('jobs_enqueued', None)
+
+
+def init_app(app):
+    """Start the worker threads with the first request, so the gunicorn master and CLI commands never run them"""
+    if not app.config['JOB_WORKERS']:
+        return
+
+    @app.before_request
+    def _start_worker():
+        if not worker.started:
+            worker.start(app)
@@ -0,0 +1,104 @@
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, selectinload, joinedload, load_only, defer, undefer
+from models.models import Work, Copy, Author, Tag, Location, User
+
+# Loader options for each page, named after what the template walks.
+# Many-to-one links already in the session (copy.work on a work's own page)
+# are served from the identity map and need no option. List pages show the
+# start of a work's description (Work.summary), never the whole text, and
+# no author bios.
+
+WORK_CARDS = (
+    defer(Work.description),
+    undefer(Work.summary),
+    selectinload(Work.authors).defer(Author.bio),
+    selectinload(Work.copies),
+    selectinload(Work.cover)
+)
+
+WORK_DETAIL = (selectinload(Work.authors), selectinload(Work.tags), selectinload(Work.cover))
+
+COPY_CARDS = (
+    joinedload(Copy.work).defer(Work.description),
+    joinedload(Copy.work).undefer(Work.summary),
+    joinedload(Copy.work).selectinload(Work.authors).defer(Author.bio),
+    joinedload(Copy.work).selectinload(Work.cover),
+    joinedload(Copy.location)
+)
+
+COPY_DETAIL = (
+    joinedload(Copy.work).selectinload(Work.authors),
+    joinedload(Copy.work).selectinload(Work.tags),
+    joinedload(Copy.work).selectinload(Work.cover),
+    joinedload(Copy.location),
+    joinedload(Copy.owner),
+    joinedload(Copy.borrower)
+)
+
+AUTHOR_LIST = (defer(Author.bio), selectinload(Author.works).load_only(Work.id))
+
+AUTHOR_DETAIL = (
+    selectinload(Author.works).defer(Work.description),
+    selectinload(Author.works).undefer(Work.summary),
+    selectinload(Author.works).selectinload(Work.tags)
+)
+
+AUTHOR_EDIT = (selectinload(Author.alt_names),)
+
+TAG_DETAIL = (
+    selectinload(Tag.works).defer(Work.description),
+    selectinload(Tag.works).undefer(Work.summary),
+    selectinload(Tag.works).selectinload(Work.authors).defer(Author.bio)
+)
+
+# Edit forms are filled from the object, parent included
+TAG_EDIT = (joinedload(Tag.parent),)
+
+LOCATION_EDIT = (joinedload(Location.parent),)
+
+USER_LIST = (
+    selectinload(User.owned_copies).load_only(Copy.id),
+    selectinload(User.borrowed_copies).load_only(Copy.id)
+)
+
+
+class LazyLoadError(RuntimeError):
+    """A relationship was loaded lazily while STRICT_LOADING is on"""
+
+
+def _strict():
+    return has_app_context() and current_app.config.get('STRICT_LOADING')
+
+
+@event.listens_for(Session, 'before_flush')
+def _flush_started(session, flush_context, instances):
+    session.info['loaders_flushing'] = True
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _flush_finished(session, flush_context):
+    session.info.pop('loaders_flushing', None)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _flush_failed(session, previous_transaction):
+    session.info.pop('loaders_flushing', None)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _refuse_lazy_loads(orm_execute_state):
+    """
+    In strict mode, raise on any lazy load a page didn't plan for with a
+    loader option. Loads the unit of work makes while flushing are allowed.
+    Touching an object expired by a commit reloads its eager relationships
+    one by one too, so this also catches e.g. redirecting to object.id.
+    """
+    if not orm_execute_state.is_select:
+        return
+    state = orm_execute_state.lazy_loaded_from
+    if state is None or orm_execute_state.session.info.get('loaders_flushing') or not _strict():
+        return
+    path = orm_execute_state.loader_strategy_path
+    attribute = path[-1].key if path is not None and len(path) else '?'
+    raise LazyLoadError(f'Lazy load of {state.class_.__name__}.{attribute}; add a loader option for it')
@@ -0,0 +1,170 @@
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request, has_request_context, before_render_template, template_rendered, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Histogram bucket upper bounds
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Metric name: (help text, buckets, stat)
+HISTOGRAMS = {
+    'bookshelf_request_seconds': ('Time spent handling a request', SECONDS_BUCKETS, 'total'),
+    'bookshelf_request_queries': ('SQL statements executed per request', QUERY_BUCKETS, 'queries'),
+    'bookshelf_request_sql_seconds': ('Time spent in SQL per request', SECONDS_BUCKETS, 'sql'),
+    'bookshelf_request_upstream_seconds': ('Time spent waiting on ISBN providers per request', SECONDS_BUCKETS, 'upstream'),
+    'bookshelf_request_render_seconds': ('Time spent rendering templates per request', SECONDS_BUCKETS, 'render')
+}
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations for one label set"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    Per-endpoint histograms of request costs, kept in this process.
+
+    Each worker process keeps its own numbers, so with several workers every
+    scrape sees only the one that answered it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, endpoint, stats):
+        with self._lock:
+            for name, (_, buckets, stat) in HISTOGRAMS.items():
+                key = (name, endpoint)
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram(buckets)
+                self._histograms[key].observe(stats[stat])
+
+    def render(self):
+        """The histograms in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (help_text, _, _) in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, endpoint), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    label = f'endpoint="{endpoint}"'
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{label}}} {histogram.sum:.6g}')
+                    lines.append(f'{name}_count{{{label}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _stats():
+    """This request's running totals, or None outside a request"""
+    if not has_request_context():
+        return None
+    return g.get('metrics')
+
+
+@contextmanager
+def track(stat):
+    """Add the time spent in the block to a stat of the current request, if there is one"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = _stats()
+        if stats is not None:
+            stats[stat] += time.perf_counter() - start
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats = _stats()
+    if stats is not None:
+        stats['queries'] += 1
+        stats['sql'] += elapsed
+
+
+def _render_started(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None:
+        # Only the outermost template counts; includes render inside it
+        if not stats['render_depth']:
+            stats['render_started'] = time.perf_counter()
+        stats['render_depth'] += 1
+
+
+def _render_finished(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None and stats['render_depth']:
+        stats['render_depth'] -= 1
+        if not stats['render_depth']:
+            stats['render'] += time.perf_counter() - stats['render_started']
+
+
+def _request_started():
+    g.metrics = {'start': time.perf_counter(), 'queries': 0, 'sql': 0.0, 'upstream': 0.0,
+                 'render': 0.0, 'render_depth': 0, 'render_started': None}
+
+
+def _request_finished(response):
+    stats = _stats()
+    if stats is None:
+        return response
+    stats['total'] = time.perf_counter() - stats['start']
+
+    timing = (
+        f'db;desc="{stats["queries"]} queries";dur={stats["sql"] * 1000:.1f}, '
+        f'upstream;dur={stats["upstream"] * 1000:.1f}, '
+        f'render;dur={stats["render"] * 1000:.1f}, '
+        f'app;dur={stats["total"] * 1000:.1f}'
+    )
+    existing = response.headers.get('Server-Timing')
+    response.headers['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+
+    if request.endpoint and request.endpoint != 'metrics':
+        registry.observe(request.endpoint, stats)
+    return response
+
+
+def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Time every request of the app and serve the histograms at /metrics"""
+    app.before_request(_request_started)
+    app.after_request(_request_finished)
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,154 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_, text, select, func, literal, and_, or_
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
+from models import db
+
+PAGE_SIZE = 48
+MAX_PAGE_SIZE = 200
+
+
+class Page:
+    """One page of a keyset paginated query, with cursors for its neighbours"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Return the cursor's sort values, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = [_decode_value(value) for value in json.loads(raw)]
+    except (ValueError, TypeError):
+        return None
+    return values if len(values) == size else None
+
+
+def _unwrap(key):
+    """(column, whether it may be NULL) for a key; keys that may be NULL are wrapped in nulls_last()"""
+    if isinstance(key, UnaryExpression) and key.modifier is operators.nulls_last_op:
+        return key.element, True
+    return key, False
+
+
+def _past(keys, nullable, cursor, reverse):
+    """Rows after the cursor in the walking order, with NULLs after every value"""
+    values = [None if value is None else literal(value, key.type) for key, value in zip(keys, cursor)]
+    if not any(nullable):
+        position, start = tuple_(*keys), tuple_(*values)
+        return position < start if reverse else position > start
+
+    # A row comparison is unknown as soon as a NULL is involved, so spell it out key by key
+    clauses = []
+    for i, (key, may_be_null, value) in enumerate(zip(keys, nullable, values)):
+        if value is None:
+            step = key.isnot(None) if reverse else None
+        elif reverse:
+            step = key < value
+        else:
+            step = or_(key > value, key.is_(None)) if may_be_null else key > value
+        if step is not None:
+            equal = [key.is_(None) if value is None else key == value for key, value in zip(keys[:i], values[:i])]
+            clauses.append(and_(*equal, step))
+    return or_(*clauses)
+
+
+def paginate(query, keys, descending=False, after=None, before=None, per_page=PAGE_SIZE):
+    """
+    Return a Page of an ORM query ordered by keys, whose last key must be unique.
+
+    Rather than an OFFSET, the page starts right after (or ends right before)
+    the sort values in a cursor, so every page costs the same as the first one
+    when there is an index on the keys. A key that may be NULL, such as a
+    column of an outer joined table, is passed as nulls_last(key); its NULLs
+    sort after every value.
+    """
+    keys, nullable = zip(*[_unwrap(key) for key in keys])
+    per_page = max(1, min(per_page or PAGE_SIZE, MAX_PAGE_SIZE))
+    backwards = decode_cursor(before, len(keys)) is not None
+    cursor = decode_cursor(before, len(keys)) if backwards else decode_cursor(after, len(keys))
+
+    # Walking backwards reverses the order, then the page is flipped back
+    reverse = descending != backwards
+    if cursor is not None:
+        query = query.filter(_past(keys, nullable, cursor, reverse))
+    order = []
+    for key, may_be_null in zip(keys, nullable):
+        if reverse:
+            order.append(key.desc().nulls_first() if may_be_null else key.desc())
+        else:
+            order.append(key.asc().nulls_last() if may_be_null else key.asc())
+    query = query.add_columns(*keys).order_by(*order)
+
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    first = encode_cursor(rows[0][1:]) if rows else None
+    last = encode_cursor(rows[-1][1:]) if rows else None
+    if backwards:
+        return Page(items, next_cursor=last, prev_cursor=first if more else None)
+    return Page(items, next_cursor=last if more else None, prev_cursor=first if cursor is not None else None)
+
+
+def estimate_count(model, query=None):
+    """
+    Roughly how many rows a query (or the whole table) has, without counting them.
+
+    PostgreSQL's table statistics or planner estimate is used there. SQLite
+    can only estimate a whole table, from its highest id; a filtered query
+    returns None.
+    """
+    conn = db.session.connection()
+    if conn.dialect.name == 'postgresql':
+        if query is None:
+            reltuples = conn.execute(
+                text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)"),
+                {'table': model.__tablename__}
+            ).scalar()
+            # Never analyzed yet, which only happens while the table is small
+            if reltuples is None or reltuples < 0:
+                return conn.execute(select(func.count()).select_from(model)).scalar()
+            return int(reltuples)
+        compiled = query.statement.compile(dialect=conn.dialect, compile_kwargs={'render_postcompile': True})
+        plan = conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled}', compiled.params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    if query is None:
+        return conn.execute(select(func.max(model.id))).scalar() or 0
+    return None
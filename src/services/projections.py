@@ -0,0 +1,85 @@
+"""
+Column projections: plain selects of just the columns a response shows,
+with related names aggregated into JSON by the same statement. Rows come
+back as tuples, so nothing is added to the session's identity map.
+"""
+import json
+from sqlalchemy import select, func, and_, literal_column
+from models.models import Work, Copy, Author, Tag, Location, Cover, works_authors, works_tags
+from services import covers
+
+
+def json_list(conn, column, where, order_by):
+    """Correlated subquery aggregating column into a JSON array, per dialect"""
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import aggregate_order_by
+        aggregate = func.json_agg(aggregate_order_by(column, order_by))
+    else:
+        # SQLite aggregates in the order of the index the lookup walks
+        aggregate = func.json_group_array(column)
+    return select(aggregate).where(where).scalar_subquery()
+
+
+def json_object(conn, **columns):
+    """A JSON object built from columns, per dialect"""
+    build = func.json_build_object if conn.dialect.name == 'postgresql' else func.json_object
+    return build(*(part for key, column in columns.items() for part in (literal_column(f"'{key}'"), column)))
+
+
+def as_list(value):
+    """An aggregated JSON array as a list; SQLite returns it as text"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = json.loads(value)
+    return [item for item in value if item is not None]
+
+
+def as_object(value):
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+
+def work_results(conn, work_ids):
+    """
+    Search result dicts for works, in the order of work_ids, from a single
+    statement: only the card's columns and the authors, tags and first
+    location aggregated per work. Like the list pages, a card shows the
+    start of the description (Work.summary), so only that is selected.
+    """
+    authors = json_list(
+        conn, json_object(conn, id=Author.id, name=Author.primary_name),
+        and_(works_authors.c.works_id == Work.id, works_authors.c.authors_id == Author.id),
+        works_authors.c.authors_id
+    )
+    tags = json_list(
+        conn, json_object(conn, id=Tag.id, label=Tag.label),
+        and_(works_tags.c.works_id == Work.id, works_tags.c.tags_id == Tag.id),
+        works_tags.c.tags_id
+    )
+    location = (
+        select(json_object(conn, id=Location.id, name=Location.name))
+        .where(Copy.work_id == Work.id, Location.id == Copy.location_id)
+        .order_by(Copy.id).limit(1).scalar_subquery()
+    )
+    rows = conn.execute(
+        select(Work.id, Work.title, Work.isbn, Work.summary, Work.cover_url, Cover.url, Cover.digest,
+               authors.label('authors'), tags.label('tags'), location.label('location'))
+        .outerjoin(Cover, Cover.url == Work.cover_url)
+        .where(Work.id.in_(work_ids))
+    )
+
+    results = {}
+    for id, title, isbn, summary, cover_url, stored_url, digest, authors, tags, location in rows:
+        results[id] = {
+            'id': id,
+            'title': title or '',
+            'isbn': isbn or '',
+            'summary': summary or '',
+            'cover_url': covers.src(cover_url, stored_url is not None, digest) or '',
+            'authors': as_list(authors),
+            'tags': as_list(tags),
+            'location': as_object(location)
+        }
+    return [results[id] for id in work_ids if id in results]
@@ -0,0 +1,417 @@
+"""
+Restore the library from an export. Records are read as a stream and
+loaded with bulk inserts: COPY on PostgreSQL, executemany on SQLite, all in
+one transaction with the secondary indexes dropped until the data is in.
+"""
+import csv
+import gzip
+import io
+import json
+import time
+from operator import itemgetter
+from datetime import datetime
+from sqlalchemy import text, select, func, inspect, DateTime, Integer
+from sqlalchemy.schema import AddConstraint
+from models import db
+from models.models import Work, Copy, Author, AuthorName, Tag, Location, User, works_authors, works_tags
+from services import export, search, fuzzy_index, user_cache, versions, isbn
+from services.serialize import loads
+
+# Rows buffered per table before they are written
+BATCH_ROWS = 10000
+
+# Characters read from the file at a time
+READ_SIZE = 1 << 20
+
+# Entity name: tables its records fill, in load order
+TABLES = {
+    'users': (User.__table__,),
+    'locations': (Location.__table__,),
+    'tags': (Tag.__table__,),
+    'authors': (Author.__table__, AuthorName.__table__),
+    'works': (Work.__table__, works_authors, works_tags),
+    'copies': (Copy.__table__,)
+}
+
+# Fields of a CSV export holding '; ' joined lists
+LIST_FIELDS = {'alt_names': str, 'author_ids': int, 'tag_ids': int}
+
+
+class RestoreReport:
+    """Rows loaded per table and where the time went"""
+
+    def __init__(self):
+        self.tables = {}
+        self.users_without_password = 0
+        self.load_seconds = 0.0
+        self.index_seconds = 0.0
+        self.elapsed = 0.0
+
+    @property
+    def rows(self):
+        return sum(self.tables.values())
+
+    @property
+    def rate(self):
+        return self.rows / self.load_seconds if self.load_seconds else 0.0
+
+    def to_dict(self):
+        return {
+            'tables': self.tables,
+            'rows': self.rows,
+            'users_without_password': self.users_without_password,
+            'load_seconds': round(self.load_seconds, 2),
+            'index_seconds': round(self.index_seconds, 2),
+            'elapsed_seconds': round(self.elapsed, 2),
+            'rows_per_second': round(self.rate, 1)
+        }
+
+    def summary(self):
+        counts = ', '.join(f'{count} {table}' for table, count in self.tables.items())
+        return (f'{self.rows} rows in {self.elapsed:.1f}s ({self.rate:.0f} rows/s loading, '
+                f'{self.index_seconds:.1f}s indexing): {counts}; '
+                f'{self.users_without_password} users without a password')
+
+
+# ~ Reading ~ #
+
+def open_dump(path):
+    """The dump as text, gunzipped if it is compressed"""
+    with open(path, 'rb') as file:
+        compressed = file.read(2) == b'\x1f\x8b'
+    if compressed:
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def guess_format(path):
+    """The export format named by a file's extension, ignoring .gz"""
+    name = path[:-3] if path.endswith('.gz') else path
+    for format in export.FORMATS:
+        if name.endswith('.' + format):
+            return format
+    return None
+
+
+def _ndjson_records(file):
+    for line in file:
+        if line.strip():
+            record = loads(line)
+            yield record.pop('entity'), record
+
+
+def _json_records(file):
+    """
+    Walk an {"entity": [record, ...], ...} document one record at a time, so
+    a large JSON export doesn't have to fit in memory at once.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, done = '', 0, False
+
+    def next_char():
+        nonlocal buffer, pos, done
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or done:
+                return buffer[pos] if pos < len(buffer) else ''
+            buffer, pos = file.read(READ_SIZE), 0
+            done = not buffer
+
+    def expect(char):
+        nonlocal pos
+        if next_char() != char:
+            raise ValueError(f'Malformed JSON export: expected {char!r}')
+        pos += 1
+
+    def value():
+        nonlocal buffer, pos, done
+        next_char()
+        while True:
+            try:
+                decoded, end = decoder.raw_decode(buffer, pos)
+                # A number may continue past the end of what has been read
+                if end < len(buffer) or done:
+                    pos = end
+                    return decoded
+            except json.JSONDecodeError:
+                if done:
+                    raise ValueError('Malformed JSON export: truncated')
+            more = file.read(READ_SIZE)
+            buffer, pos, done = buffer[pos:] + more, 0, not more
+
+    expect('{')
+    if next_char() == '}':
+        return
+    while True:
+        entity = value()
+        expect(':')
+        expect('[')
+        if next_char() == ']':
+            pos += 1
+        else:
+            while True:
+                yield entity, value()
+                if next_char() == ',':
+                    pos += 1
+                    continue
+                expect(']')
+                break
+        if next_char() == ',':
+            pos += 1
+            continue
+        expect('}')
+        return
+
+
+def _csv_records(file, entity):
+    """Records of a one-entity CSV export, with empty cells as None"""
+    columns = {column.name: column for table in TABLES[entity] for column in table.columns}
+    for row in csv.DictReader(file):
+        record = {}
+        for field, value in row.items():
+            if field in LIST_FIELDS:
+                value = [LIST_FIELDS[field](item) for item in value.split('; ')] if value else []
+            elif value == '':
+                value = None
+            elif field in columns and isinstance(columns[field].type, Integer):
+                value = int(value)
+            record[field] = value
+        yield entity, record
+
+
+def records(file, format, entity=None):
+    """Yield (entity, record) from an open export"""
+    if format == 'ndjson':
+        return _ndjson_records(file)
+    if format == 'json':
+        return _json_records(file)
+    if format == 'csv':
+        if entity not in TABLES:
+            raise ValueError(f'A CSV export holds one entity; name it: {", ".join(TABLES)}')
+        return _csv_records(file, entity)
+    raise ValueError(f'Unknown format: {format}')
+
+
+# ~ Rows ~ #
+
+def _rows(entity, record, passwords):
+    """(table, row) pairs a record becomes"""
+    if entity == 'users':
+        yield User.__table__, dict(record, password_hash=passwords.get(record['name']))
+    elif entity in ('locations', 'tags'):
+        yield TABLES[entity][0], {key: value for key, value in record.items() if key != 'path'}
+    elif entity == 'authors':
+        yield Author.__table__, {key: value for key, value in record.items() if key != 'alt_names'}
+        for name in record.get('alt_names') or ():
+            yield AuthorName.__table__, {'author_id': record['id'], 'alt_name': name}
+    elif entity == 'works':
+        row = {key: value for key, value in record.items() if key not in ('author_ids', 'tag_ids')}
+        # Older exports have ISBNs as numbers
+        yield Work.__table__, dict(row, isbn=isbn.stored(row.get('isbn')))
+        for author_id in record.get('author_ids') or ():
+            yield works_authors, {'works_id': record['id'], 'authors_id': author_id}
+        for tag_id in record.get('tag_ids') or ():
+            yield works_tags, {'works_id': record['id'], 'tags_id': tag_id}
+    elif entity == 'copies':
+        yield Copy.__table__, record
+
+
+def _defaults(table):
+    """Values for the columns an export leaves out, such as updated_at"""
+    values = {}
+    for column in table.columns:
+        if column.default is not None and column.default.is_scalar:
+            values[column.name] = column.default.arg
+        elif column.default is not None and column.default.is_callable:
+            values[column.name] = column.default.arg(None)
+    return values
+
+
+def _parse_dates(table, row):
+    for column in table.columns:
+        value = row.get(column.name)
+        if isinstance(value, str) and isinstance(column.type, DateTime):
+            row[column.name] = datetime.fromisoformat(value)
+    return row
+
+
+# ~ Writing ~ #
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_text(value):
+    """A value in PostgreSQL's COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.translate(_COPY_ESCAPES)
+    return str(value)
+
+
+class _Loader:
+    """Buffers rows per table and writes them in dependency order"""
+
+    def __init__(self, conn, tables):
+        self.conn = conn
+        self.tables = [table for table in db.metadata.sorted_tables if table in tables]
+        self.buffers = {table: [] for table in self.tables}
+        self.counts = {table.name: 0 for entity in TABLES.values() for table in entity if table in tables}
+        self.defaults = {table: _defaults(table) for table in self.tables}
+        self.copy = conn.dialect.driver == 'psycopg2'
+
+    def add(self, table, row):
+        buffer = self.buffers[table]
+        buffer.append(row)
+        if len(buffer) >= BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        # Parents first, so every batch's references are already in
+        for table in self.tables:
+            rows = self.buffers[table]
+            if rows:
+                self._write(table, rows)
+                self.counts[table.name] += len(rows)
+                self.buffers[table] = []
+
+    def _write(self, table, rows):
+        # Ids the export doesn't carry (alternate names') come from the table
+        names = [column.name for column in table.columns if not (column.primary_key and column.name not in rows[0])]
+        base = {name: self.defaults[table].get(name) for name in names}
+
+        if self.copy:
+            values = itemgetter(*names)
+            buffer = io.StringIO(''.join(['\t'.join(map(_copy_text, values({**base, **row}))) + '\n' for row in rows]))
+            cursor = self.conn.connection.dbapi_connection.cursor()
+            try:
+                cursor.copy_expert(f'COPY {table.name} ({", ".join(names)}) FROM STDIN', buffer)
+            finally:
+                cursor.close()
+        else:
+            self.conn.execute(table.insert(), [_parse_dates(table, {**base, **row}) for row in rows])
+
+
+def fix_sequences(conn, tables=None):
+    """Move PostgreSQL id sequences past the ids inserted explicitly"""
+    if conn.dialect.name != 'postgresql':
+        return
+    for table in tables or db.metadata.sorted_tables:
+        if 'id' in table.c and table.c.id.primary_key and isinstance(table.c.id.type, Integer):
+            conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 1) FROM {table.name}))"
+            ))
+
+
+def _drop_foreign_keys(conn, tables):
+    """Drop the foreign keys of tables on PostgreSQL, returning the constraints to add back"""
+    if conn.dialect.name != 'postgresql':
+        return []
+    inspector = inspect(conn)
+    for table in tables:
+        for foreign_key in inspector.get_foreign_keys(table.name):
+            conn.execute(text(f'ALTER TABLE {table.name} DROP CONSTRAINT {foreign_key["name"]}'))
+    return [constraint for table in tables for constraint in table.foreign_key_constraints]
+
+
+def _dependents(tables):
+    """Other tables whose rows are deleted with rows of these (ON DELETE CASCADE), such as jobs"""
+    return [table for table in db.metadata.sorted_tables if table not in tables and any(
+        key.ondelete == 'CASCADE' and key.column.table in tables for key in table.foreign_keys
+    )]
+
+
+def _clear(conn, tables):
+    dependents = _dependents(tables)
+    if conn.dialect.name == 'postgresql':
+        names = [table.name for table in tables + dependents]
+        # The search table references works; it is rebuilt afterwards anyway
+        if Work.__table__ in tables:
+            names.append('works_search')
+        conn.execute(text(f'TRUNCATE {", ".join(names)}'))
+    else:
+        for table in reversed(tables + dependents):
+            conn.execute(table.delete())
+
+
+def restore(records, entities=tuple(TABLES), replace=False, log=print):
+    """
+    Load the records of the given entities from (entity, record) pairs of an
+    export into their tables, which must be empty unless replace is set.
+
+    Ids are kept as exported. Password hashes aren't exported, so users keep
+    the password of a user of the same name already in the database, and
+    have none otherwise.
+    """
+    report = RestoreReport()
+    start = time.perf_counter()
+    tables = [table for table in db.metadata.sorted_tables
+              if any(table in TABLES[entity] for entity in entities)]
+    indexes = [index for table in tables for index in table.indexes]
+
+    with db.engine.begin() as conn:
+        passwords = {}
+        if User.__table__ in tables:
+            passwords = dict(conn.execute(
+                select(User.name, User.password_hash).where(User.password_hash.isnot(None))
+            ).all())
+
+        filled = [table.name for table in tables if conn.execute(select(func.count()).select_from(table)).scalar()]
+        if filled and not replace:
+            raise ValueError(f'Tables already hold data: {", ".join(filled)}; restore with replace to empty them')
+        if filled:
+            log(f'Emptying {", ".join(filled)}')
+            _clear(conn, tables)
+
+        # Building each index once at the end beats updating it row by row, and
+        # checking each foreign key once beats a trigger per row on PostgreSQL
+        for index in indexes:
+            conn.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+        foreign_keys = _drop_foreign_keys(conn, tables)
+
+        loader = _Loader(conn, tables)
+        load_start = time.perf_counter()
+        entity = None
+        for entity_name, record in records:
+            if entity_name not in TABLES:
+                raise ValueError(f'Unknown entity in export: {entity_name}')
+            if entity_name not in entities:
+                continue
+            if entity_name != entity:
+                entity = entity_name
+                log(f'Loading {entity}...')
+            for table, row in _rows(entity_name, record, passwords):
+                loader.add(table, row)
+        loader.flush()
+        report.load_seconds = time.perf_counter() - load_start
+        report.tables = loader.counts
+        if User.__table__ in tables:
+            report.users_without_password = conn.execute(
+                select(func.count()).select_from(User).where(User.password_hash.is_(None))
+            ).scalar()
+
+        log('Building indexes...')
+        index_start = time.perf_counter()
+        for index in indexes:
+            index.create(conn)
+        for constraint in foreign_keys:
+            conn.execute(AddConstraint(constraint))
+        fix_sequences(conn, tables)
+        versions.bump(conn, {table.name for table in tables})
+
+    with db.engine.begin() as conn:
+        conn.execute(text('ANALYZE'))
+    report.index_seconds = time.perf_counter() - index_start
+
+    # Core inserts skip the session hooks that keep these in step
+    if Work.__table__ in tables or Author.__table__ in tables or Tag.__table__ in tables:
+        log('Rebuilding the search index...')
+        search.rebuild()
+    fuzzy_index.authors.invalidate()
+    fuzzy_index.tags.invalidate()
+    user_cache.users.invalidate()
+
+    report.elapsed = time.perf_counter() - start
+    return report
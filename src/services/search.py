@@ -0,0 +1,267 @@
+import re
+from sqlalchemy import event, text, select, bindparam
+from sqlalchemy.orm import Session
+from models import db
+from models.models import Work, Author, AuthorName, Tag, works_authors, works_tags
+from services import isbn
+
+# Dialects with a full-text index; filled in by ensure_index()
+_enabled = set()
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# Digits typed before a query is also taken as the start of an ISBN; fewer are more likely a year or title
+ISBN_PREFIX_MIN = 6
+
+
+def ensure_index(engine):
+    """Create the full-text index for this database, filling it if it is new"""
+    dialect = engine.dialect.name
+
+    with engine.begin() as conn:
+        if dialect == 'sqlite':
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'works_fts'"
+            )).first()
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS works_fts USING fts5("
+                "title, authors, tags, publisher, description, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            ))
+        elif dialect == 'postgresql':
+            exists = conn.execute(text("SELECT to_regclass('works_search')")).scalar()
+            conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS works_search ("
+                "work_id integer PRIMARY KEY REFERENCES works(id) ON DELETE CASCADE, "
+                "document tsvector NOT NULL)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS works_search_document_idx ON works_search USING GIN (document)"
+            ))
+        else:
+            return
+
+    _enabled.add(dialect)
+    if not exists:
+        rebuild()
+
+
+def rebuild(batch_size=1000):
+    """Reindex every work, returning how many were indexed"""
+    conn = db.session.connection()
+    if conn.dialect.name == 'sqlite':
+        conn.execute(text("DELETE FROM works_fts"))
+    elif conn.dialect.name == 'postgresql':
+        conn.execute(text("DELETE FROM works_search"))
+
+    ids = [row[0] for row in conn.execute(select(Work.id).order_by(Work.id))]
+    for i in range(0, len(ids), batch_size):
+        reindex(conn, ids[i:i + batch_size])
+    db.session.commit()
+    return len(ids)
+
+
+def _documents(conn, work_ids):
+    """Gather the searchable text of each work, keyed by work id"""
+    docs = {}
+    rows = conn.execute(
+        select(Work.id, Work.title, Work.publisher, Work.description).where(Work.id.in_(work_ids))
+    )
+    for id, title, publisher, description in rows:
+        docs[id] = {'title': title or '', 'publisher': publisher or '', 'description': description or '',
+                    'authors': [], 'tags': []}
+
+    rows = conn.execute(
+        select(works_authors.c.works_id, Author.primary_name)
+        .join(Author, Author.id == works_authors.c.authors_id)
+        .where(works_authors.c.works_id.in_(work_ids))
+    )
+    for work_id, name in rows:
+        docs[work_id]['authors'].append(name)
+
+    rows = conn.execute(
+        select(works_authors.c.works_id, AuthorName.alt_name)
+        .join(AuthorName, AuthorName.author_id == works_authors.c.authors_id)
+        .where(works_authors.c.works_id.in_(work_ids), AuthorName.alt_name.isnot(None))
+    )
+    for work_id, name in rows:
+        docs[work_id]['authors'].append(name)
+
+    rows = conn.execute(
+        select(works_tags.c.works_id, Tag.label)
+        .join(Tag, Tag.id == works_tags.c.tags_id)
+        .where(works_tags.c.works_id.in_(work_ids))
+    )
+    for work_id, label in rows:
+        docs[work_id]['tags'].append(label)
+
+    return docs
+
+
+def reindex(conn, work_ids):
+    """Rewrite the index entries of the given works, dropping any that no longer exist"""
+    dialect = conn.dialect.name
+    if dialect not in _enabled or not work_ids:
+        return
+
+    work_ids = list(work_ids)
+    docs = _documents(conn, work_ids)
+
+    params = [dict(doc, id=id, authors=' '.join(doc['authors']), tags=' '.join(doc['tags']))
+              for id, doc in docs.items()]
+
+    if dialect == 'sqlite':
+        conn.execute(
+            text("DELETE FROM works_fts WHERE rowid IN :ids").bindparams(bindparam('ids', expanding=True)),
+            {'ids': work_ids}
+        )
+        if params:
+            conn.execute(
+                text("INSERT INTO works_fts (rowid, title, authors, tags, publisher, description) "
+                     "VALUES (:id, :title, :authors, :tags, :publisher, :description)"),
+                params
+            )
+    else:
+        conn.execute(
+            text("DELETE FROM works_search WHERE work_id IN :ids").bindparams(bindparam('ids', expanding=True)),
+            {'ids': work_ids}
+        )
+        if params:
+            # One statement per batch: the rows travel as arrays and are unnested on the server
+            conn.execute(
+                text("INSERT INTO works_search (work_id, document) "
+                     "SELECT id, "
+                     "setweight(to_tsvector('simple', title), 'A') || "
+                     "setweight(to_tsvector('simple', authors), 'B') || "
+                     "setweight(to_tsvector('simple', tags), 'C') || "
+                     "setweight(to_tsvector('simple', publisher), 'C') || "
+                     "setweight(to_tsvector('simple', description), 'D') "
+                     "FROM unnest(CAST(:ids AS integer[]), CAST(:titles AS text[]), CAST(:authors AS text[]), "
+                     "CAST(:tags AS text[]), CAST(:publishers AS text[]), CAST(:descriptions AS text[])) "
+                     "AS doc (id, title, authors, tags, publisher, description)"),
+                {name: [param[field] for param in params] for name, field in (
+                    ('ids', 'id'), ('titles', 'title'), ('authors', 'authors'), ('tags', 'tags'),
+                    ('publishers', 'publisher'), ('descriptions', 'description'))}
+            )
+
+
+def _pending(session):
+    return session.info.setdefault('search_pending', set())
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_deleted(session, flush_context, instances):
+    """Remember works linked to authors and tags about to be deleted, while the links still exist"""
+    author_ids = [obj.id for obj in session.deleted if isinstance(obj, Author)]
+    tag_ids = [obj.id for obj in session.deleted if isinstance(obj, Tag)]
+    if not author_ids and not tag_ids:
+        return
+
+    conn = session.connection()
+    if conn.dialect.name not in _enabled:
+        return
+    if author_ids:
+        rows = conn.execute(select(works_authors.c.works_id).where(works_authors.c.authors_id.in_(author_ids)))
+        _pending(session).update(row[0] for row in rows)
+    if tag_ids:
+        rows = conn.execute(select(works_tags.c.works_id).where(works_tags.c.tags_id.in_(tag_ids)))
+        _pending(session).update(row[0] for row in rows)
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_index(session, flush_context):
+    """Reindex works touched by this flush, in the same transaction"""
+    work_ids = _pending(session)
+    author_ids = set()
+    tag_ids = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Work):
+            work_ids.add(obj.id)
+        elif isinstance(obj, Author) and obj not in session.deleted:
+            author_ids.add(obj.id)
+        elif isinstance(obj, AuthorName):
+            author_ids.add(obj.author_id)
+        elif isinstance(obj, Tag) and obj not in session.deleted:
+            tag_ids.add(obj.id)
+
+    if not (work_ids or author_ids or tag_ids):
+        return
+
+    conn = session.connection()
+    if conn.dialect.name not in _enabled:
+        work_ids.clear()
+        return
+
+    if author_ids:
+        rows = conn.execute(select(works_authors.c.works_id).where(works_authors.c.authors_id.in_(author_ids)))
+        work_ids.update(row[0] for row in rows)
+    if tag_ids:
+        rows = conn.execute(select(works_tags.c.works_id).where(works_tags.c.tags_id.in_(tag_ids)))
+        work_ids.update(row[0] for row in rows)
+
+    work_ids.discard(None)
+    reindex(conn, work_ids)
+    work_ids.clear()
+
+
+def search(query, limit=50):
+    """Return work ids matching every word of the query, best match first"""
+    tokens = _TOKEN.findall(query.lower())
+    if not tokens:
+        return []
+
+    conn = db.session.connection()
+    if conn.dialect.name == 'sqlite' and 'sqlite' in _enabled:
+        # Every word must match, as a prefix since it may still be being typed
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        rows = conn.execute(
+            text("SELECT rowid FROM works_fts WHERE works_fts MATCH :match "
+                 "ORDER BY bm25(works_fts, 10.0, 5.0, 3.0, 2.0, 1.0) LIMIT :limit"),
+            {'match': match, 'limit': limit}
+        )
+    elif conn.dialect.name == 'postgresql' and 'postgresql' in _enabled:
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        rows = conn.execute(
+            text("SELECT work_id FROM works_search, to_tsquery('simple', :tsquery) AS query "
+                 "WHERE document @@ query ORDER BY ts_rank(document, query) DESC LIMIT :limit"),
+            {'tsquery': tsquery, 'limit': limit}
+        )
+    else:
+        return _fallback_search(tokens, limit)
+
+    return [row[0] for row in rows]
+
+
+def isbn_matches(query, limit=50):
+    """
+    Ids of the works whose ISBN the query is, or starts with, in ISBN order.
+    A whole ISBN-10 or ISBN-13 is one probe of the ISBN index and a partial
+    one a range scan of it; anything else matches nothing.
+    """
+    exact = isbn.canonical(query)
+    if exact is not None:
+        work_id = db.session.scalar(select(Work.id).where(Work.isbn == exact))
+        return [work_id] if work_id is not None else []
+
+    prefix = isbn.search_prefix(query)
+    if prefix is None or len(isbn.clean(query)) < ISBN_PREFIX_MIN:
+        return []
+    low, high = isbn.prefix_bounds(prefix)
+    statement = select(Work.id).where(Work.isbn >= low)
+    if high is not None:
+        statement = statement.where(Work.isbn < high)
+    return list(db.session.scalars(statement.order_by(Work.isbn).limit(limit)))
+
+
+def _fallback_search(tokens, limit):
+    """Unranked substring search for databases without a full-text index"""
+    query = db.session.query(Work.id)
+    for token in tokens:
+        query = query.filter(
+            Work.title.ilike(f'%{token}%') |
+            Work.publisher.ilike(f'%{token}%') |
+            Work.authors.any(Author.primary_name.ilike(f'%{token}%')) |
+            Work.tags.any(Tag.label.ilike(f'%{token}%'))
+        )
+    return [row[0] for row in query.limit(limit)]
@@ -0,0 +1,99 @@
+"""
+Streaming JSON responses: NDJSON or a chunked JSON array, gzipped when the
+client accepts it. Uses orjson when it's installed.
+"""
+import json
+import zlib
+from flask import Response, request, stream_with_context
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+NDJSON = 'application/x-ndjson'
+
+# Records serialized per chunk written to the client
+CHUNK_RECORDS = 100
+
+
+def dumps(obj):
+    """Compact JSON as bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def loads(data):
+    """Parse JSON from bytes or text"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def wants_ndjson():
+    """Whether the request asked for NDJSON, by ?format=ndjson or the Accept header"""
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON
+
+
+def representation():
+    """What stream() sends for this request: ('ndjson' or 'json', 'gzip' or None)"""
+    return 'ndjson' if wants_ndjson() else 'json', 'gzip' if request.accept_encodings['gzip'] > 0 else None
+
+
+def _ndjson_chunks(records):
+    lines = []
+    for record in records:
+        lines.append(dumps(record))
+        if len(lines) == CHUNK_RECORDS:
+            yield b'\n'.join(lines) + b'\n'
+            lines = []
+    if lines:
+        yield b'\n'.join(lines) + b'\n'
+
+
+def _array_chunks(records, key):
+    """{"key": [records...]} written a chunk of records at a time"""
+    yield b'{' + dumps(key) + b':['
+    items = []
+    first = True
+    for record in records:
+        items.append(dumps(record))
+        if len(items) == CHUNK_RECORDS:
+            yield (b'' if first else b',') + b','.join(items)
+            items, first = [], False
+    if items:
+        yield (b'' if first else b',') + b','.join(items)
+    yield b']}'
+
+
+def gzipped(chunks):
+    """Compress chunks as one gzip stream, flushing each so it's sent right away"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def stream(records, key):
+    """
+    Response streaming an iterable of dicts as it's consumed: NDJSON if
+    requested, otherwise the same {"key": [...]} object jsonify would give.
+    """
+    format, encoding = representation()
+    if format == 'ndjson':
+        chunks, mimetype = _ndjson_chunks(records), NDJSON
+    else:
+        chunks, mimetype = _array_chunks(records, key), 'application/json'
+
+    gzip = encoding == 'gzip'
+    if gzip:
+        chunks = gzipped(chunks)
+
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
@@ -0,0 +1,25 @@
+"""
+Thumbnailing, run in worker processes by the cover store.
+
+Kept apart from the app so the workers import nothing but Pillow, and only
+the workers import it at all.
+"""
+import importlib.util
+import os
+
+
+def available():
+    """Whether Pillow is installed, without importing it"""
+    return importlib.util.find_spec('PIL') is not None
+
+
+def make_thumbnail(source, target, size, quality=85):
+    """Shrink an image file to fit in size (width, height) and save it as JPEG"""
+    from PIL import Image
+    with Image.open(source) as image:
+        image = image.convert('RGB')
+        image.thumbnail(size, Image.LANCZOS)
+        partial = f'{target}.{os.getpid()}.tmp'
+        image.save(partial, 'JPEG', quality=quality, optimize=True)
+    os.replace(partial, target)
+    return target
@@ -0,0 +1,64 @@
+from collections import namedtuple
+from sqlalchemy import func
+from models import db
+from models.models import Work, Author, AuthorName, Tag, Location, User
+
+# Most suggestions returned for one prefix
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# model, label column, and an optional (id column, name column) of alternate names
+Source = namedtuple('Source', 'model label alternates', defaults=(None,))
+
+SOURCES = {
+    'works': Source(Work, Work.title),
+    'authors': Source(Author, Author.primary_name, (AuthorName.author_id, AuthorName.alt_name)),
+    'tags': Source(Tag, Tag.label),
+    'locations': Source(Location, Location.name),
+    'users': Source(User, User.name)
+}
+
+
+def _prefix_range(column, prefix):
+    """
+    Filter for lower(column) starting with prefix, written as a range so it
+    can use the lower() expression index on SQLite and PostgreSQL alike
+    """
+    low = prefix.lower()
+    high = low[:-1] + chr(ord(low[-1]) + 1)
+    key = func.lower(column)
+    return (key >= low) & (key < high)
+
+
+def suggest(name, prefix, limit=DEFAULT_LIMIT):
+    """[(id, label)] of a source whose label, or alternate name, starts with prefix"""
+    source = SOURCES[name]
+    model, label = source.model, source.label
+    limit = max(1, min(limit or DEFAULT_LIMIT, MAX_LIMIT))
+    prefix = prefix.strip()
+
+    query = db.session.query(model.id, label)
+    if prefix:
+        query = query.filter(_prefix_range(label, prefix))
+    rows = query.order_by(func.lower(label), model.id).limit(limit).all()
+
+    # Fill up with matches on alternate names
+    if prefix and source.alternates is not None and len(rows) < limit:
+        owner_id, alt_name = source.alternates
+        seen = {id for id, _ in rows}
+        matched = db.session.query(owner_id).filter(_prefix_range(alt_name, prefix))
+        extra = db.session.query(model.id, label).filter(model.id.in_(matched))
+        if seen:
+            extra = extra.filter(model.id.notin_(seen))
+        rows += extra.order_by(func.lower(label), model.id).limit(limit - len(rows)).all()
+
+    return [(id, text) for id, text in rows]
+
+
+def labels(name, ids):
+    """{id: label} for the ids of a source that exist"""
+    ids = [id for id in ids if id is not None]
+    if not ids:
+        return {}
+    source = SOURCES[name]
+    return dict(db.session.query(source.model.id, source.label).filter(source.model.id.in_(ids)).all())
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from models import db
+from models.models import User, UserRole
+
+
+class CachedUser(UserMixin):
+    """
+    The parts of a User that every request needs, detached from any session.
+
+    Routes that need the full row load it with to_model().
+    """
+
+    def __init__(self, id, name, permissions):
+        self.id = id
+        self.name = name
+        self.permissions = permissions
+
+    @property
+    def is_viewer(self):
+        return self.permissions >= UserRole.VIEWER.value
+
+    @property
+    def is_editor(self):
+        return self.permissions >= UserRole.EDITOR.value
+
+    @property
+    def is_admin(self):
+        return self.permissions == UserRole.ADMIN.value
+
+    @property
+    def username(self):
+        return self.name
+
+    def can_manage_users(self):
+        return self.is_admin
+
+    def to_model(self):
+        return db.session.get(User, self.id)
+
+
+class UserCache:
+    """
+    LRU cache of CachedUsers by id, each kept for at most ttl seconds.
+
+    Commits that change or delete a user drop it here right away; other
+    processes notice within ttl.
+    """
+
+    def __init__(self, maxsize=256, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        """Return the CachedUser for an id, loading it on a miss, or None if there is no such user"""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        row = db.session.execute(
+            select(User.id, User.name, User.permissions).where(User.id == user_id)
+        ).first()
+        if row is None:
+            self.invalidate(user_id)
+            return None
+
+        user = CachedUser(*row)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id=None):
+        """Forget one user, or everyone"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+users = UserCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault('user_cache_pending', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('user_cache_pending', ()):
+        users.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_users(session):
+    session.info.pop('user_cache_pending', None)
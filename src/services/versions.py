@@ -0,0 +1,140 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+from flask import request, session, make_response
+from flask_login import current_user
+from sqlalchemy import event, update, insert, select, inspect
+from sqlalchemy.orm import Session
+from models import db
+from models.models import Work, Copy, Author, AuthorName, Tag, Location, User, Generation
+from services import serialize
+
+# Models whose rows carry updated_at
+VERSIONED = (Work, Copy, Author, Tag, Location, User)
+
+# Tables some conditional view depends on. Only these have their generation
+# bumped, so writes to tables no page shows (the ISBN cache) don't take the
+# generation row lock or turn over any ETag
+WATCHED = set()
+
+
+def ensure(engine):
+    """Add a generation row for every table that doesn't have one yet"""
+    with engine.begin() as conn:
+        existing = set(conn.execute(select(Generation.table_name)).scalars())
+        missing = [name for name in db.metadata.tables if name not in existing]
+        if missing:
+            now = datetime.utcnow()
+            conn.execute(insert(Generation), [{'table_name': name, 'value': 0, 'changed_at': now} for name in missing])
+
+
+def bump(connection, table_names):
+    """Move the generation of the watched tables on, in the transaction that changed them"""
+    table_names = sorted(WATCHED.intersection(table_names))
+    if table_names:
+        connection.execute(
+            update(Generation)
+            .where(Generation.table_name.in_(table_names))
+            .values(value=Generation.value + 1, changed_at=datetime.utcnow())
+        )
+
+
+@event.listens_for(Session, 'before_flush')
+def _touch_rows(session, flush_context, instances):
+    """Bump updated_at on rows whose relationships changed but whose columns didn't"""
+    now = datetime.utcnow()
+    for obj in session.dirty:
+        if isinstance(obj, VERSIONED) and session.is_modified(obj):
+            obj.updated_at = now
+
+    # An author's alternate names are part of the author
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, AuthorName) and obj.author_id is not None:
+            author = session.get(Author, obj.author_id)
+            if author is not None:
+                author.updated_at = now
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_generations(session, flush_context):
+    changed = list(session.new) + [obj for obj in session.dirty if session.is_modified(obj)] + list(session.deleted)
+    tables = set()
+    for obj in changed:
+        if isinstance(obj, Generation):
+            continue
+        tables.add(obj.__table__.name)
+        # Many-to-many links change the other side too, even if its collection isn't loaded
+        state = inspect(obj)
+        for relationship in state.mapper.relationships:
+            if relationship.secondary is not None and state.attrs[relationship.key].history.has_changes():
+                tables.update((relationship.secondary.name, relationship.target.name))
+    bump(session.connection(), tables)
+
+
+def _etag(parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:24]
+
+
+def conditional(*tables, row=None, key='id', negotiated=False):
+    """
+    Answer GETs of a view with 304 when neither the tables it shows nor its
+    row (model row, looked up by the view argument key) changed since the
+    client's copy. Costs one or two small queries and skips the view.
+
+    Pages differ per user and every page names the user in its nav, and a
+    304 would swallow a pending flash message, so all of these are part of
+    the check. A negotiated view streams JSON or NDJSON,
+    gzipped or not, by the request headers (serialize.stream); each of
+    those is tagged separately.
+    """
+    WATCHED.update(tables)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            generations = db.session.query(Generation.value, Generation.changed_at).filter(
+                Generation.table_name.in_(tables)
+            ).order_by(Generation.table_name).all()
+            modified = [changed_at for _, changed_at in generations]
+            parts = [request.full_path, [value for value, _ in generations]]
+
+            if row is not None:
+                updated_at = db.session.query(row.updated_at).filter(row.id == kwargs[key]).scalar()
+                if updated_at is None:
+                    return view(*args, **kwargs)
+                parts.append(updated_at)
+                modified.append(updated_at)
+
+            if current_user.is_authenticated:
+                parts.append((current_user.get_id(), current_user.name, current_user.permissions))
+            if negotiated:
+                parts.append(serialize.representation())
+
+            etag = _etag(parts)
+            last_modified = max(modified).replace(microsecond=0) if modified else None
+
+            if etag in request.if_none_match or (
+                not request.if_none_match and last_modified is not None
+                and request.if_modified_since is not None
+                and request.if_modified_since.replace(tzinfo=None) >= last_modified
+            ):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            if negotiated:
+                response.vary.update(('Accept', 'Accept-Encoding'))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,68 @@
+import importlib
+import time
+from sqlalchemy import text
+from models import db
+from services import fuzzy_index
+
+# Modules the app imports on first use rather than at startup
+LAZY_MODULES = ('requests', 'rapidfuzz.process', 'rapidfuzz.fuzz', 'rapidfuzz.utils')
+
+
+def _open_connections(count):
+    """Hold count connections at once so the pool keeps them all open"""
+    connections = []
+    try:
+        for _ in range(count):
+            conn = db.engine.connect()
+            connections.append(conn)
+            conn.execute(text('SELECT 1'))
+    finally:
+        for conn in connections:
+            conn.close()
+
+
+def preload_modules():
+    """
+    Import what the app defers to first use. Worth it only in a process
+    that forks workers afterwards: they then share the modules instead of
+    each importing them again.
+    """
+    for name in LAZY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+def compile_templates(app):
+    """Compile every page template now, filling the bytecode cache; returns how many"""
+    names = app.jinja_env.list_templates(extensions=('html',))
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def warm_up(app, log=None):
+    """
+    Get a freshly started process ready for traffic: fill the connection
+    pool, load the in-memory name indexes and request the configured pages
+    once, which compiles their templates and SQL. Returns the seconds taken.
+    """
+    log = log or app.logger.info
+    start = time.perf_counter()
+
+    with app.app_context():
+        pool = db.engine.pool
+        _open_connections(pool.size() if hasattr(pool, 'size') else 1)
+        fuzzy_index.authors.load()
+        fuzzy_index.tags.load()
+
+    client = app.test_client()
+    for path in app.config['WARMUP_PATHS']:
+        status = client.get(path).status_code
+        if status >= 400:
+            log(f'Warm-up request to {path} returned {status}')
+
+    elapsed = time.perf_counter() - start
+    log(f'Warmed up in {elapsed:.2f}s')
+    return elapsed
@@ -36,7 +36,11 @@ document.addEventListener('DOMContentLoaded', function() {
         const isbn = this.value.replace(/[-\s]/g, ''); // Remove hyphens and spaces
         
         if (isbn.length >= 10) {
-            debounceTimer = setTimeout(() => fetchBookData(isbn), 500);
+            if (isValidIsbn(isbn)) {
+                debounceTimer = setTimeout(() => fetchBookData(isbn), 500);
+            } else if (isbn.length >= 13) {
+                showMessage(`Not a valid ISBN: ${isbn}. Check for a mistyped digit.`, 'warning');
+            }
         }
     });
 
@@ -370,7 +374,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 hideModal(missingAuthorsModal);
                 showMessage(`${data.authors.length} author(s) created successfully!`, 'success');
             } else {
-                alert('Error creating authors: ' + (data.message || 'Unknown error'));
+                alert('Error creating authors: ' + (data.error || data.message || 'Unknown error'));
             }
         } catch (error) {
             console.error('Error creating authors:', error);
@@ -425,7 +429,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 hideModal(missingTagsModal);
                 showMessage(`${data.tags.length} tag(s) created successfully!`, 'success');
             } else {
-                alert('Error creating tags: ' + (data.message || 'Unknown error'));
+                alert('Error creating tags: ' + (data.error || data.message || 'Unknown error'));
             }
         } catch (error) {
             console.error('Error creating tags:', error);
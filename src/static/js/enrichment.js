@@ -0,0 +1,37 @@
+// Polls a work's background lookup while its details are being filled in,
+// reloading the page once something was added.
+(function () {
+    const notice = document.querySelector('[data-enrichment-url]');
+    if (!notice) {
+        return;
+    }
+    const url = notice.dataset.enrichmentUrl;
+    let delay = 2000;
+
+    async function poll() {
+        try {
+            const response = await fetch(url, { headers: { 'Accept': 'application/json' } });
+            const data = await response.json();
+            const job = data.job;
+            if (job && job.status === 'done') {
+                if (job.filled.length > 0) {
+                    window.location.reload();
+                } else {
+                    notice.remove();
+                }
+                return;
+            }
+            if (!job || job.status === 'failed') {
+                notice.remove();
+                return;
+            }
+        } catch (error) {
+            console.error('Checking for book details failed:', error);
+        }
+        // A retried lookup can wait minutes, so ask less often as time goes on
+        delay = Math.min(delay * 1.5, 60000);
+        setTimeout(poll, delay);
+    }
+
+    setTimeout(poll, delay);
+})();
@@ -0,0 +1,20 @@
+// ISBN check digits, so a misread scan or a typo is caught before it is looked up.
+// Mirrors services/isbn.py.
+function isValidIsbn(value) {
+    const isbn = value.replace(/[-\s]/g, '').toUpperCase();
+    if (/^97[89]\d{10}$/.test(isbn)) {
+        let total = 0;
+        for (let i = 0; i < 12; i++) {
+            total += Number(isbn[i]) * (i % 2 ? 3 : 1);
+        }
+        return (10 - total % 10) % 10 === Number(isbn[12]);
+    }
+    if (/^\d{9}[\dX]$/.test(isbn)) {
+        let total = 0;
+        for (let i = 0; i < 10; i++) {
+            total += (isbn[i] === 'X' ? 10 : Number(isbn[i])) * (10 - i);
+        }
+        return total % 11 === 0;
+    }
+    return false;
+}
@@ -6,7 +6,7 @@ async function lookupISBN() {
     const isbnInput = document.querySelector('input[name="isbn"]');
     const isbn = isbnInput.value.trim().replace(/[-\s]/g, '');
     
-    if (!isbn || isbn.length < 10) {
+    if (!isbn || !isValidIsbn(isbn)) {
         return;
     }
     
@@ -87,6 +87,7 @@ async function processAuthors(authorNames) {
         name: opt.text.toLowerCase()
     }));
     
+    const remaining = [];
     for (const authorName of authorNames) {
         // Check for exact match (case-insensitive)
         const exactMatch = existingAuthors.find(a => 
@@ -97,11 +98,19 @@ async function processAuthors(authorNames) {
             // Select the existing author using our new multi-select
             selectMultiChoice('authors', exactMatch.id);
         } else {
-            // Search for similar authors
-            const similarAuthors = await searchSimilarAuthors(authorName);
+            remaining.push(authorName);
+        }
+    }
+    
+    // Match everything else in one request
+    for (const result of await batchAuthors(remaining, false)) {
+        if (result.id) {
+            addMultiSelectOption('authors', result.id, result.name);
+            selectMultiChoice('authors', result.id);
+        } else {
             unmatchedAuthors.push({
-                name: authorName,
-                similar: similarAuthors
+                name: result.input,
+                similar: result.matches || []
             });
         }
     }
@@ -117,6 +126,7 @@ async function processTags(tagLabels) {
         label: opt.text.toLowerCase()
     }));
     
+    const remaining = [];
     for (const tagLabel of tagLabels) {
         // Check for exact match (case-insensitive)
         const exactMatch = existingTags.find(t => 
@@ -127,42 +137,52 @@ async function processTags(tagLabels) {
             // Select the existing tag using our new multi-select
             selectMultiChoice('tags', exactMatch.id);
         } else {
-            // Search for similar tags
-            const similarTags = await searchSimilarTags(tagLabel);
+            remaining.push(tagLabel);
+        }
+    }
+    
+    // Match everything else in one request
+    for (const result of await batchTags(remaining, false)) {
+        if (result.id) {
+            addMultiSelectOption('tags', result.id, result.label);
+            selectMultiChoice('tags', result.id);
+        } else {
             unmatchedTags.push({
-                label: tagLabel,
-                similar: similarTags
+                label: result.input,
+                similar: result.matches || []
             });
         }
     }
 }
 
-async function searchSimilarAuthors(name) {
+async function batchAuthors(names, create) {
+    if (names.length === 0) return [];
     try {
-        const response = await fetch('/api/authors/search', {
+        const response = await fetch('/api/authors/batch', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ name })
+            body: JSON.stringify({ authors: names, create })
         });
         const data = await response.json();
-        return data.success ? data.matches : [];
+        return data.success ? data.authors : [];
     } catch (error) {
-        console.error('Error searching authors:', error);
+        console.error('Error matching authors:', error);
         return [];
     }
 }
 
-async function searchSimilarTags(label) {
+async function batchTags(labels, create) {
+    if (labels.length === 0) return [];
     try {
-        const response = await fetch('/api/tags/search', {
+        const response = await fetch('/api/tags/batch', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ label })
+            body: JSON.stringify({ tags: labels.map(label => ({ label, type: 'genre' })), create })
         });
         const data = await response.json();
-        return data.success ? data.matches : [];
+        return data.success ? data.tags : [];
     } catch (error) {
-        console.error('Error searching tags:', error);
+        console.error('Error matching tags:', error);
         return [];
     }
 }
@@ -262,8 +282,8 @@ function createMatchRow(type, item, index) {
 }
 
 async function processBatchSelections() {
-    const authorsSelect = document.querySelector('select[name="authors"]');
-    const tagsSelect = document.querySelector('select[name="tags"]');
+    const newAuthors = [];
+    const newTags = [];
     
     // Process authors
     for (let i = 0; i < unmatchedAuthors.length; i++) {
@@ -280,13 +300,7 @@ async function processBatchSelections() {
             // Add to form using our new multi-select
             selectMultiChoice('authors', authorId);
         } else {
-            // Create new author
-            const newAuthor = await createAuthor(unmatchedAuthors[i].name);
-            if (newAuthor) {
-                // Add to form options and select it using our new multi-select
-                addMultiSelectOption('authors', newAuthor.id, newAuthor.name);
-                selectMultiChoice('authors', newAuthor.id);
-            }
+            newAuthors.push(unmatchedAuthors[i].name);
         }
     }
     
@@ -305,48 +319,32 @@ async function processBatchSelections() {
             // Add to form using our new multi-select
             selectMultiChoice('tags', tagId);
         } else {
-            // Create new tag
-            const newTag = await createTag(unmatchedTags[i].label);
-            if (newTag) {
-                // Add to form options and select it using our new multi-select
-                addMultiSelectOption('tags', newTag.id, newTag.label);
-                selectMultiChoice('tags', newTag.id);
-            }
+            newTags.push(unmatchedTags[i].label);
         }
     }
     
-    // Close modal using the application's method
-    closeBatchMatchModal();
-}
-
-async function createAuthor(name) {
-    try {
-        const response = await fetch('/api/authors/create', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ name })
-        });
-        const data = await response.json();
-        return data.success ? data.author : null;
-    } catch (error) {
-        console.error('Error creating author:', error);
-        return null;
+    // Create all new authors and tags, one request each
+    const [createdAuthors, createdTags] = await Promise.all([
+        batchAuthors(newAuthors, true),
+        batchTags(newTags, true)
+    ]);
+    
+    for (const author of createdAuthors) {
+        if (author.id) {
+            addMultiSelectOption('authors', author.id, author.name);
+            selectMultiChoice('authors', author.id);
+        }
     }
-}
-
-async function createTag(label) {
-    try {
-        const response = await fetch('/api/tags/create', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ label, type: 'genre' })
-        });
-        const data = await response.json();
-        return data.success ? data.tag : null;
-    } catch (error) {
-        console.error('Error creating tag:', error);
-        return null;
+    
+    for (const tag of createdTags) {
+        if (tag.id) {
+            addMultiSelectOption('tags', tag.id, tag.label);
+            selectMultiChoice('tags', tag.id);
+        }
     }
+    
+    // Close modal using the application's method
+    closeBatchMatchModal();
 }
 
 // Helper functions to interact with our new multi-select components
@@ -371,8 +369,11 @@ function addMultiSelectOption(fieldName, value, label) {
     const container = document.querySelector(`[data-field="${fieldName}"]`);
     if (!container) return;
     
-    // Add option to hidden select field
+    // Add option to hidden select field, unless it is already there
     const hiddenSelect = container.querySelector('select[multiple]');
+    if (hiddenSelect && Array.from(hiddenSelect.options).some(o => o.value === value.toString())) {
+        return;
+    }
     if (hiddenSelect) {
         const option = new Option(label, value.toString(), false, false);
         hiddenSelect.add(option);
@@ -7,6 +7,9 @@ class MultiSelect {
         this.tagsContainer = container.querySelector('.multi-select-tags');
         this.dropdown = container.querySelector('.multi-select-dropdown');
         this.hiddenField = container.querySelector('select[multiple]');
+        // Fields with a typeahead URL ship only their selected options and search the server
+        this.url = this.hiddenField.dataset.typeahead;
+        this.timer = null;
         
         this.init();
     }
@@ -24,7 +27,7 @@ class MultiSelect {
         
         // Event listeners
         this.input.addEventListener('input', (e) => this.handleInput(e));
-        this.input.addEventListener('focus', () => this.showDropdown());
+        this.input.addEventListener('focus', () => this.url ? this.fetchChoices(this.input.value.toLowerCase()) : this.showDropdown());
         this.input.addEventListener('keydown', (e) => this.handleKeydown(e));
         
         // Close dropdown when clicking outside
@@ -37,7 +40,31 @@ class MultiSelect {
     
     handleInput(e) {
         const query = e.target.value.toLowerCase();
-        this.showDropdown(query);
+        if (this.url) {
+            this.fetchChoices(query);
+        } else {
+            this.showDropdown(query);
+        }
+    }
+
+    fetchChoices(query) {
+        clearTimeout(this.timer);
+        this.timer = setTimeout(async () => {
+            try {
+                const response = await fetch(`${this.url}?q=${encodeURIComponent(query)}`);
+                const data = await response.json();
+                if (data.success) {
+                    this.choices = data.results.map(r => ({value: String(r.id), label: r.label}));
+                    this.showDropdown(query);
+                }
+            } catch (error) {
+                console.error('Typeahead error:', error);
+            }
+        }, 150);
+    }
+
+    isSelected(choice) {
+        return Array.from(this.selectedItems).some(item => item.value == choice.value);
     }
     
     handleKeydown(e) {
@@ -60,7 +87,7 @@ class MultiSelect {
         this.dropdown.innerHTML = '';
         
         const filteredChoices = this.choices.filter(choice => {
-            if (this.selectedItems.has(choice)) return false;
+            if (this.isSelected(choice)) return false;
             return choice.label.toLowerCase().includes(query);
         });
         
@@ -90,7 +117,7 @@ class MultiSelect {
     
     selectChoice(value) {
         const choice = this.choices.find(c => c.value == value);
-        if (choice && !this.selectedItems.has(choice)) {
+        if (choice && !this.isSelected(choice)) {
             this.selectedItems.add(choice);
             this.addTag(choice);
             this.updateHiddenField();
@@ -100,7 +127,7 @@ class MultiSelect {
     }
     
     removeChoice(value) {
-        const choice = this.choices.find(c => c.value == value);
+        const choice = Array.from(this.selectedItems).find(c => c.value == value);
         if (choice) {
             this.selectedItems.delete(choice);
             this.removeTag(value);
@@ -113,9 +140,10 @@ class MultiSelect {
         tag.className = 'multi-select-tag';
         tag.dataset.value = choice.value;
         tag.innerHTML = `
-            <span class="multi-select-tag-text">${choice.label}</span>
+            <span class="multi-select-tag-text"></span>
             <button type="button" class="multi-select-tag-remove">×</button>
         `;
+        tag.querySelector('.multi-select-tag-text').textContent = choice.label;
         
         tag.querySelector('.multi-select-tag-remove').addEventListener('click', () => {
             this.removeChoice(choice.value);
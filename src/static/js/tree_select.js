@@ -0,0 +1,73 @@
+// Searchable tree selects rendered by LocationTreeWidget(static=True)
+
+function initTreeSelect(container) {
+
+    if (container.dataset.treeSelectReady) return;
+    container.dataset.treeSelectReady = 'true';
+
+    const hidden = container.querySelector('input[type="hidden"]');
+    const search = container.querySelector('.tree-select-search');
+
+    // The tree is cached without a selection, so mark it here
+    const selected = Array.from(container.querySelectorAll('input[type="radio"]'))
+        .find(radio => radio.value === hidden.value);
+    if (selected) selected.checked = true;
+
+    container.addEventListener('change', event => {
+        if (event.target.type === 'radio') {
+            hidden.value = event.target.value;
+        }
+    });
+
+    container.addEventListener('click', event => {
+        const button = event.target.closest('.location-toggle');
+        if (!button) return;
+
+        const children = button.closest('.location-tree-item').querySelector('.location-children');
+        if (children) {
+            children.classList.toggle('collapsed');
+            button.textContent = children.classList.contains('collapsed') ? '▶' : '▼';
+        }
+    });
+
+    let timer;
+    search.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(() => filterTreeSelect(container, search.value), 100);
+    });
+
+}
+
+function filterTreeSelect(container, searchTerm) {
+
+    const term = searchTerm.toLowerCase();
+    const items = container.querySelectorAll('.location-tree-item');
+
+    items.forEach(item => {
+        item.classList.toggle('hidden', term !== '');
+    });
+    if (term === '') return;
+
+    // Show matches along with their ancestors, expanded
+    items.forEach(item => {
+        if (!item.dataset.locationName.toLowerCase().includes(term)) return;
+
+        let node = item;
+        while (node && node !== container) {
+            if (node.classList.contains('location-tree-item')) {
+                node.classList.remove('hidden');
+            }
+            if (node.classList.contains('location-children')) {
+                node.classList.remove('collapsed');
+                const toggle = node.previousElementSibling?.querySelector('.location-toggle');
+                if (toggle) toggle.textContent = '▼';
+            }
+            node = node.parentElement;
+        }
+    });
+
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('[data-tree-select]').forEach(initTreeSelect);
+});
@@ -0,0 +1,119 @@
+// Search box for single selects rendered with a data-typeahead URL.
+// The select keeps only the chosen option and stays the submitted field.
+class Typeahead {
+    constructor(select) {
+        this.select = select;
+        this.url = select.dataset.typeahead;
+        this.blank = Array.from(select.options).find(option => option.value === '');
+        this.timer = null;
+
+        this.container = document.createElement('div');
+        this.container.className = 'typeahead';
+        this.input = document.createElement('input');
+        this.input.type = 'text';
+        this.input.className = select.className;
+        this.input.autocomplete = 'off';
+        this.input.placeholder = select.getAttribute('placeholder') || 'Search...';
+        this.input.autofocus = select.autofocus;
+        this.dropdown = document.createElement('div');
+        this.dropdown.className = 'multi-select-dropdown';
+        this.dropdown.style.display = 'none';
+
+        select.parentNode.insertBefore(this.container, select);
+        this.container.append(this.input, this.dropdown, select);
+        select.style.display = 'none';
+
+        const selected = select.selectedOptions[0];
+        this.input.value = selected && selected.value !== '' ? selected.textContent : '';
+
+        this.input.addEventListener('input', () => this.fetchChoices());
+        this.input.addEventListener('focus', () => this.fetchChoices());
+        this.input.addEventListener('keydown', (e) => this.handleKeydown(e));
+        this.input.addEventListener('blur', () => setTimeout(() => this.restore(), 150));
+    }
+
+    fetchChoices() {
+        clearTimeout(this.timer);
+        this.timer = setTimeout(async () => {
+            try {
+                const response = await fetch(`${this.url}?q=${encodeURIComponent(this.input.value.trim())}`);
+                const data = await response.json();
+                if (data.success) {
+                    this.showDropdown(data.results);
+                }
+            } catch (error) {
+                console.error('Typeahead error:', error);
+            }
+        }, 150);
+    }
+
+    showDropdown(results) {
+        this.dropdown.innerHTML = '';
+        const choices = results.map(r => ({value: String(r.id), label: r.label}));
+        if (this.blank) {
+            choices.unshift({value: '', label: this.blank.textContent});
+        }
+
+        if (choices.length === 0) {
+            this.dropdown.innerHTML = '<div class="multi-select-no-results">No results found</div>';
+        }
+        choices.forEach((choice, index) => {
+            const option = document.createElement('div');
+            option.className = 'multi-select-option' + (index === 0 ? ' active' : '');
+            option.textContent = choice.label;
+            option.addEventListener('mousedown', (e) => {
+                e.preventDefault();
+                this.choose(choice);
+            });
+            this.dropdown.appendChild(option);
+            option.choice = choice;
+        });
+        this.dropdown.style.display = 'block';
+    }
+
+    handleKeydown(e) {
+        const options = Array.from(this.dropdown.querySelectorAll('.multi-select-option'));
+        const active = options.findIndex(option => option.classList.contains('active'));
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            e.preventDefault();
+            if (options.length === 0) return;
+            const next = (active + (e.key === 'ArrowDown' ? 1 : options.length - 1)) % options.length;
+            options.forEach(option => option.classList.remove('active'));
+            options[next].classList.add('active');
+        } else if (e.key === 'Enter') {
+            e.preventDefault();
+            if (active >= 0) {
+                this.choose(options[active].choice);
+            }
+        } else if (e.key === 'Escape') {
+            this.restore();
+        }
+    }
+
+    choose(choice) {
+        this.select.innerHTML = '';
+        if (this.blank) {
+            this.select.appendChild(this.blank);
+        }
+        if (choice.value !== '') {
+            this.select.appendChild(new Option(choice.label, choice.value, true, true));
+        } else {
+            this.blank.selected = true;
+        }
+        this.input.value = choice.value !== '' ? choice.label : '';
+        this.dropdown.style.display = 'none';
+    }
+
+    restore() {
+        // Show the chosen option again if the search text was left unfinished
+        const selected = this.select.selectedOptions[0];
+        this.input.value = selected && selected.value !== '' ? selected.textContent : '';
+        this.dropdown.style.display = 'none';
+    }
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('select[data-typeahead]:not([multiple])').forEach(select => {
+        select.typeahead = new Typeahead(select);
+    });
+});
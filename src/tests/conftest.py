@@ -0,0 +1,87 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+from flask.testing import FlaskClient
+
+# The app imports its modules relative to src, as `flask run` does from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from config import Config
+from models import db
+from models.models import User, UserRole
+from services import fuzzy_index, user_cache
+
+
+class TestConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'test'
+    JOB_WORKERS = 0
+    TEMPLATE_CACHE_DIR = ''
+    ISBN_MIRROR = ''
+
+
+def _app(path):
+    config = type('Config', (TestConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path / "bookshelf.db"}',
+        'COVER_DIR': str(path / 'covers'),
+    })
+    return create_app(config)
+
+
+@pytest.fixture
+def app(tmp_path):
+    """A fresh app on its own SQLite file, with an app context pushed"""
+    app = _app(tmp_path)
+    # These live for the process; drop what an earlier test's database left in them
+    fuzzy_index.authors.invalidate()
+    fuzzy_index.tags.invalidate()
+    user_cache.users.invalidate()
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def other_app(tmp_path):
+    """A second app on an empty database of its own; push its context to use it"""
+    path = tmp_path / 'other'
+    path.mkdir()
+    app = _app(path)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def admin(app):
+    user = User(name='admin', join_date=datetime(2024, 1, 1), permissions=UserRole.ADMIN.value)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+class _Client(FlaskClient):
+    """
+    Runs each request in an app context of its own, as a server would, so
+    it doesn't share the test's session or g (and its cached current_user)
+    """
+
+    def open(self, *args, **kwargs):
+        kwargs.setdefault('buffered', True)
+        with self.application.app_context():
+            return super().open(*args, **kwargs)
+
+
+@pytest.fixture
+def client(app, admin):
+    """A test client logged in as the admin"""
+    app.test_client_class = _Client
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+    return client
@@ -0,0 +1,72 @@
+from sqlalchemy import event
+
+from models import db
+from models.models import Author, AuthorName, Tag
+from services import fuzzy_index
+
+
+def post(client, kind, values, **options):
+    response = client.post(f'/api/{kind}/batch', json={kind: values, **options})
+    data = response.get_json()
+    assert data['success'], data
+    return {result['input']: result for result in data[kind]}
+
+
+def count_selects(engine):
+    """A list that grows by one for every SELECT the engine runs"""
+    selects = []
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            selects.append(statement)
+    return selects
+
+
+def test_authors_match_exactly_fuzzily_or_are_created(client):
+    kafka = Author(primary_name='Franz Kafka', alt_names=[AuthorName(alt_name='Kafka')])
+    db.session.add(kafka)
+    db.session.commit()
+
+    results = post(client, 'authors', ['kafka', 'Kafk', 'Ursula K. Le Guin'])
+
+    assert results['kafka']['id'] == kafka.id
+    assert not results['kafka']['created']
+
+    assert results['Kafk']['id'] is None
+    assert [match['id'] for match in results['Kafk']['matches']] == [kafka.id]
+    assert results['Kafk']['matches'][0]['name'] == 'Franz Kafka'
+
+    assert results['Ursula K. Le Guin']['created']
+    assert db.session.get(Author, results['Ursula K. Le Guin']['id']).primary_name == 'Ursula K. Le Guin'
+    assert db.session.query(Author).count() == 2
+
+
+def test_authors_without_create_only_match(client):
+    results = post(client, 'authors', ['Octavia E. Butler'], create=False)
+    assert results['Octavia E. Butler']['id'] is None
+    assert results['Octavia E. Butler']['matches'] == []
+    assert db.session.query(Author).count() == 0
+
+
+def test_created_authors_are_not_reloaded(client, app):
+    fuzzy_index.authors.load()
+    selects = count_selects(db.engine)
+    post(client, 'authors', [f'Author {i}' for i in range(20)])
+    # The exact matches, the alternate names and the names of the results; no reload per author
+    assert len(selects) <= 4
+
+
+def test_tags_match_exactly_fuzzily_or_are_created(client):
+    fantasy = Tag(label='Fantasy', type='genre')
+    db.session.add(fantasy)
+    db.session.commit()
+
+    results = post(client, 'tags', [{'label': 'fantasy'}, {'label': 'Fantasie'}, {'label': 'Travel', 'type': 'subject'}])
+
+    assert results['fantasy']['id'] == fantasy.id
+    assert results['Fantasie']['id'] is None
+    assert results['Fantasie']['matches'][0]['id'] == fantasy.id
+    assert results['Travel']['created']
+    assert results['Travel']['type'] == 'subject'
+    assert db.session.query(Tag).count() == 2
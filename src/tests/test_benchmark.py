@@ -0,0 +1,48 @@
+from benchmark import generator, harness
+from models import db
+from models.models import Work, Copy, Location
+from services import export
+
+
+def quiet(*args):
+    pass
+
+
+def test_generator_is_deterministic(app, other_app):
+    scale = generator.generate(copies=90, seed=5, depth=3, fanout=2, log=quiet)
+    first = list(export.records())
+    assert db.session.query(Copy).count() == scale.copies == 90
+    assert db.session.query(Work).count() == scale.works
+    assert db.session.query(Location).count() == scale.locations
+
+    with other_app.app_context():
+        generator.generate(copies=90, seed=5, depth=3, fanout=2, log=quiet)
+        assert list(export.records()) == first
+
+
+def test_generated_isbns_are_valid(app):
+    generator.generate(copies=30, log=quiet)
+    from services.isbn import canonical
+    assert all(canonical(isbn) == isbn for isbn, in db.session.query(Work.isbn))
+
+
+def test_harness_times_and_counts_queries(app):
+    generator.generate(copies=60, depth=3, fanout=2, log=quiet)
+    results = harness.run(app, repeat=2, warmup=1, only={'books', 'api_search'}, log=quiet)
+    assert set(results['results']) == {'books', 'api_search'}
+    for case in results['results'].values():
+        assert case['samples'] == 2
+        assert case['median_ms'] > 0
+        assert case['queries'] > 0
+    assert results['library'] == {'works': 40, 'copies': 60}
+
+
+def _results(median_ms, queries):
+    return {'library': {'works': 1}, 'results': {'books': {'median_ms': median_ms, 'queries': queries}}}
+
+
+def test_compare_flags_slower_and_chattier_cases():
+    assert harness.compare(_results(11, 5), _results(10, 5))[1] == []
+    assert harness.compare(_results(13, 5), _results(10, 5))[1] == ['books']
+    assert harness.compare(_results(10, 6), _results(10, 5))[1] == ['books']
+    assert harness.compare(_results(13, 5), _results(10, 5), threshold=1.5)[1] == []
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from services import covers, thumbnails
+
+
+@pytest.mark.parametrize('url', [
+    'file:///etc/passwd',
+    'ftp://example.com/cover.jpg',
+    'http://127.0.0.1/cover.jpg',
+    'http://localhost:5000/cover.jpg',
+    'http://10.0.0.7/cover.jpg',
+    'http://192.168.1.1/cover.jpg',
+    'http://169.254.169.254/latest/meta-data/',
+    'http://[::1]/cover.jpg',
+    'http://[::ffff:127.0.0.1]/cover.jpg',
+    'http://224.0.0.1/cover.jpg',
+])
+def test_private_and_odd_addresses_are_refused(url):
+    with pytest.raises(ValueError):
+        covers.check_url(url)
+
+
+def test_public_address_is_allowed():
+    covers.check_url('https://93.184.216.34/cover.jpg')
+
+
+class _Response:
+    def __init__(self, location):
+        self.headers = {'Location': location}
+        self.is_redirect = True
+
+    def close(self):
+        pass
+
+
+class _RedirectingSession:
+    """Answers every GET with a redirect to location"""
+
+    def __init__(self, location):
+        self.location = location
+        self.requested = []
+
+    def get(self, url, **kwargs):
+        assert kwargs['allow_redirects'] is False
+        self.requested.append(url)
+        return _Response(self.location)
+
+
+def test_redirects_are_checked(app, monkeypatch):
+    session = _RedirectingSession('http://127.0.0.1/admin')
+    monkeypatch.setattr(covers, '_http', lambda: session)
+
+    cover = covers.fetch('http://93.184.216.34/cover.jpg')
+    assert session.requested == ['http://93.184.216.34/cover.jpg']
+    assert cover.digest is None
+    assert 'public' in cover.error
+
+
+def test_refused_cover_is_not_requested(app, monkeypatch):
+    session = _RedirectingSession('https://93.184.216.34/cover.jpg')
+    monkeypatch.setattr(covers, '_http', lambda: session)
+
+    cover = covers.fetch('http://localhost/cover.jpg')
+    assert session.requested == []
+    assert cover.error
+
+
+@pytest.mark.skipif(not thumbnails.available(), reason='needs Pillow')
+def test_thumbnail_fits_its_box(tmp_path):
+    from PIL import Image
+    source, target = tmp_path / 'full', tmp_path / 'thumb'
+    Image.new('RGB', (1200, 1800), 'teal').save(source, 'PNG')
+
+    thumbnails.make_thumbnail(str(source), str(target), covers.SIZES['thumb'])
+    with Image.open(target) as image:
+        assert image.format == 'JPEG'
+        assert image.size == (240, 360)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
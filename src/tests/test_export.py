@@ -0,0 +1,66 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from models import db, Author, Tag, Work
+from services import export
+
+
+@pytest.fixture
+def work(app):
+    author = Author(primary_name='Ursula K. Le Guin')
+    tag = Tag(label='Fiction', type='genre')
+    work = Work(title='The Dispossessed', isbn='9780060512750', authors=[author], tags=[tag])
+    db.session.add(work)
+    db.session.commit()
+    return work
+
+
+def test_json_includes_empty_entities(work):
+    data = json.loads(b''.join(export.chunks('json')))
+    assert list(data) == list(export.ENTITIES)
+    assert data['users'] == [] and data['copies'] == []
+    assert data['works'][0]['title'] == 'The Dispossessed'
+
+
+def test_ndjson_is_one_record_per_line(work):
+    lines = b''.join(export.chunks('ndjson')).decode().splitlines()
+    assert [json.loads(line)['entity'] for line in lines] == ['tags', 'authors', 'works']
+
+
+def test_csv_has_a_header_and_joins_lists(work):
+    rows = list(csv.reader(io.StringIO(b''.join(export.chunks('csv', 'works')).decode())))
+    assert rows[0] == list(export.FIELDS['works'])
+    record = dict(zip(rows[0], rows[1]))
+    assert record['author_ids'] == str(work.authors[0].id)
+    assert record['tag_ids'] == str(work.tags[0].id)
+
+
+@pytest.mark.parametrize('format, entity', [('csv', None), ('csv', 'shelves'), ('json', 'shelves'), ('xml', None)])
+def test_bad_format_or_entity_is_refused(app, format, entity):
+    with pytest.raises(ValueError):
+        export.chunks(format, entity)
+
+
+def test_filename():
+    assert export.filename('csv', 'works').startswith('bookshelf-works-')
+    assert export.filename('ndjson').endswith('.ndjson.gz')
+    assert f"-{datetime.utcnow():%Y%m%d}-" in export.filename('json')
+
+
+def test_endpoint_streams_gzip(client, work):
+    response = client.get('/api/export?format=json')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/gzip'
+    assert 'bookshelf-' in response.headers['Content-Disposition']
+    assert json.loads(gzip.decompress(response.data))['works'][0]['isbn'] == '9780060512750'
+
+
+def test_endpoint_refuses_unknown_format(client):
+    response = client.get('/api/export?format=xml')
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
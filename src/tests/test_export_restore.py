@@ -0,0 +1,79 @@
+import io
+from datetime import datetime
+
+import pytest
+
+from benchmark.generator import generate
+from models import db, User, UserRole, Work, Copy
+from services import export, restore, search
+
+
+def quiet(*args):
+    pass
+
+
+@pytest.fixture
+def library(app):
+    """A small generated library, with two users owning and borrowing some of it, as exported"""
+    generate(copies=60, seed=7, depth=3, fanout=3, log=quiet)
+    owner = User(name='ada', email='ada@example.com', join_date=datetime(2024, 1, 2), permissions=UserRole.ADMIN.value)
+    reader = User(name='bo', join_date=datetime(2024, 3, 4, 5, 6), permissions=UserRole.VIEWER.value)
+    owner.set_password('secret')
+    db.session.add_all([owner, reader])
+    for i, copy in enumerate(db.session.query(Copy).order_by(Copy.id).limit(10)):
+        copy.owner = owner
+        copy.borrower = reader if i % 2 else None
+    db.session.commit()
+    return list(export.records())
+
+
+def dump(format, entity=None):
+    """An export as the text file a restore reads"""
+    return io.StringIO(b''.join(export.chunks(format, entity)).decode('utf-8'), newline='')
+
+
+def test_generated_library_has_every_entity(library):
+    assert {entity for entity, _ in library} == set(export.ENTITIES)
+
+
+@pytest.mark.parametrize('format', ['ndjson', 'json'])
+def test_restore_into_an_empty_database(library, other_app, format):
+    file = dump(format)
+    with other_app.app_context():
+        report = restore.restore(restore.records(file, format), log=quiet)
+        assert list(export.records()) == library
+        assert report.tables['copies'] == db.session.query(Copy).count() == 60
+        assert report.users_without_password == 2
+
+
+def test_restore_replacing_the_library(library):
+    file = dump('ndjson')
+    with pytest.raises(ValueError):
+        restore.restore(restore.records(file, 'ndjson'), log=quiet)
+
+    file.seek(0)
+    restore.restore(restore.records(file, 'ndjson'), replace=True, log=quiet)
+    assert list(export.records()) == library
+
+
+def test_restore_keeps_passwords_of_existing_users(library):
+    restore.restore(restore.records(dump('ndjson'), 'ndjson'), replace=True, log=quiet)
+    db.session.expire_all()
+    assert db.session.query(User).filter_by(name='ada').one().check_password('secret')
+    assert db.session.query(User).filter_by(name='bo').one().password_hash is None
+
+
+@pytest.mark.parametrize('entity', export.ENTITIES)
+def test_csv_round_trip(library, other_app, entity):
+    file = dump('csv', entity)
+    with other_app.app_context():
+        restore.restore(restore.records(file, 'csv', entity), entities=(entity,), log=quiet)
+        assert list(export.records((entity,))) == [(name, record) for name, record in library if name == entity]
+
+
+def test_restored_works_are_searchable(library, other_app):
+    work_id, title = db.session.query(Work.id, Work.title).order_by(Work.id).first()
+    file = dump('ndjson')
+    with other_app.app_context():
+        restore.restore(restore.records(file, 'ndjson'), log=quiet)
+        assert work_id in search.search(title, limit=100)
@@ -0,0 +1,101 @@
+import threading
+
+from models import db
+from models.models import Author, Tag
+from services import fuzzy_index
+from services.fuzzy_index import NameIndex
+
+NAMES = [
+    (('author', 1), 1, 'J. R. R. Tolkien'),
+    (('author', 2), 2, 'Ursula K. Le Guin'),
+    (('alt', 1), 2, 'Ursula Kroeber'),
+    (('author', 3), 3, 'Terry Pratchett'),
+    (('author', 4), 4, 'Terry Brooks'),
+]
+
+
+def index(names=NAMES):
+    return NameIndex(lambda: iter(names))
+
+
+def owners(results):
+    return [owner_id for owner_id, _ in results]
+
+
+def test_typos_still_match():
+    assert owners(index().search('Tolkein', limit=1)) == [1]
+    assert owners(index().search('pratchet', limit=1)) == [3]
+
+
+def test_words_in_any_order_match():
+    assert owners(index().search('Le Guin Ursula K.', limit=1)) == [2]
+
+
+def test_short_queries_find_longer_names():
+    assert 1 in owners(index().search('tol', limit=5))
+    assert owners(index().search('le', score_cutoff=90, limit=5))
+
+
+def test_alternate_names_count_for_their_owner_once():
+    results = index().search('Ursula', limit=5)
+    assert owners(results).count(2) == 1
+
+
+def test_results_are_best_first_and_limited():
+    results = index().search('Terry Pratchett', limit=2)
+    assert owners(results)[0] == 3
+    assert len(results) <= 2
+    assert results == sorted(results, key=lambda result: result[1], reverse=True)
+
+
+def test_applied_changes_show_without_a_reload():
+    names = index()
+    names.load()
+    names.apply([(('author', 5), 5, 'Octavia E. Butler'), (('author', 3), 3, None), (None, 2, None)])
+    assert owners(names.search('Octavia Butler', limit=1)) == [5]
+    assert 3 not in owners(names.search('Terry Pratchett', limit=5))
+    assert owners(names.search('Ursula Kroeber', limit=5)) == []
+
+
+def test_changes_during_a_reload_are_kept():
+    loading = threading.Event()
+    proceed = threading.Event()
+
+    def load():
+        loading.set()
+        proceed.wait(5)
+        return iter(NAMES)
+
+    names = NameIndex(load)
+    thread = threading.Thread(target=names.load)
+    thread.start()
+    loading.wait(5)
+    names.apply([(('author', 5), 5, 'Octavia E. Butler'), (('author', 1), 1, None)])
+    proceed.set()
+    thread.join(5)
+
+    assert owners(names.search('Octavia Butler', limit=1)) == [5]
+    assert 1 not in owners(names.search('Tolkien', limit=5))
+
+
+def test_commits_update_the_app_indexes(app):
+    author = Author(primary_name='Frank Herbert')
+    tag = Tag(label='Science fiction', type='genre')
+    db.session.add_all([author, tag])
+    db.session.commit()
+    assert owners(fuzzy_index.authors.search('Frank Herbrt', limit=1)) == [author.id]
+    assert owners(fuzzy_index.tags.search('sci-fi fiction', limit=1)) == [tag.id]
+
+    tag.label = 'Space opera'
+    db.session.delete(author)
+    db.session.commit()
+    assert fuzzy_index.authors.search('Frank Herbert') == []
+    assert owners(fuzzy_index.tags.search('space opera', limit=1)) == [tag.id]
+
+
+def test_rolled_back_changes_are_not_applied(app):
+    fuzzy_index.authors.load()
+    db.session.add(Author(primary_name='Frank Herbert'))
+    db.session.flush()
+    db.session.rollback()
+    assert fuzzy_index.authors.search('Frank Herbert') == []
@@ -0,0 +1,107 @@
+import pytest
+
+from models import db, Location, Tag
+from forms.fromai import LocationTreeWidget
+from services.hierarchy import would_create_cycle, descendant_ids, tree_choices
+
+
+@pytest.fixture
+def house(app):
+    """House > (Upstairs > Study > Desk, Downstairs)"""
+    house = Location(name='House', type='building')
+    upstairs = Location(name='Upstairs', type='floor', parent=house)
+    study = Location(name='Study', type='room', parent=upstairs)
+    desk = Location(name='Desk', type='shelf', parent=study)
+    downstairs = Location(name='Downstairs', type='floor', parent=house)
+    db.session.add_all([house, upstairs, study, desk, downstairs])
+    db.session.commit()
+    return {location.name: location.id for location in (house, upstairs, study, desk, downstairs)}
+
+
+def test_descendant_ids(house):
+    ids = set(db.session.execute(descendant_ids(Location, house['Upstairs'])).scalars())
+    assert ids == {house['Upstairs'], house['Study'], house['Desk']}
+
+
+@pytest.mark.parametrize('node, new_parent', [
+    ('House', 'House'),
+    ('House', 'Desk'),
+    ('Upstairs', 'Study'),
+    ('Study', 'Desk'),
+])
+def test_moving_under_itself_is_a_cycle(house, node, new_parent):
+    assert would_create_cycle(Location, house[node], house[new_parent])
+
+
+@pytest.mark.parametrize('node, new_parent', [
+    ('Desk', 'Downstairs'),
+    ('Study', 'Downstairs'),
+    ('Upstairs', 'Downstairs'),
+    ('Desk', 'House'),
+])
+def test_moving_elsewhere_is_not_a_cycle(house, node, new_parent):
+    assert not would_create_cycle(Location, house[node], house[new_parent])
+
+
+def test_no_parent_is_not_a_cycle(house):
+    assert not would_create_cycle(Location, house['House'], None)
+
+
+def test_tags(app):
+    genre = Tag(label='Genre', type='genre')
+    fantasy = Tag(label='Fantasy', type='genre', parent=genre)
+    db.session.add_all([genre, fantasy])
+    db.session.commit()
+    assert would_create_cycle(Tag, genre.id, fantasy.id)
+    assert not would_create_cycle(Tag, fantasy.id, genre.id)
+
+
+def labels(choices):
+    return [(label, labels(children)) for _, label, children in choices]
+
+
+def test_tree_choices_nest_by_name(house):
+    choices = tree_choices(Location, Location.name)
+    assert labels(choices) == [
+        ('-none-', []),
+        ('House', [('Downstairs', []), ('Upstairs', [('Study', [('Desk', [])])])]),
+    ]
+
+
+def test_tree_choices_leave_out_a_node_and_its_subtree(house):
+    choices = tree_choices(Location, Location.name, exclude_id=house['Upstairs'])
+    assert labels(choices) == [('-none-', []), ('House', [('Downstairs', [])])]
+
+
+def test_tree_choices_version_follows_what_they_show(house):
+    first = tree_choices(Location, Location.name)
+    assert tree_choices(Location, Location.name).version == first.version
+    assert tree_choices(Location, Location.name, exclude_id=house['Desk']).version != first.version
+
+    db.session.get(Location, house['Desk']).description = 'Not shown in the picker'
+    db.session.commit()
+    assert tree_choices(Location, Location.name).version == first.version
+
+    db.session.get(Location, house['Desk']).name = 'Bookcase'
+    db.session.commit()
+    assert tree_choices(Location, Location.name).version != first.version
+
+
+class _Field:
+    def __init__(self, choices, data=None):
+        self.id = self.name = 'parent'
+        self.choices = choices
+        self.data = data
+
+
+def test_static_tree_is_rendered_once_per_version(app, house):
+    widget = LocationTreeWidget(static=True)
+    choices = tree_choices(Location, Location.name)
+    with app.test_request_context():
+        first = widget(_Field(choices, data=house['Study']))
+        second = widget(_Field(tree_choices(Location, Location.name), data=house['Desk']))
+        assert widget._cached_tree(_Field(choices)) is widget._cached_tree(_Field(tree_choices(Location, Location.name)))
+
+    assert 'name="parent" value="%d"' % house['Study'] in first
+    assert 'name="parent" value="%d"' % house['Desk'] in second
+    assert first.count('data-location-name="Desk"') == 1
@@ -0,0 +1,130 @@
+import io
+from datetime import datetime
+
+import pytest
+
+from models import db
+from models.models import Work, Copy, Author, Location, User, UserRole
+from services import importer, isbn_providers, jobs
+
+DUNE = '9780441172719'
+KINDRED = '9780807083697'
+UNKNOWN = '9780306406157'
+BROKEN = '9781635575637'
+
+BOOKS = {
+    DUNE: {'title': 'Dune', 'authors': ['Frank Herbert'], 'categories': ['Science fiction'], 'publisher': 'Ace'},
+    KINDRED: {'title': 'Kindred', 'authors': ['Octavia E. Butler', 'octavia e. butler'],
+              'categories': ['Science Fiction', 'Time travel']},
+}
+
+
+@pytest.fixture
+def providers(app, monkeypatch):
+    """Open Library's batch lookup knows Dune; the one by one lookup knows Kindred and breaks on BROKEN"""
+    asked = []
+
+    def lookup_many(isbns, timeout):
+        asked.append(('batch', list(isbns)))
+        return {isbn: BOOKS[isbn] for isbn in isbns if isbn == DUNE}
+
+    def lookup(isbn, timeout):
+        asked.append(('single', isbn))
+        if isbn == BROKEN:
+            raise RuntimeError('mirror broke')
+        return isbn_providers.LookupResult(BOOKS.get(isbn), ['google'] if isbn in BOOKS else [], True, {})
+
+    monkeypatch.setattr(isbn_providers.open_library, 'lookup_many', lookup_many)
+    monkeypatch.setattr(isbn_providers, 'lookup', lookup)
+    return asked
+
+
+@pytest.fixture
+def shelf(app):
+    shelf = Location(name='Shelf', type='shelf')
+    db.session.add_all([shelf, Location(name='Attic', type='room'),
+                        User(name='Sam', join_date=datetime(2024, 1, 1), permissions=UserRole.VIEWER.value)])
+    db.session.commit()
+    return shelf
+
+
+def test_read_isbn_file():
+    rows = importer.read_isbn_file([
+        'isbn,location,owner',
+        '# a comment',
+        '',
+        '0-441-17271-7, Attic, Sam',
+        '978-0-8070-8369-7',
+        '12345',
+    ])
+    assert rows == [
+        {'isbn': DUNE, 'location': 'Attic', 'owner': 'Sam'},
+        {'isbn': KINDRED, 'location': None, 'owner': None},
+        {'isbn': '12345', 'location': None, 'owner': None},
+    ]
+
+
+def test_import_creates_works_copies_authors_and_tags_once(providers, shelf):
+    rows = importer.read_isbn_file([DUNE, f'{DUNE},Attic,Sam', KINDRED, f'{KINDRED},Shelf'])
+    report = importer.import_rows(rows, default_location='Shelf', batch_size=2)
+
+    assert report.failures == []
+    assert (report.works_created, report.copies_created, report.authors_created, report.tags_created) == (2, 4, 2, 2)
+    assert db.session.query(Copy).count() == 4
+    dune = db.session.query(Work).filter_by(isbn=DUNE).one()
+    assert [author.primary_name for author in dune.authors] == ['Frank Herbert']
+    assert sorted((copy.location.name, copy.owner and copy.owner.name) for copy in dune.copies) == [
+        ('Attic', 'Sam'), ('Shelf', None)
+    ]
+    # Tags are matched ignoring case
+    kindred = db.session.query(Work).filter_by(isbn=KINDRED).one()
+    assert sorted(tag.label for tag in kindred.tags) == ['Science fiction', 'Time travel']
+
+    # Each ISBN was asked for once, the batch first
+    assert providers == [('batch', [DUNE, KINDRED]), ('single', KINDRED)]
+
+
+def test_existing_works_get_another_copy(providers, shelf):
+    db.session.add(Work(title='Dune', isbn=DUNE))
+    db.session.commit()
+
+    report = importer.import_rows([{'isbn': DUNE, 'location': 'Shelf', 'owner': None}])
+    assert (report.works_created, report.copies_created) == (0, 1)
+    assert db.session.query(Work).count() == 1
+
+
+def test_each_failing_row_is_reported(providers, shelf):
+    rows = [
+        {'isbn': '12345', 'location': 'Shelf', 'owner': None},
+        {'isbn': DUNE, 'location': 'Garage', 'owner': None},
+        {'isbn': DUNE, 'location': None, 'owner': None},
+        {'isbn': DUNE, 'location': 'Shelf', 'owner': 'Nobody'},
+        {'isbn': UNKNOWN, 'location': 'Shelf', 'owner': None},
+        {'isbn': BROKEN, 'location': 'Shelf', 'owner': None},
+        {'isbn': KINDRED, 'location': 'Shelf', 'owner': None},
+    ]
+    report = importer.import_rows(rows)
+    assert report.failures == [
+        {'isbn': '12345', 'error': 'Not a valid ISBN'},
+        {'isbn': DUNE, 'error': "Unknown location 'Garage'"},
+        {'isbn': DUNE, 'error': 'No location given'},
+        {'isbn': DUNE, 'error': "Unknown owner 'Nobody'"},
+        {'isbn': UNKNOWN, 'error': 'Book not found'},
+        {'isbn': BROKEN, 'error': 'Lookup failed: mirror broke'},
+    ]
+    assert report.copies_created == 1
+
+
+def test_uploaded_file_is_imported_by_a_job(providers, shelf, client):
+    upload = io.BytesIO(f'isbn\n{DUNE}\n{UNKNOWN}\n'.encode())
+    response = client.post('/api/import', data={'file': (upload, 'isbns.csv'), 'location': 'Shelf'})
+    assert response.status_code == 202
+    job = response.get_json()['job']
+    assert (job['kind'], job['status']) == (jobs.IMPORT, 'queued')
+    assert db.session.query(Copy).count() == 0
+
+    assert jobs.run_next()
+    job = client.get(f"/api/jobs/{job['id']}").get_json()['job']
+    assert job['status'] == 'done'
+    assert job['result']['copies_created'] == 1
+    assert job['result']['failures'] == [{'isbn': UNKNOWN, 'error': 'Book not found'}]
@@ -0,0 +1,95 @@
+import pytest
+
+from services import isbn
+
+
+@pytest.mark.parametrize('first12, digit', [
+    ('978030640615', '7'),
+    ('978186197271', '2'),
+    ('979100000000', '8'),
+])
+def test_check_digit13(first12, digit):
+    assert isbn.check_digit13(first12) == digit
+
+
+@pytest.mark.parametrize('first9, digit', [
+    ('030640615', '2'),
+    ('080442957', 'X'),
+    ('186197271', '7'),
+])
+def test_check_digit10(first9, digit):
+    assert isbn.check_digit10(first9) == digit
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('9780306406157', '9780306406157'),
+    ('978-0-306-40615-7', '9780306406157'),
+    ('0306406152', '9780306406157'),
+    ('0-306-40615-2', '9780306406157'),
+    (' 080442957X ', '9780804429573'),
+    ('080442957x', '9780804429573'),
+])
+def test_canonical_converts_to_isbn13(value, expected):
+    assert isbn.canonical(value) == expected
+
+
+@pytest.mark.parametrize('value', [
+    '9780306406158',   # wrong check digit
+    '0306406153',      # wrong check digit
+    '97803064061',     # too short
+    '030640615X2',     # X not last
+    '1234567890123',   # neither 978 nor 979
+    '',
+    None,
+])
+def test_canonical_rejects_invalid(value):
+    assert isbn.canonical(value) is None
+
+
+def test_stored_zero_fills_short_isbn10():
+    # Spreadsheets drop the leading zero of an ISBN-10
+    assert isbn.stored('306406152') == '9780306406157'
+    assert isbn.stored(306406152) == '9780306406157'
+
+
+def test_stored_keeps_digits_it_cannot_convert():
+    assert isbn.stored('978-0-306-40615-8') == '9780306406158'
+    assert isbn.stored('') is None
+    assert isbn.stored(None) is None
+
+
+def test_search_prefix():
+    assert isbn.search_prefix('0306') == '9780306'
+    assert isbn.search_prefix('978-0-306') == '9780306'
+
+
+def test_prefix_bounds():
+    low, high = isbn.prefix_bounds('9780306')
+    assert low == '9780306'
+    assert low <= '9780306406157' < high
+    assert not low <= '9780307000000' < high
+
+
+def test_search_prefix_rejects_what_cannot_be_an_isbn():
+    assert isbn.search_prefix('0306x') is None
+    assert isbn.search_prefix('1234567890') is None
+
+
+def test_prefix_bounds_of_all_nines_is_unbounded():
+    assert isbn.prefix_bounds('999') == ('999', None)
+
+
+def test_search_lists_isbn_matches_first_once(client):
+    from models import db
+    from models.models import Work
+
+    by_isbn = Work(title='Recipes', isbn='9780306406157')
+    by_title = Work(title='030640 field notes')
+    db.session.add_all([by_isbn, by_title])
+    db.session.commit()
+
+    books = client.get('/api/search?q=030640').get_json()['books']
+    assert [book['id'] for book in books] == [by_isbn.id, by_title.id]
+
+    books = client.get('/api/search?q=978-0-306-40615-7').get_json()['books']
+    assert [book['id'] for book in books] == [by_isbn.id]
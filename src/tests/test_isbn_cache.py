@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db
+from models.models import IsbnCache
+from services import isbn_cache, isbn_providers
+
+BOOK = {'title': 'The Left Hand of Darkness', 'authors': ['Ursula K. Le Guin'], 'publisher': 'Ace',
+        'description': '', 'cover_url': '', 'categories': ['Science fiction']}
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    """Stand-in for the providers: answers with .answer, and records the ISBNs asked"""
+    class Providers:
+        answer = isbn_providers.LookupResult(BOOK, ['google'], True, {'google': 12.0})
+        asked = []
+
+    def lookup(isbn, timeout, merge_budget):
+        Providers.asked.append(isbn)
+        return Providers.answer
+    monkeypatch.setattr(isbn_providers, 'lookup', lookup)
+    return Providers
+
+
+def test_invalid_isbn_costs_no_lookup(client, providers):
+    response = client.get('/api/isbn-lookup/9780441478120')
+    assert response.status_code == 400
+    assert providers.asked == []
+
+
+def test_answer_is_cached_for_both_forms(client, providers):
+    first = client.get('/api/isbn-lookup/9780441478125').get_json()
+    assert first['success'] and not first['cached']
+
+    again = client.get('/api/isbn-lookup/0-441-47812-3').get_json()
+    assert again['cached']
+    assert again['title'] == BOOK['title']
+    assert again['provider'] == 'google'
+    assert providers.asked == ['9780441478125']
+
+
+def test_not_found_is_cached_only_when_every_provider_answered(client, providers):
+    providers.answer = isbn_providers.LookupResult(None, [], False, {'google': None})
+    assert not client.get('/api/isbn-lookup/9780441478125').get_json()['success']
+    assert db.session.query(IsbnCache).count() == 0
+
+    providers.answer = isbn_providers.LookupResult(None, [], True, {'google': 3.0})
+    client.get('/api/isbn-lookup/9780441478125')
+    response = client.get('/api/isbn-lookup/9780441478125').get_json()
+    assert response == {'success': False, 'error': 'Book not found', 'cached': True}
+    assert len(providers.asked) == 2
+
+
+def test_expired_entries_are_looked_up_again(app):
+    isbn_cache.store('9780441478125', BOOK, 'google')
+    isbn_cache.store('9780306406157', None)
+    assert isbn_cache.get_cached('9780441478125')['title'] == BOOK['title']
+
+    for entry in db.session.query(IsbnCache):
+        entry.fetched_at = datetime.utcnow() - timedelta(seconds=app.config['ISBN_CACHE_NEGATIVE_TTL'] + 1)
+    db.session.commit()
+    assert isbn_cache.get_cached('9780441478125') is not None
+    assert isbn_cache.get_cached('9780306406157') is None
+
+
+def test_get_many_answers_in_the_forms_asked(app):
+    isbn_cache.store_many([('9780441478125', BOOK, 'google'), ('9780306406157', None, None)])
+    results = isbn_cache.get_many(['0441478123', '9780306406157', '9781635575637'])
+    assert set(results) == {'0441478123', '9780306406157'}
+    assert results['0441478123']['success']
+    assert not results['9780306406157']['success']
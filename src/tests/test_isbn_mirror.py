@@ -0,0 +1,81 @@
+import gzip
+import json
+
+import pytest
+
+from services import isbn_mirror, isbn_providers
+
+
+def line(kind, key, record):
+    return f'{kind}\t{key}\t1\t2024-01-01T00:00:00\t{json.dumps(record)}\n'
+
+
+DUMP = [
+    line('/type/edition', '/books/OL1M', {
+        'title': 'The Left Hand of Darkness', 'isbn_10': ['0441478123'], 'publishers': ['Ace'],
+        'covers': [8231856], 'works': [{'key': '/works/OL59863W'}]
+    }),
+    # No ISBN: not kept, and neither is its work
+    line('/type/edition', '/books/OL2M', {'title': 'Untitled', 'works': [{'key': '/works/OL3W'}]}),
+    line('/type/work', '/works/OL59863W', {
+        'description': {'type': '/type/text', 'value': 'Genly Ai on Gethen.'},
+        'subjects': ['Science fiction'], 'authors': [{'author': {'key': '/authors/OL31093A'}}]
+    }),
+    line('/type/work', '/works/OL3W', {'description': 'Nothing to see.'}),
+    line('/type/author', '/authors/OL31093A', {'name': 'Ursula K. Le Guin'}),
+    line('/type/author', '/authors/OL4A', {'name': 'Nobody'}),
+]
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    """A mirror built from a small gzipped dump, in use by the app's providers"""
+    dump = tmp_path / 'ol_dump.txt.gz'
+    with gzip.open(dump, 'wt', encoding='utf-8') as file:
+        file.writelines(DUMP)
+    path = str(tmp_path / 'mirror.sqlite')
+    report = isbn_mirror.build([str(dump)], path, log=lambda message: None)
+    monkeypatch.setattr(isbn_mirror.mirror, 'path', path)
+    return report
+
+
+def test_build_keeps_only_what_an_isbn_needs(mirror):
+    assert (mirror.lines, mirror.editions, mirror.works, mirror.authors) == (6, 1, 1, 1)
+
+
+def test_lookup_fills_in_from_the_work(mirror):
+    data = isbn_mirror.mirror.lookup('978-0-441-47812-5')
+    assert data == {
+        'title': 'The Left Hand of Darkness',
+        'authors': ['Ursula K. Le Guin'],
+        'publisher': 'Ace',
+        'description': 'Genly Ai on Gethen.',
+        'cover_url': 'https://covers.openlibrary.org/b/id/8231856-M.jpg',
+        'categories': ['Science fiction']
+    }
+    # The ISBN-10 it was listed under finds it too
+    assert isbn_mirror.mirror.lookup('0441478123') == data
+
+
+def test_lookup_misses(mirror):
+    assert isbn_mirror.mirror.lookup('9780306406157') is None
+    assert isbn_mirror.mirror.lookup('not an isbn') is None
+
+
+def test_without_a_mirror_nothing_is_found(monkeypatch):
+    monkeypatch.setattr(isbn_mirror.mirror, 'path', '')
+    assert not isbn_mirror.mirror.available
+    assert isbn_mirror.mirror.lookup('0441478123') is None
+
+
+def test_providers_answer_from_the_mirror_alone(app, mirror, monkeypatch):
+    class Offline(isbn_providers.Provider):
+        name = 'offline'
+
+        def lookup(self, isbn, timeout):
+            raise AssertionError('asked the network')
+
+    monkeypatch.setattr(isbn_providers, 'PROVIDERS', [Offline()])
+    result = isbn_providers.lookup('0441478123')
+    assert result.local and result.conclusive
+    assert result.data['title'] == 'The Left Hand of Darkness'
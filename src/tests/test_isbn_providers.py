@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from services import isbn_providers
+
+BOOK = {'title': 'Kindred', 'authors': ['Octavia E. Butler'], 'publisher': '', 'description': '',
+        'cover_url': '', 'categories': []}
+
+
+class Fake(isbn_providers.Provider):
+    """A provider that answers after a delay, or raises"""
+
+    def __init__(self, name, answer=None, delay=0, error=None):
+        super().__init__()
+        self.name = name
+        self.answer = answer
+        self.delay = delay
+        self.error = error
+        self.released = threading.Event()
+
+    def lookup(self, isbn, timeout):
+        self.released.wait(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.answer
+
+
+@pytest.fixture
+def providers(app, monkeypatch):
+    """Swap the online providers for fakes; the app has no offline mirror"""
+    def install(*fakes):
+        monkeypatch.setattr(isbn_providers, 'PROVIDERS', list(fakes))
+        return fakes
+    yield install
+    for fake in isbn_providers.PROVIDERS:
+        if isinstance(fake, Fake):
+            fake.released.set()
+
+
+def test_provider_must_implement_lookup():
+    with pytest.raises(TypeError):
+        isbn_providers.Provider()
+
+
+def test_first_answer_wins_without_waiting_for_slow_providers(providers):
+    providers(Fake('fast', BOOK), Fake('slow', dict(BOOK, publisher='Doubleday'), delay=5))
+
+    start = time.perf_counter()
+    result = isbn_providers.lookup('9780807083697', timeout=5, merge_budget=0.05)
+    assert time.perf_counter() - start < 1
+    assert result.data == BOOK
+    assert result.providers == ['fast']
+    assert result.timings['slow'] is None
+    # The slow provider never answered, so a miss here wouldn't have been conclusive
+    assert not result.conclusive
+
+
+def test_answers_within_the_budget_fill_blanks_in_preference_order(providers):
+    providers(
+        Fake('preferred', dict(BOOK, description='A time-travel novel.'), delay=0.05),
+        Fake('other', dict(BOOK, title='Kindred: A Novel', publisher='Beacon Press'))
+    )
+    result = isbn_providers.lookup('9780807083697', timeout=5, merge_budget=1)
+    assert result.data['title'] == 'Kindred'
+    assert result.data['description'] == 'A time-travel novel.'
+    assert result.data['publisher'] == 'Beacon Press'
+    assert result.provider == 'preferred+other'
+
+
+def test_a_broken_provider_only_misses(providers):
+    providers(Fake('broken', error=KeyError('items')), Fake('working', BOOK))
+    result = isbn_providers.lookup('9780807083697', timeout=5, merge_budget=0)
+    assert result.data == BOOK
+    assert result.providers == ['working']
+
+
+def test_not_found_is_conclusive_only_when_everyone_answered(providers):
+    providers(Fake('a'), Fake('b'))
+    result = isbn_providers.lookup('9780807083697', timeout=5)
+    assert result.data is None
+    assert result.conclusive
+
+    providers(Fake('a'), Fake('broken', error=RuntimeError('bad gateway')))
+    result = isbn_providers.lookup('9780807083697', timeout=5)
+    assert result.data is None
+    assert not result.conclusive
+
+
+def test_providers_slower_than_the_timeout_are_abandoned(providers):
+    providers(Fake('stuck', BOOK, delay=5))
+    start = time.perf_counter()
+    result = isbn_providers.lookup('9780807083697', timeout=0.1)
+    assert time.perf_counter() - start < 1
+    assert result.data is None
+    assert not result.conclusive
+
+
+def test_open_library_batch_normalizes_each_book(monkeypatch):
+    class Response:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {'ISBN:9780807083697': {
+                'title': 'Kindred', 'authors': [{'name': 'Octavia E. Butler'}],
+                'publishers': [{'name': 'Beacon Press'}], 'subjects': [{'name': 'Time travel'}],
+                'cover': {'medium': 'https://covers.openlibrary.org/b/id/1-M.jpg'}
+            }}
+
+    class Session:
+        def get(self, url, params, timeout):
+            assert params['bibkeys'] == 'ISBN:9780807083697,ISBN:9780306406157'
+            return Response()
+
+    provider = isbn_providers.OpenLibrary()
+    monkeypatch.setattr(provider, '_session', Session())
+    results = provider.lookup_many(['9780807083697', '9780306406157'], timeout=5)
+    assert list(results) == ['9780807083697']
+    assert results['9780807083697']['publisher'] == 'Beacon Press'
+    assert results['9780807083697']['categories'] == ['Time travel']
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db
+from models.models import Job, Work, Tag
+from services import jobs
+
+
+@pytest.fixture
+def work(app):
+    """A work saved with an ISBN and nothing else, which queues its enrichment"""
+    work = Work(title='Piranesi', isbn='9781635575637')
+    db.session.add(work)
+    db.session.commit()
+    return work
+
+
+def only_job():
+    return db.session.query(Job).one()
+
+
+def test_new_work_missing_details_is_queued(work):
+    job = only_job()
+    assert (job.kind, job.work_id, job.status, job.attempts) == (jobs.ENRICH, work.id, 'queued', 0)
+
+
+def test_complete_work_is_not_queued(app):
+    work = Work(title='Piranesi', isbn='9781635575637', description='A house of endless halls.',
+                publisher='Bloomsbury', cover_url='https://example.com/piranesi.jpg')
+    work.tags.append(Tag(label='Fantasy', type='genre'))
+    db.session.add(work)
+    db.session.commit()
+    assert db.session.query(Job).count() == 0
+
+
+def test_claim_leases_the_job(work, app):
+    job = jobs.claim()
+    assert (job.status, job.attempts) == ('running', 1)
+    assert job.run_after > datetime.utcnow() + timedelta(seconds=app.config['JOB_LEASE_SECONDS'] - 5)
+
+    # Nobody else takes it while the lease lasts
+    assert jobs.claim() is None
+
+
+def test_lapsed_lease_is_claimed_again(work):
+    job = jobs.claim()
+    job.run_after = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    again = jobs.claim()
+    assert again.id == job.id
+    assert again.attempts == 2
+
+
+def test_heartbeat_extends_the_lease(work):
+    job = jobs.claim()
+    job.run_after = datetime.utcnow() + timedelta(seconds=1)
+    db.session.commit()
+
+    jobs.heartbeat(job.id)
+    db.session.refresh(job)
+    assert job.run_after > datetime.utcnow() + timedelta(seconds=60)
+
+
+def test_finished_job_records_its_result(work, monkeypatch):
+    monkeypatch.setitem(jobs.HANDLERS, jobs.ENRICH, lambda job_id, work_id, payload: ['description'])
+    assert jobs.run_next()
+    job = only_job()
+    assert job.status == 'done'
+    assert jobs.describe(job)['filled'] == ['description']
+    assert not jobs.run_next()
+
+
+def test_unanswered_job_backs_off_then_fails(work, app, monkeypatch):
+    def unanswered(job_id, work_id, payload):
+        raise jobs.RetryLater('No ISBN provider answered')
+    monkeypatch.setitem(jobs.HANDLERS, jobs.ENRICH, unanswered)
+    app.config['JOB_MAX_ATTEMPTS'] = 2
+
+    assert jobs.run_next()
+    job = only_job()
+    assert (job.status, job.attempts, job.error) == ('queued', 1, 'No ISBN provider answered')
+    assert job.run_after > datetime.utcnow()
+    assert not jobs.run_next()
+
+    job.run_after = datetime.utcnow()
+    db.session.commit()
+    assert jobs.run_next()
+    db.session.refresh(job)
+    assert (job.status, job.attempts) == ('failed', 2)
+    assert job.finished_at is not None
+
+
+def test_lapsed_import_is_not_run_twice(app, monkeypatch):
+    ran = []
+    monkeypatch.setitem(jobs.HANDLERS, jobs.IMPORT, lambda *args: ran.append(args))
+    job = jobs.enqueue_import([{'isbn': '9781635575637'}])
+
+    # The process running it died after claiming it
+    jobs.claim()
+    job.run_after = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert jobs.run_next()
+    db.session.refresh(job)
+    assert (job.status, job.error) == ('failed', 'Stopped before finishing')
+    assert ran == []
+
+
+def test_enrich_fills_only_empty_fields(work, monkeypatch):
+    work.publisher = 'Bloomsbury'
+    db.session.commit()
+    monkeypatch.setattr(jobs, '_lookup', lambda isbn, missing: {
+        'description': 'A house of endless halls.', 'publisher': 'Someone else', 'categories': ['Fantasy']
+    })
+
+    assert sorted(jobs.enrich(work.id)) == ['description', 'tags']
+    db.session.refresh(work)
+    assert work.publisher == 'Bloomsbury'
+    assert [tag.label for tag in work.tags] == ['Fantasy']
+
+
+def test_deleting_a_work_deletes_its_jobs(work):
+    jobs.enqueue_import([])
+    db.session.delete(work)
+    db.session.commit()
+    assert [job.kind for job in db.session.query(Job)] == [jobs.IMPORT]
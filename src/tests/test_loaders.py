@@ -0,0 +1,61 @@
+import pytest
+
+from benchmark.generator import generate
+from models import db
+from models.models import Work, Copy, Author, Tag, Location, User
+from services import loaders
+from services.loaders import LazyLoadError
+
+
+def quiet(*args):
+    pass
+
+
+@pytest.fixture
+def library(app, admin):
+    """A small library, one of whose copies the admin owns and another borrows, with strict loading on"""
+    generate(copies=30, seed=3, depth=3, fanout=2, log=quiet)
+    copies = db.session.query(Copy).order_by(Copy.id).limit(2).all()
+    copies[0].owner_id = admin.id
+    copies[1].lended_to = admin.id
+    db.session.commit()
+    app.config['STRICT_LOADING'] = True
+    return app
+
+
+def first(model, *where):
+    return db.session.query(model.id).filter(*where).order_by(model.id).limit(1).scalar()
+
+
+PAGES = [
+    '/', '/search?q=the', '/books/', '/books/works', '/books/copies', '/books/add',
+    '/books/{work}', '/books/{work}/copies', '/books/copies/{copy}', '/books/{work}/edit',
+    '/books/{work}/copies/{copy}/edit', '/books/copies/add/{work}',
+    '/authors/', '/authors/{author}', '/authors/{author}/edit', '/authors/add',
+    '/tags/', '/tags/{tag}', '/tags/{child_tag}/edit', '/tags/add',
+    '/locations/', '/locations/{location}', '/locations/{child_location}/edit', '/locations/add',
+    '/users/', '/users/{user}/edit', '/users/add',
+    '/api/search?q=the', '/api/jobs', '/api/typeahead/authors?q=a',
+]
+
+
+@pytest.mark.parametrize('page', PAGES)
+def test_page_plans_its_loads(library, client, page):
+    ids = {
+        'work': first(Work), 'copy': first(Copy), 'author': first(Author), 'tag': first(Tag),
+        'child_tag': first(Tag, Tag.parent_id.isnot(None)), 'location': first(Location),
+        'child_location': first(Location, Location.parent_id.isnot(None)), 'user': first(User),
+    }
+    response = client.get(page.format(**ids))
+    assert response.status_code == 200
+
+
+def test_unplanned_lazy_load_raises(library):
+    location = db.session.query(Location).filter(Location.parent_id.isnot(None)).first()
+    with pytest.raises(LazyLoadError):
+        location.parent
+
+
+def test_planned_load_does_not_raise(library):
+    location = db.session.query(Location).options(*loaders.LOCATION_EDIT).filter(Location.parent_id.isnot(None)).first()
+    assert location.parent.id == location.parent_id
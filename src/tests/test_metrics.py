@@ -0,0 +1,47 @@
+import re
+
+import pytest
+
+from services import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, 'registry', registry)
+    return registry
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram((1, 5, 10))
+    for value in (0.5, 3, 3, 20):
+        histogram.observe(value)
+    assert histogram.counts == [1, 3, 3]
+    assert (histogram.count, histogram.sum) == (4, 26.5)
+
+
+def test_registry_renders_prometheus_text(registry):
+    registry.observe('books.books', {'total': 0.02, 'queries': 3, 'sql': 0.004, 'upstream': 0.0, 'render': 0.01})
+    text = registry.render()
+    assert '# TYPE bookshelf_request_seconds histogram' in text
+    assert 'bookshelf_request_queries_bucket{endpoint="books.books",le="2"} 0' in text
+    assert 'bookshelf_request_queries_bucket{endpoint="books.books",le="5"} 1' in text
+    assert 'bookshelf_request_queries_bucket{endpoint="books.books",le="+Inf"} 1' in text
+    assert 'bookshelf_request_queries_sum{endpoint="books.books"} 3' in text
+
+
+def test_responses_carry_server_timing(client, registry):
+    response = client.get('/books/')
+    timing = response.headers['Server-Timing']
+    queries = int(re.search(r'db;desc="(\d+) queries"', timing).group(1))
+    assert queries > 0
+    assert re.search(r'render;dur=[\d.]+', timing)
+    assert re.search(r'app;dur=[\d.]+', timing)
+
+
+def test_metrics_endpoint_counts_requests_but_not_itself(client, registry):
+    client.get('/books/')
+    client.get('/books/')
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'bookshelf_request_seconds_count{endpoint="books.books"} 2' in text
+    assert 'endpoint="metrics"' not in client.get('/metrics').get_data(as_text=True)
@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import nulls_last
+
+from models import db, Location
+from services.pagination import paginate, encode_cursor, decode_cursor
+
+
+@pytest.fixture
+def locations(app):
+    """Eleven locations whose names repeat and whose descriptions are sometimes missing"""
+    names = ['Hall', 'attic', 'Den', 'Hall', 'Study', 'Den', 'Hall', 'Loft', 'Attic', 'Study', 'Den']
+    for i, name in enumerate(names):
+        description = None if i % 3 == 0 else f'shelf {i % 4}'
+        db.session.add(Location(name=name, description=description, type='room'))
+    db.session.commit()
+    return Location.query.all()
+
+
+def walk(keys, descending=False, per_page=3):
+    """The ids of every page going forwards, then going backwards from the last page"""
+    forwards, pages = [], []
+    page = paginate(Location.query, keys, descending, per_page=per_page)
+    while True:
+        pages.append(page)
+        forwards.extend(location.id for location in page)
+        if not page.next_cursor:
+            break
+        page = paginate(Location.query, keys, descending, after=page.next_cursor, per_page=per_page)
+
+    backwards = [location.id for location in pages[-1]]
+    page = pages[-1]
+    while page.prev_cursor:
+        page = paginate(Location.query, keys, descending, before=page.prev_cursor, per_page=per_page)
+        backwards = [location.id for location in page] + backwards
+    return forwards, backwards, pages
+
+
+def test_cursor_round_trip():
+    values = ['Hall', 3, None, datetime(2024, 5, 1, 12, 30)]
+    assert decode_cursor(encode_cursor(values), 4) == values
+
+
+@pytest.mark.parametrize('cursor', ['', None, 'not base64!', encode_cursor(['Hall'])])
+def test_malformed_cursor_is_ignored(cursor):
+    assert decode_cursor(cursor, 2) is None
+
+
+def test_pages_follow_the_order(locations):
+    expected = [location.id for location in sorted(locations, key=lambda location: (location.name, location.id))]
+    forwards, backwards, pages = walk((Location.name, Location.id))
+    assert forwards == expected
+    assert backwards == expected
+    assert [len(page) for page in pages] == [3, 3, 3, 2]
+    assert pages[0].prev_cursor is None
+    assert pages[-1].next_cursor is None
+
+
+def test_descending_pages(locations):
+    expected = [location.id for location in sorted(locations, key=lambda location: (location.name, location.id), reverse=True)]
+    forwards, backwards, _ = walk((Location.name, Location.id), descending=True)
+    assert forwards == expected
+    assert backwards == expected
+
+
+def test_null_keys_sort_last(locations):
+    expected = [location.id for location in sorted(
+        locations, key=lambda location: (location.description is None, location.description or '', location.id)
+    )]
+    forwards, backwards, _ = walk((nulls_last(Location.description), Location.id), per_page=2)
+    assert forwards == expected
+    assert backwards == expected
+
+
+def test_descending_is_the_reverse_with_nulls(locations):
+    # NULLs sort after every value, so walking the other way meets them first
+    expected = [location.id for location in sorted(
+        locations, key=lambda location: (location.description is None, location.description or '', location.id),
+        reverse=True
+    )]
+    forwards, backwards, _ = walk((nulls_last(Location.description), Location.id), descending=True, per_page=2)
+    assert forwards == expected
+    assert backwards == expected
+
+
+def test_one_page_has_no_cursors(locations):
+    page = paginate(Location.query, (Location.name, Location.id), per_page=20)
+    assert len(page) == len(locations)
+    assert page.next_cursor is None
+    assert page.prev_cursor is None
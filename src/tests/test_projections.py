@@ -0,0 +1,27 @@
+from models import db
+from models.models import Work, Author, Tag, Location, Copy
+from services import projections
+
+
+def test_search_cards_carry_only_the_start_of_the_description(app):
+    work = Work(title='Middlemarch', isbn='9780141439549', description='A study of provincial life. ' * 200)
+    work.authors.append(Author(primary_name='George Eliot'))
+    work.tags.append(Tag(label='Classics', type='genre'))
+    db.session.add(Copy(work=work, location=Location(name='Hall', type='room')))
+    db.session.commit()
+
+    [card] = projections.work_results(db.session.connection(), [work.id])
+    assert 'description' not in card
+    assert card['summary'] == work.description[:300]
+    assert card['authors'] == [{'id': work.authors[0].id, 'name': 'George Eliot'}]
+    assert card['tags'] == [{'id': work.tags[0].id, 'label': 'Classics'}]
+    assert card['location']['name'] == 'Hall'
+
+
+def test_search_cards_keep_the_order_asked_for(app):
+    works = [Work(title=title) for title in ('A', 'B', 'C')]
+    db.session.add_all(works)
+    db.session.commit()
+
+    ids = [works[2].id, works[0].id, works[1].id, 999]
+    assert [card['id'] for card in projections.work_results(db.session.connection(), ids)] == ids[:3]
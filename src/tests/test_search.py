@@ -0,0 +1,73 @@
+import pytest
+
+from models import db
+from models.models import Work, Author, AuthorName, Tag
+from services import search
+
+
+@pytest.fixture
+def works(app):
+    le_guin = Author(primary_name='Ursula K. Le Guin', alt_names=[AuthorName(alt_name='Ursula Kroeber')])
+    fantasy = Tag(label='Fantasy', type='genre')
+    works = {
+        'earthsea': Work(title='A Wizard of Earthsea', authors=[le_guin], tags=[fantasy]),
+        'dispossessed': Work(title='The Dispossessed', authors=[le_guin], description='An ambiguous utopia.'),
+        'wizard': Work(title='The Wonderful Wizard of Oz', publisher='George M. Hill'),
+        'café': Work(title='Café Society'),
+    }
+    db.session.add_all(works.values())
+    db.session.commit()
+    return {name: work.id for name, work in works.items()}
+
+
+def test_every_word_must_match(works):
+    assert search.search('wizard earthsea') == [works['earthsea']]
+    assert sorted(search.search('wizard')) == sorted([works['earthsea'], works['wizard']])
+
+
+def test_words_match_as_prefixes(works):
+    assert search.search('dispos') == [works['dispossessed']]
+
+
+def test_authors_alternate_names_tags_and_descriptions_are_searched(works):
+    assert sorted(search.search('le guin')) == sorted([works['earthsea'], works['dispossessed']])
+    assert sorted(search.search('kroeber')) == sorted([works['earthsea'], works['dispossessed']])
+    assert search.search('fantasy') == [works['earthsea']]
+    assert search.search('utopia') == [works['dispossessed']]
+
+
+def test_title_matches_rank_first(works):
+    db.session.add(Work(title='Essays', description='On the wizard archetype.'))
+    db.session.commit()
+    assert search.search('wizard')[-1] not in (works['earthsea'], works['wizard'])
+
+
+def test_accents_are_ignored(works):
+    assert search.search('cafe') == [works['café']]
+
+
+def test_index_follows_edits_and_deletes(works):
+    author = db.session.query(Author).filter_by(primary_name='Ursula K. Le Guin').one()
+    author.primary_name = 'Ursula K. LeGuin'
+    db.session.commit()
+    assert search.search('guin') == []
+    assert len(search.search('leguin')) == 2
+
+    db.session.delete(db.session.get(Work, works['wizard']))
+    db.session.delete(db.session.query(Tag).one())
+    db.session.commit()
+    assert search.search('oz') == []
+    assert search.search('fantasy') == []
+
+
+def test_rebuild_restores_a_lost_index(works):
+    db.session.execute(db.text('DELETE FROM works_fts'))
+    db.session.commit()
+    assert search.search('earthsea') == []
+
+    assert search.rebuild() == len(works)
+    assert search.search('earthsea') == [works['earthsea']]
+
+
+def test_punctuation_only_finds_nothing(works):
+    assert search.search('!?') == []
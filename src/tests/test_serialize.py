@@ -0,0 +1,59 @@
+import gzip
+import json
+
+import pytest
+
+from models import db
+from models.models import Work
+from services import serialize
+
+
+@pytest.mark.parametrize('count', [0, 1, serialize.CHUNK_RECORDS, serialize.CHUNK_RECORDS * 2 + 5])
+def test_array_chunks_make_one_json_object(count):
+    records = [{'id': i, 'title': f'Wörk {i}'} for i in range(count)]
+    body = b''.join(serialize._array_chunks(iter(records), 'books'))
+    assert json.loads(body) == {'books': records}
+
+
+def test_ndjson_has_a_record_per_line():
+    records = [{'id': i} for i in range(serialize.CHUNK_RECORDS + 1)]
+    body = b''.join(serialize._ndjson_chunks(iter(records)))
+    assert [json.loads(line) for line in body.splitlines()] == records
+    assert body.endswith(b'\n')
+
+
+def test_gzipped_chunks_are_one_stream():
+    chunks = [b'{"a":', b'1}', b'']
+    assert gzip.decompress(b''.join(serialize.gzipped(iter(chunks)))) == b'{"a":1}'
+
+
+@pytest.fixture
+def rivers(app):
+    db.session.add_all(Work(title=f'River {i}') for i in range(250))
+    db.session.commit()
+
+
+def search(client, **headers):
+    return client.get('/api/search?q=river&limit=300', headers=headers)
+
+
+def test_search_streams_json_or_ndjson(client, rivers):
+    as_json = search(client, Accept='application/json')
+    assert as_json.mimetype == 'application/json'
+    books = as_json.get_json()['books']
+    # A JSON array is capped lower than a stream
+    assert len(books) == 200
+
+    as_ndjson = search(client, Accept=serialize.NDJSON)
+    assert as_ndjson.mimetype == serialize.NDJSON
+    lines = [json.loads(line) for line in as_ndjson.data.splitlines()]
+    assert len(lines) == 250
+    assert {book['id'] for book in books} <= {line['id'] for line in lines}
+    assert set(lines[0]) == set(books[0])
+
+
+def test_search_is_gzipped_when_accepted(client, rivers):
+    response = search(client, Accept=serialize.NDJSON, **{'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(gzip.decompress(response.data).splitlines()) == 250
+    assert 'Accept-Encoding' in response.headers['Vary']
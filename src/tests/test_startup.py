@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+from jinja2 import FileSystemBytecodeCache
+
+from app import create_app
+from conftest import TestConfig
+from models import db
+from services import warmup
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_compiled_templates_are_kept_on_disk(tmp_path):
+    cache = tmp_path / 'templates'
+    app = create_app(type('Config', (TestConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "bookshelf.db"}',
+        'COVER_DIR': str(tmp_path / 'covers'),
+        'TEMPLATE_CACHE_DIR': str(cache),
+    }))
+    assert isinstance(app.jinja_env.bytecode_cache, FileSystemBytecodeCache)
+
+    count = warmup.compile_templates(app)
+    assert count == len(app.jinja_env.list_templates(extensions=('html',))) > 0
+    assert len(os.listdir(cache)) == count
+    with app.app_context():
+        db.engine.dispose()
+
+
+def test_no_cache_without_a_directory(app):
+    assert app.jinja_env.bytecode_cache is None
+
+
+def test_heavy_modules_are_imported_on_first_use():
+    # A fresh interpreter, since this one has imported them already
+    script = 'import sys, app; print(" ".join(sorted(m for m in ("requests", "rapidfuzz") if m in sys.modules)))'
+    result = subprocess.run([sys.executable, '-c', script], cwd=SRC, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
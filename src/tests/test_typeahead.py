@@ -0,0 +1,64 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+from wtforms import Form
+
+from forms.fields import TypeaheadSelectField, TypeaheadSelectMultipleField
+from models import db
+from models.models import Author, AuthorName, Location
+from services import typeahead
+
+
+@pytest.fixture
+def authors(app):
+    authors = {name: Author(primary_name=name) for name in ('Mann, Thomas', 'mann, Heinrich', 'Mansfield, Katherine', 'Zola')}
+    authors['Zola'].alt_names.append(AuthorName(alt_name='Manet-Zola'))
+    db.session.add_all(authors.values())
+    db.session.commit()
+    return {name: author.id for name, author in authors.items()}
+
+
+def test_suggest_matches_prefixes_ignoring_case(authors):
+    assert [label for _, label in typeahead.suggest('authors', 'MANN')] == ['mann, Heinrich', 'Mann, Thomas']
+
+
+def test_suggest_fills_up_with_alternate_names(authors):
+    assert [label for _, label in typeahead.suggest('authors', 'man')] == [
+        'mann, Heinrich', 'Mann, Thomas', 'Mansfield, Katherine', 'Zola'
+    ]
+    assert [label for _, label in typeahead.suggest('authors', 'man', limit=2)] == ['mann, Heinrich', 'Mann, Thomas']
+
+
+def test_labels_of_existing_ids(authors):
+    assert typeahead.labels('authors', [authors['Zola'], None, 999]) == {authors['Zola']: 'Zola'}
+
+
+def test_endpoint(client, authors):
+    response = client.get('/api/typeahead/authors?q=mans').get_json()
+    assert response['results'] == [{'id': authors['Mansfield, Katherine'], 'label': 'Mansfield, Katherine'}]
+    assert client.get('/api/typeahead/planets?q=m').status_code == 404
+
+
+class CopyForm(Form):
+    location = TypeaheadSelectField('Location', source='locations')
+    authors = TypeaheadSelectMultipleField('Authors', source='authors')
+
+
+def test_fields_render_only_the_selected_rows(app, authors):
+    location = Location(name='Hall', type='room')
+    db.session.add_all([location, Location(name='Attic', type='room')])
+    db.session.commit()
+
+    form = CopyForm(MultiDict([('location', str(location.id)), ('authors', str(authors['Zola']))]))
+    with app.test_request_context():
+        html = form.location() + form.authors()
+    assert 'Hall' in html and 'Attic' not in html
+    assert 'Zola' in html and 'Mann' not in html
+    assert 'data-typeahead="/api/typeahead/locations"' in html
+    assert form.validate()
+    assert form.authors.data == [authors['Zola']]
+
+
+def test_ids_that_do_not_exist_are_refused(app, authors):
+    form = CopyForm(MultiDict([('location', '999'), ('authors', str(authors['Zola'])), ('authors', '998')]))
+    assert not form.validate()
+    assert set(form.errors) == {'location', 'authors'}
@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from models import db
+from models.models import User, UserRole
+from services.user_cache import UserCache
+
+
+@pytest.fixture
+def users_selects(app):
+    """A list growing by one for every query of the users table"""
+    selects = []
+
+    def executed(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'FROM users' in statement:
+            selects.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', executed)
+    yield selects
+    event.remove(db.engine, 'before_cursor_execute', executed)
+
+
+def add_user(name, role=UserRole.VIEWER):
+    user = User(name=name, join_date=datetime(2024, 1, 1), permissions=role.value)
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def test_hit_skips_the_database(users_selects):
+    cache = UserCache()
+    user_id = add_user('ada', UserRole.EDITOR)
+    users_selects.clear()
+
+    user = cache.get(str(user_id))
+    assert (user.id, user.name, user.is_editor, user.is_admin) == (user_id, 'ada', True, False)
+    assert cache.get(user_id) is user
+    assert len(users_selects) == 1
+
+
+def test_unknown_and_malformed_ids_are_none(app):
+    cache = UserCache()
+    assert cache.get('999') is None
+    assert cache.get('not a number') is None
+    assert cache.get(None) is None
+
+
+def test_commits_drop_changed_and_deleted_users(app):
+    from services.user_cache import users
+    user_id = add_user('ada')
+    assert users.get(user_id).name == 'ada'
+
+    db.session.get(User, user_id).name = 'ada lovelace'
+    db.session.commit()
+    assert users.get(user_id).name == 'ada lovelace'
+
+    db.session.delete(db.session.get(User, user_id))
+    db.session.commit()
+    assert users.get(user_id) is None
+
+
+def test_entries_expire(app, users_selects):
+    cache = UserCache(ttl=0)
+    user_id = add_user('ada')
+    users_selects.clear()
+    cache.get(user_id)
+    cache.get(user_id)
+    assert len(users_selects) == 2
+
+
+def test_least_recently_used_is_evicted(app, users_selects):
+    cache = UserCache(maxsize=2)
+    ids = [add_user(name) for name in ('ada', 'bo', 'cy')]
+    cache.get(ids[0])
+    cache.get(ids[1])
+    cache.get(ids[0])
+    cache.get(ids[2])
+    users_selects.clear()
+
+    cache.get(ids[0])
+    assert len(users_selects) == 0
+    cache.get(ids[1])
+    assert len(users_selects) == 1
+
+
+def test_logged_in_requests_reuse_the_cached_user(client, users_selects):
+    client.get('/books/')
+    users_selects.clear()
+    client.get('/books/')
+    assert users_selects == []
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from models import db
+from models.models import Work, Copy, Location, IsbnCache
+from services import isbn_cache
+
+
+def revalidate(client, path, response):
+    """GET path again as a browser holding response would"""
+    return client.get(path, headers={'If-None-Match': response.headers['ETag']})
+
+
+def test_unchanged_page_is_not_modified(client):
+    first = client.get('/books/')
+    assert first.status_code == 200
+    assert revalidate(client, '/books/', first).status_code == 304
+
+
+def test_owning_a_copy_changes_the_user_list(client, admin):
+    first = client.get('/users/')
+    assert b'0 books' in first.data
+    assert revalidate(client, '/users/', first).status_code == 304
+
+    location = Location(name='Study', type='room')
+    db.session.add(Copy(work=Work(title='Dune'), location=location, owner_id=admin.id))
+    db.session.commit()
+
+    second = revalidate(client, '/users/', first)
+    assert second.status_code == 200
+    assert b'1 books' in second.data
+
+
+def test_renaming_the_current_user_changes_every_page(client, admin):
+    first = client.get('/books/')
+    assert b'admin' in first.data
+
+    admin.name = 'librarian'
+    db.session.commit()
+
+    second = revalidate(client, '/books/', first)
+    assert second.status_code == 200
+    assert b'librarian' in second.data
+
+
+def test_unwatched_writes_keep_pages_fresh(client):
+    first = client.get('/books/')
+    db.session.add(IsbnCache(isbn='9780306406157', found=False, fetched_at=datetime.utcnow()))
+    db.session.commit()
+    assert revalidate(client, '/books/', first).status_code == 304
+
+
+def test_search_api_is_tagged_per_representation(client):
+    json = client.get('/api/search?q=dune', headers={'Accept': 'application/json'})
+    ndjson = client.get('/api/search?q=dune', headers={'Accept': 'application/x-ndjson'})
+    assert json.headers['ETag'] != ndjson.headers['ETag']
+    assert 'Accept' in json.headers['Vary']
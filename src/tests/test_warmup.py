@@ -0,0 +1,19 @@
+from models import db
+from services import fuzzy_index, warmup
+
+
+def test_sqlite_takes_only_pre_ping_and_recycle(app):
+    assert set(app.config['SQLALCHEMY_ENGINE_OPTIONS']) == {'pool_pre_ping', 'pool_recycle'}
+    # The engine accepted them
+    with db.engine.connect():
+        pass
+
+
+def test_warm_up_loads_indexes_and_requests_pages(app):
+    app.config['WARMUP_PATHS'] = ['/', '/no-such-page']
+    logged = []
+    elapsed = warmup.warm_up(app, log=logged.append)
+    assert elapsed >= 0
+    assert fuzzy_index.authors._data is not None and fuzzy_index.tags._data is not None
+    assert logged[0] == 'Warm-up request to /no-such-page returned 404'
+    assert logged[-1].startswith('Warmed up in ')
@@ -0,0 +1,17 @@
+# wsgi.py: the production entry point, served by gunicorn with gunicorn.conf.py
+#   gunicorn -c gunicorn.conf.py
+from app import create_app
+from models import db
+from services import warmup
+
+app = create_app()
+
+# With the app preloaded, workers fork from this process: whatever is imported and
+# compiled here is shared by all of them, and a respawned worker starts with it
+warmup.preload_modules()
+warmup.compile_templates(app)
+
+# Connections opened while setting up must not be shared with the workers, so each
+# one opens its own
+with app.app_context():
+    db.engine.dispose()